@@ -0,0 +1,105 @@
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.rollups import SAFETY_FIELDS, SCORE_FIELDS, SENTIMENT_FIELDS
+
+# numpy se importa al agregar el primer bloque, no al arrancar
+if TYPE_CHECKING:
+    import numpy as np
+
+# Columnas numéricas: (sección del agregado, campo); el orden fija la posición en la matriz
+FLOAT_COLUMNS: List[Tuple[str, str]] = (
+    [("scores", field) for field in SCORE_FIELDS]
+    + [("sentiment", field) for field in SENTIMENT_FIELDS]
+    + [("content_safety", field) for field in SAFETY_FIELDS]
+)
+SCORE_SOURCES = list(SCORE_FIELDS.values())
+SAFETY_SOURCES = list(SAFETY_FIELDS.values())
+
+
+def _num(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def document_row(doc: dict) -> Tuple[str, List[float], list, Optional[str]]:
+    """Fecha, valores numéricos en el orden de FLOAT_COLUMNS, issues y frase clave principal"""
+    analysis = doc.get("analysis") or {}
+    metadata = doc.get("metadata") or {}
+    text_analytics = metadata.get("text_analytics") or {}
+    safety = metadata.get("safety") or {}
+    safety_categories = safety.get("categories", safety)
+    sentiment = (text_analytics.get("sentiment") or {}).get("scores") or {}
+    key_phrases = text_analytics.get("key_phrases")
+
+    values = [_num(analysis.get(source)) for source in SCORE_SOURCES]
+    values += [_num(sentiment.get(field)) for field in SENTIMENT_FIELDS]
+    values += [_num(safety_categories.get(source)) for source in SAFETY_SOURCES]
+    return doc["timestamp"][:10], values, analysis.get("issues") or [], key_phrases[0] if key_phrases else None
+
+
+class ColumnarAggregator:
+    """Agregación diaria en columnas NumPy: códigos de fecha y reducciones agrupadas con bincount"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.issue_totals: Dict[str, int] = {}
+        self.sums: Dict[str, "np.ndarray"] = {}
+        self.issues: Dict[str, Counter] = defaultdict(Counter)
+        self.categories: Dict[str, Counter] = defaultdict(Counter)
+
+    def add(self, docs: Iterable[dict]) -> "ColumnarAggregator":
+        """Incorpora un bloque de documentos (normalmente una página de Cosmos)"""
+        import numpy as np
+
+        dates, rows, issue_counts = [], [], []
+        for doc in docs:
+            try:
+                date, values, issues, key_phrase = document_row(doc)
+            except (KeyError, TypeError):
+                continue
+            dates.append(date)
+            rows.append(values)
+            issue_counts.append(len(issues))
+            if issues:
+                counter = self.issues[date]
+                for issue in issues:
+                    counter[f"{issue.get('type', 'unknown')}|{issue.get('severity', 'medium')}"] += 1
+            if key_phrase is not None:
+                self.categories[date][key_phrase] += 1
+        if not dates:
+            return self
+
+        unique_dates, codes = np.unique(np.asarray(dates), return_inverse=True)
+        values = np.asarray(rows, dtype=np.float64)
+        groups = len(unique_dates)
+        counts = np.bincount(codes, minlength=groups)
+        issue_totals = np.bincount(codes, weights=np.asarray(issue_counts, dtype=np.float64), minlength=groups)
+        sums = np.stack(
+            [np.bincount(codes, weights=values[:, column], minlength=groups) for column in range(values.shape[1])],
+            axis=1
+        )
+
+        for index, date in enumerate(unique_dates.tolist()):
+            self.counts[date] = self.counts.get(date, 0) + int(counts[index])
+            self.issue_totals[date] = self.issue_totals.get(date, 0) + int(issue_totals[index])
+            if date in self.sums:
+                self.sums[date] += sums[index]
+            else:
+                self.sums[date] = sums[index].copy()
+        return self
+
+    def rollups(self) -> Dict[str, Dict[str, Any]]:
+        """Resultado con el mismo formato que los agregados diarios de backend.rollups"""
+        result = {}
+        for date in sorted(self.counts):
+            rollup = {
+                "date": date,
+                "count": self.counts[date],
+                "issues_total": self.issue_totals[date],
+                "issues": dict(self.issues.get(date, {})),
+                "categories": dict(self.categories.get(date, {}))
+            }
+            for (section, field), value in zip(FLOAT_COLUMNS, self.sums[date].tolist()):
+                rollup.setdefault(section, {})[field] = value
+            result[date] = rollup
+        return result
@@ -0,0 +1,472 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.aggregation import FLOAT_COLUMNS, document_row
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_STORE_PATH = os.getenv(
+    "ANALYTICS_STORE_PATH", str(Path(tempfile.gettempdir()) / "prompt_guardian_analytics.db")
+)
+# Con Cosmos como almacenamiento principal, replica Analytics y RejectedPrompts en el almacén local
+ANALYTICS_MIRROR = os.getenv("ANALYTICS_MIRROR", "false").lower() == "true"
+
+# Columnas numéricas de la tabla plana, en el orden de FLOAT_COLUMNS (el de document_row)
+FACT_COLUMNS = [f"{section}_{field}" for section, field in FLOAT_COLUMNS]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS documents (
+    container TEXT NOT NULL,
+    id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (container, id)
+);
+CREATE TABLE IF NOT EXISTS analytics_facts (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    {", ".join(f"{column} REAL NOT NULL" for column in FACT_COLUMNS)},
+    issues_count INTEGER NOT NULL,
+    key_phrase TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_analytics_facts_date ON analytics_facts (date);
+CREATE TABLE IF NOT EXISTS analytics_issues (
+    analysis_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    severity TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_analytics_issues_date ON analytics_issues (date, type, severity);
+CREATE INDEX IF NOT EXISTS ix_analytics_issues_analysis ON analytics_issues (analysis_id);
+CREATE TABLE IF NOT EXISTS rejected_facts (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    status TEXT,
+    safety_analysis TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_rejected_facts_status ON rejected_facts (status, timestamp);
+"""
+
+MIRRORED_KEYS = ("analytics", "rejected")
+
+
+# ---------- Filas planas ----------
+def analytics_rows(doc: dict) -> Tuple[tuple, List[tuple]]:
+    """Fila de analytics_facts y filas de analytics_issues de un documento de auditoría"""
+    date, values, issues, key_phrase = document_row(doc)
+    fact = (doc["id"], doc["timestamp"], date, *values, len(issues), key_phrase)
+    issue_rows = [
+        (doc["id"], date, issue.get("type", "unknown"), issue.get("severity", "medium")) for issue in issues
+    ]
+    return fact, issue_rows
+
+
+def rejected_row(doc: dict) -> tuple:
+    return (doc["id"], doc["timestamp"], doc.get("status"),
+            json.dumps(doc.get("safety_analysis", {}), ensure_ascii=False, default=str))
+
+
+# ---------- Traducción del SQL de Cosmos ----------
+PATH = re.compile(r"\bc((?:\.\w+)+)")
+PARAMETER = re.compile(r"@(\w+)")
+
+
+def _json_path(match: re.Match) -> str:
+    return f"json_extract(body, '${match.group(1)}')"
+
+
+def translate_query(query: str) -> Tuple[str, str]:
+    """Traduce el subconjunto del SQL de Cosmos que usa la aplicación a SQLite sobre documents.
+
+    El contenedor va en el parámetro @_container. Devuelve la consulta y el modo de lectura:
+    "value" (SELECT VALUE), "object" (proyección de rutas) o "document".
+    Las proyecciones con objetos literales devuelven el documento completo, que es un superconjunto.
+    """
+    query = " ".join(query.split())
+    match = re.fullmatch(
+        r"SELECT (?:TOP (?P<top>@\w+|\d+) )?(?P<select>.+?) FROM c(?: WHERE (?P<where>.+?))?"
+        r"(?: ORDER BY (?P<order>.+))?",
+        query, re.IGNORECASE
+    )
+    if not match:
+        raise ValueError(f"Consulta no soportada por el almacén local: {query}")
+
+    select = match.group("select")
+    if select.upper().startswith("VALUE "):
+        mode = "value"
+        columns = PATH.sub(_json_path, select[6:]).replace("ARRAY_LENGTH(json_extract", "json_array_length(json_extract")
+    elif select == "*" or "{" in select:
+        mode, columns = "document", "body"
+    else:
+        paths = [p.strip() for p in select.split(",")]
+        if not all(PATH.fullmatch(p) for p in paths):
+            mode, columns = "document", "body"
+        else:
+            mode = "object"
+            columns = "json_object(" + ", ".join(
+                f"'{p.rsplit('.', 1)[1]}', {PATH.sub(_json_path, p)}" for p in paths
+            ) + ")"
+
+    sql = f"SELECT {columns} FROM documents WHERE container = @_container"
+    if match.group("where"):
+        sql += f" AND ({PATH.sub(_json_path, match.group('where'))})"
+    if match.group("order"):
+        sql += f" ORDER BY {PATH.sub(_json_path, match.group('order'))}"
+    if match.group("top"):
+        sql += f" LIMIT {match.group('top')}"
+    return PARAMETER.sub(r":\1", sql), mode
+
+
+# ---------- Almacén ----------
+class AnalyticsStore:
+    """Almacén analítico embebido (SQLite): documentos completos y copia plana e indexada para el dashboard.
+
+    Una sola conexión protegida por un lock; todas las operaciones corren en hilos con asyncio.to_thread.
+    """
+
+    def __init__(self, path: str = ANALYTICS_STORE_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {"mirrored": 0, "mirror_errors": 0, "queries": 0}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    async def run(self, func, *params):
+        """Ejecuta func(connection, *params) en un hilo con la conexión bloqueada"""
+        def locked():
+            with self._lock:
+                return func(self.connection, *params)
+        return await asyncio.to_thread(locked)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # ---------- Réplica plana ----------
+    @staticmethod
+    def write_mirror(connection: sqlite3.Connection, items: Iterable[Tuple[str, dict]]) -> int:
+        mirrored = 0
+        for key, doc in items:
+            if key == "analytics":
+                fact, issue_rows = analytics_rows(doc)
+                connection.execute(
+                    f"INSERT OR REPLACE INTO analytics_facts VALUES ({', '.join('?' * len(fact))})", fact
+                )
+                connection.execute("DELETE FROM analytics_issues WHERE analysis_id = ?", (doc["id"],))
+                connection.executemany("INSERT INTO analytics_issues VALUES (?, ?, ?, ?)", issue_rows)
+            elif key == "rejected":
+                connection.execute("INSERT OR REPLACE INTO rejected_facts VALUES (?, ?, ?, ?)", rejected_row(doc))
+            else:
+                continue
+            mirrored += 1
+        return mirrored
+
+    async def mirror(self, items: List[Tuple[str, dict]]) -> None:
+        """Replica documentos en las tablas planas; un fallo aquí nunca afecta a la escritura principal"""
+        def write(connection):
+            with connection:
+                return self.write_mirror(connection, items)
+        try:
+            self.stats["mirrored"] += await self.run(write)
+        except Exception as e:
+            self.stats["mirror_errors"] += 1
+            logger.warning(f"Error replicando {len(items)} documentos en el almacén analítico: {str(e)}")
+
+    # ---------- Consultas del dashboard ----------
+    async def daily_rollups(self, days: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Agregados diarios con GROUP BY, en el mismo formato que backend.rollups"""
+        start = (datetime.utcnow() - timedelta(days=days)).date().isoformat() if days else ""
+
+        def query(connection):
+            sums = ", ".join(f"SUM({column})" for column in FACT_COLUMNS)
+            totals = connection.execute(
+                f"SELECT date, COUNT(*), SUM(issues_count), {sums} FROM analytics_facts "
+                "WHERE date >= ? GROUP BY date ORDER BY date", (start,)
+            ).fetchall()
+            issues = connection.execute(
+                "SELECT date, type, severity, COUNT(*) FROM analytics_issues "
+                "WHERE date >= ? GROUP BY date, type, severity", (start,)
+            ).fetchall()
+            categories = connection.execute(
+                "SELECT date, key_phrase, COUNT(*) FROM analytics_facts "
+                "WHERE date >= ? AND key_phrase IS NOT NULL GROUP BY date, key_phrase", (start,)
+            ).fetchall()
+            return totals, issues, categories
+
+        totals, issues, categories = await self.run(query)
+        self.stats["queries"] += 1
+        issue_counts: Dict[str, Counter] = defaultdict(Counter)
+        for date, issue_type, severity, count in issues:
+            issue_counts[date][f"{issue_type}|{severity}"] = count
+        category_counts: Dict[str, Counter] = defaultdict(Counter)
+        for date, key_phrase, count in categories:
+            category_counts[date][key_phrase] = count
+
+        result = {}
+        for date, count, issues_total, *values in totals:
+            rollup = {
+                "date": date,
+                "count": count,
+                "issues_total": issues_total,
+                "issues": dict(issue_counts.get(date, {})),
+                "categories": dict(category_counts.get(date, {}))
+            }
+            for (section, field), value in zip(FLOAT_COLUMNS, values):
+                rollup.setdefault(section, {})[field] = value
+            result[date] = rollup
+        return result
+
+    async def rejected_prompts(self, limit: int) -> List[dict]:
+        rows = await self.run(lambda connection: connection.execute(
+            "SELECT id, timestamp, safety_analysis FROM rejected_facts WHERE status = 'rejected' "
+            "ORDER BY timestamp DESC LIMIT ?", (limit,)
+        ).fetchall())
+        self.stats["queries"] += 1
+        return [{"id": id, "timestamp": timestamp, "safety_analysis": json.loads(safety_analysis or "{}")}
+                for id, timestamp, safety_analysis in rows]
+
+    async def counts(self) -> Dict[str, int]:
+        def query(connection):
+            return {
+                "documents": connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+                "analytics_facts": connection.execute("SELECT COUNT(*) FROM analytics_facts").fetchone()[0],
+                "rejected_facts": connection.execute("SELECT COUNT(*) FROM rejected_facts").fetchone()[0]
+            }
+        return await self.run(query)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"path": self.path, "mirror_enabled": ANALYTICS_MIRROR, **self.stats}
+
+
+analytics_store = AnalyticsStore()
+
+
+# ---------- Contenedores locales (STORAGE_BACKEND=sqlite) ----------
+# Las firmas reproducen las del SDK de Cosmos aunque el almacén local no use todos los argumentos
+# pylint: disable=unused-argument,redefined-builtin
+class LocalItemPaged:
+    """Resultado de query_items con la interfaz del SDK asíncrono: iteración, by_page y response_hook"""
+
+    def __init__(self, container: "LocalContainer", query: str, parameters: Optional[list],
+                 page_size: int, response_hook):
+        self.container = container
+        self.query = query
+        self.parameters = {p["name"].lstrip("@"): p["value"] for p in parameters or []}
+        self.page_size = page_size or 100
+        self.response_hook = response_hook
+        self.continuation_token = None
+
+    async def _pages(self):
+        sql, mode = translate_query(self.query)
+        parameters = {**self.parameters, "_container": self.container.id}
+        rows = await self.container.store.run(lambda connection: connection.execute(sql, parameters).fetchall())
+        self.container.store.stats["queries"] += 1
+        if mode == "value":
+            items = [row[0] for row in rows]
+        else:
+            items = [json.loads(row[0]) for row in rows]
+            if mode == "object":
+                items = [{k: v for k, v in item.items() if v is not None} for item in items]
+        for start in range(0, max(len(items), 1), self.page_size):
+            page = items[start:start + self.page_size]
+            self.continuation_token = str(start + self.page_size) if start + self.page_size < len(items) else None
+            if self.response_hook:
+                self.response_hook({"x-ms-request-charge": "0"}, page)
+            yield page
+
+    def by_page(self, continuation_token: Optional[str] = None):
+        pager = self
+
+        class PageIterator:
+            @property
+            def continuation_token(self):
+                return pager.continuation_token
+
+            async def __aiter__(self):
+                async for page in pager._pages():
+                    yield _iterate(page)
+
+        return PageIterator()
+
+    async def __aiter__(self):
+        async for page in self._pages():
+            for item in page:
+                yield item
+
+
+async def _iterate(items: list):
+    for item in items:
+        yield item
+
+
+class LocalContainer:
+    """Contenedor sobre el almacén local con la interfaz del ContainerProxy asíncrono que usa la aplicación"""
+
+    def __init__(self, store: AnalyticsStore, name: str, key: Optional[str]):
+        self.store = store
+        self.id = name
+        self.key = key
+
+    def _write(self, body: dict, mode: str, etag: Optional[str] = None) -> dict:
+        # Mismas excepciones que el SDK, importadas al escribir para no cargarlo al arrancar
+        from azure.cosmos.exceptions import (
+            CosmosAccessConditionFailedError,
+            CosmosResourceExistsError,
+            CosmosResourceNotFoundError
+        )
+
+        stored = {**body, "_etag": uuid.uuid4().hex, "_ts": int(time.time())}
+
+        def write(connection):
+            with connection:
+                row = connection.execute(
+                    "SELECT body FROM documents WHERE container = ? AND id = ?", (self.id, body["id"])
+                ).fetchone()
+                if mode == "create" and row is not None:
+                    raise CosmosResourceExistsError(status_code=409, message="Entity with the specified id already exists")
+                if mode == "replace":
+                    if row is None:
+                        raise CosmosResourceNotFoundError(status_code=404, message="Entity not found")
+                    if etag is not None and json.loads(row[0]).get("_etag") != etag:
+                        raise CosmosAccessConditionFailedError(status_code=412, message="Precondition failed")
+                connection.execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                    (self.id, body["id"], json.dumps(stored, ensure_ascii=False, default=str))
+                )
+                if self.key in MIRRORED_KEYS:
+                    # La copia plana se actualiza en la misma transacción que el documento
+                    self.store.write_mirror(connection, [(self.key, stored)])
+            return stored
+
+        return write
+
+    async def upsert_item(self, body: dict, **kwargs) -> dict:
+        return await self.store.run(self._write(body, "upsert"))
+
+    async def create_item(self, body: dict, **kwargs) -> dict:
+        return await self.store.run(self._write(body, "create"))
+
+    async def replace_item(self, item, body: dict, etag: Optional[str] = None, match_condition=None, **kwargs) -> dict:
+        return await self.store.run(self._write(body, "replace", etag))
+
+    async def read_item(self, item, partition_key=None, **kwargs) -> dict:
+        item_id = item if isinstance(item, str) else item["id"]
+        row = await self.store.run(lambda connection: connection.execute(
+            "SELECT body FROM documents WHERE container = ? AND id = ?", (self.id, item_id)
+        ).fetchone())
+        if row is None:
+            from azure.cosmos.exceptions import CosmosResourceNotFoundError
+            raise CosmosResourceNotFoundError(status_code=404, message="Entity not found")
+        return json.loads(row[0])
+
+    async def delete_item(self, item, partition_key=None, **kwargs) -> None:
+        item_id = item if isinstance(item, str) else item["id"]
+
+        def delete(connection):
+            with connection:
+                return connection.execute(
+                    "DELETE FROM documents WHERE container = ? AND id = ?", (self.id, item_id)
+                ).rowcount
+        if not await self.store.run(delete):
+            from azure.cosmos.exceptions import CosmosResourceNotFoundError
+            raise CosmosResourceNotFoundError(status_code=404, message="Entity not found")
+
+    def query_items(self, query: str, parameters: Optional[list] = None, max_item_count: Optional[int] = None,
+                    response_hook=None, **kwargs) -> LocalItemPaged:
+        return LocalItemPaged(self, query, parameters, max_item_count, response_hook)
+
+
+class LocalDatabase:
+    def __init__(self, store: AnalyticsStore, container_keys: Dict[str, str]):
+        self.store = store
+        self.container_keys = container_keys
+
+    def get_container_client(self, name: str) -> LocalContainer:
+        return LocalContainer(self.store, name, self.container_keys.get(name))
+
+    async def create_container_if_not_exists(self, id: str, partition_key=None, **kwargs) -> LocalContainer:
+        return self.get_container_client(id)
+
+    async def read(self) -> dict:
+        await self.store.run(lambda connection: connection.execute("SELECT 1").fetchone())
+        return {"id": self.store.path}
+
+
+class LocalClient:
+    """Sustituto sin red del CosmosClient: todas las bases de datos comparten el almacén local"""
+
+    def __init__(self, store: AnalyticsStore, container_keys: Dict[str, str]):
+        self.store = store
+        self.container_keys = container_keys
+
+    def get_database_client(self, name: str) -> LocalDatabase:
+        return LocalDatabase(self.store, self.container_keys)
+
+    async def close(self) -> None:
+        self.store.close()
+# pylint: enable=unused-argument,redefined-builtin
+
+
+# ---------- Sincronización inicial ----------
+async def sync_from_cosmos(days: Optional[int] = None) -> Dict[str, int]:
+    """Carga en las tablas planas los documentos existentes de Analytics y RejectedPrompts"""
+    from backend.database import cosmos_connections, iter_query_pages
+
+    query, parameters = "SELECT * FROM c", []
+    if days:
+        query = "SELECT * FROM c WHERE c.timestamp >= @startDate"
+        parameters = [{"name": "@startDate", "value": (datetime.utcnow() - timedelta(days=days)).date().isoformat()}]
+
+    synced = {}
+    for key in MIRRORED_KEYS:
+        synced[key] = 0
+        async for page in iter_query_pages(cosmos_connections.container(key), query, parameters):
+            await analytics_store.mirror([(key, doc) for doc in page])
+            synced[key] += len(page)
+        logger.info(f"Almacén analítico: {synced[key]} documentos de {key} sincronizados")
+    return synced
+
+
+async def _main(days: Optional[int]) -> None:
+    from backend.clients import azure_clients
+
+    await azure_clients.start()
+    try:
+        print(json.dumps(await sync_from_cosmos(days)))
+    finally:
+        await azure_clients.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Almacén analítico local")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync = subparsers.add_parser("sync", help="Copia Analytics y RejectedPrompts desde Cosmos DB")
+    sync.add_argument("--days", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(_main(args.days))
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.analytics_store import ANALYTICS_MIRROR, MIRRORED_KEYS, analytics_store
+from backend.database import STORAGE_BACKEND, cosmos_connections
+from backend.telemetry import record_stage, track_stage
+
+logger = logging.getLogger(__name__)
+
+AUDIT_WRITE_BEHIND = os.getenv("AUDIT_WRITE_BEHIND", "true").lower() == "true"
+AUDIT_QUEUE_MAXSIZE = int(os.getenv("AUDIT_QUEUE_MAXSIZE", "5000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "50"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+AUDIT_WRITE_CONCURRENCY = int(os.getenv("AUDIT_WRITE_CONCURRENCY", "10"))
+AUDIT_WRITE_TIMEOUT = float(os.getenv("AUDIT_WRITE_TIMEOUT", "10"))
+AUDIT_SPILL_PATH = Path(os.getenv("AUDIT_SPILL_PATH", Path(tempfile.gettempdir()) / "prompt_guardian_audit_spill.jsonl"))
+AUDIT_SPILL_REPLAY_INTERVAL = float(os.getenv("AUDIT_SPILL_REPLAY_INTERVAL", "30"))
+# Tiempo máximo para vaciar la cola al apagar; lo que quede se guarda en el fichero local
+AUDIT_SHUTDOWN_TIMEOUT = float(os.getenv("AUDIT_SHUTDOWN_TIMEOUT", "10"))
+# Con STORAGE_BACKEND=sqlite la copia plana se escribe en la misma transacción que el documento
+MIRROR_WRITES = ANALYTICS_MIRROR and STORAGE_BACKEND == "cosmos"
+
+AuditItem = Tuple[str, dict]
+
+
+class AuditWriter:
+    """Escritura diferida de auditoría: cola acotada, volcado concurrente a Cosmos y fichero local de desbordamiento
+
+    Los upserts son idempotentes (mismo id), así que reintentar desde el fichero tras un timeout es seguro.
+    """
+
+    def __init__(self, maxsize: int = AUDIT_QUEUE_MAXSIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, concurrency: int = AUDIT_WRITE_CONCURRENCY,
+                 spill_path: Path = AUDIT_SPILL_PATH):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.spill_path = Path(spill_path)
+        self.queue: Optional[asyncio.Queue] = None
+        # Documentos aceptados y aún no confirmados en Cosmos, para /audit
+        self.pending: Dict[Tuple[str, str], dict] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._replayer: Optional[asyncio.Task] = None
+        self._spill_lock = asyncio.Lock()
+        self.stats = {
+            "enqueued": 0, "written": 0, "failed": 0, "spilled": 0, "replayed": 0,
+            "direct_writes": 0, "flushes": 0, "flush_ms_total": 0.0, "flush_ms_max": 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None
+
+    async def write(self, container_key: str, document: dict) -> None:
+        """Acepta un documento; sin el volcador en marcha se escribe directamente"""
+        with track_stage(f"persistence.{container_key}"):
+            if not self.running:
+                self.stats["direct_writes"] += 1
+                await cosmos_connections.container(container_key).upsert_item(document)
+                await self._mirror([(container_key, document)])
+                return
+
+            self.pending[(container_key, document["id"])] = document
+            self.stats["enqueued"] += 1
+            try:
+                self.queue.put_nowait((container_key, document))
+            except asyncio.QueueFull:
+                # Cola llena: el documento va al fichero local y se reintentará más tarde
+                await self._spill([(container_key, document)])
+
+    async def _mirror(self, items: List[AuditItem]) -> None:
+        """Réplica en el almacén analítico local de lo ya confirmado en Cosmos"""
+        if MIRROR_WRITES and (mirrored := [item for item in items if item[0] in MIRRORED_KEYS]):
+            await analytics_store.mirror(mirrored)
+
+    def find_pending(self, container_key: str, document_id: str) -> Optional[dict]:
+        return self.pending.get((container_key, document_id))
+
+    async def find_spilled(self, container_key: str, document_id: str) -> Optional[dict]:
+        """Busca un documento en el fichero de desbordamiento (solo en el camino de fallo de /audit)"""
+        def scan() -> Optional[dict]:
+            found = None
+            for path in (self.spill_path, self._replay_path):
+                if not path.exists():
+                    continue
+                with path.open(encoding="utf-8") as spill:
+                    for line in spill:
+                        record = json.loads(line)
+                        if record["container"] == container_key and record["document"].get("id") == document_id:
+                            found = record["document"]
+            return found
+
+        async with self._spill_lock:
+            return await asyncio.to_thread(scan)
+
+    # ---------- Volcado ----------
+    async def _write_one(self, semaphore: asyncio.Semaphore, item: AuditItem) -> bool:
+        container_key, document = item
+        async with semaphore:
+            try:
+                await asyncio.wait_for(
+                    cosmos_connections.container(container_key).upsert_item(document), timeout=AUDIT_WRITE_TIMEOUT
+                )
+                return True
+            except Exception as e:
+                logger.warning(f"Error escribiendo auditoría {container_key}/{document.get('id')}: {str(e)}")
+                return False
+
+    async def _flush(self, batch: List[AuditItem]) -> None:
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self._write_one(semaphore, item) for item in batch))
+        failed = [item for item, ok in zip(batch, results) if not ok]
+        if failed:
+            self.stats["failed"] += len(failed)
+            await self._spill(failed)
+
+        written = [item for item, ok in zip(batch, results) if ok]
+        for container_key, document in written:
+            self.pending.pop((container_key, document["id"]), None)
+        await self._mirror(written)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record_stage("persistence.flush", elapsed_ms / 1000, "error" if failed else "ok")
+        self.stats["written"] += len(batch) - len(failed)
+        self.stats["flushes"] += 1
+        self.stats["flush_ms_total"] += elapsed_ms
+        self.stats["flush_ms_max"] = max(self.stats["flush_ms_max"], elapsed_ms)
+
+    async def _next_batch(self) -> List[AuditItem]:
+        """Espera el primer documento y agrupa los que lleguen durante flush_interval"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush_loop(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Error en el volcado de auditoría: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    # ---------- Fichero de desbordamiento ----------
+    @property
+    def _replay_path(self) -> Path:
+        return self.spill_path.with_suffix(self.spill_path.suffix + ".replaying")
+
+    async def _spill(self, items: List[AuditItem]) -> None:
+        lines = "".join(
+            json.dumps({"container": key, "document": doc}, ensure_ascii=False, default=str) + "\n"
+            for key, doc in items
+        )
+
+        def append():
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.spill_path.open("a", encoding="utf-8") as spill:
+                spill.write(lines)
+                spill.flush()
+                os.fsync(spill.fileno())
+
+        async with self._spill_lock:
+            await asyncio.to_thread(append)
+        # En el fichero ya son duraderos: se liberan de memoria
+        for key, doc in items:
+            self.pending.pop((key, doc["id"]), None)
+        self.stats["spilled"] += len(items)
+        logger.warning(f"{len(items)} documentos de auditoría guardados en {self.spill_path}")
+
+    async def replay_spill(self) -> int:
+        """Reescribe en Cosmos lo acumulado en el fichero; lo que vuelva a fallar regresa al fichero"""
+        async with self._spill_lock:
+            # El fichero se renombra para que las nuevas escrituras no se mezclen con la reproducción
+            if not self._replay_path.exists():
+                if not self.spill_path.exists() or self.spill_path.stat().st_size == 0:
+                    return 0
+                self.spill_path.rename(self._replay_path)
+            lines = await asyncio.to_thread(self._replay_path.read_text, "utf-8")
+
+        items = []
+        for line in lines.splitlines():
+            try:
+                record = json.loads(line)
+                items.append((record["container"], record["document"]))
+            except (ValueError, KeyError):
+                logger.error(f"Línea corrupta descartada del fichero de auditoría: {line[:80]}")
+
+        replayed = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            results = await asyncio.gather(*(self._write_one(semaphore, item) for item in batch))
+            replayed += sum(results)
+            await self._mirror([item for item, ok in zip(batch, results) if ok])
+            if failed := [item for item, ok in zip(batch, results) if not ok]:
+                await self._spill(failed)
+                self.stats["spilled"] -= len(failed)
+
+        async with self._spill_lock:
+            self._replay_path.unlink(missing_ok=True)
+        self.stats["replayed"] += replayed
+        if items:
+            logger.info(f"Auditoría reproducida desde el fichero local: {replayed}/{len(items)} documentos")
+        return replayed
+
+    async def _replay_loop(self) -> None:
+        while True:
+            try:
+                await self.replay_spill()
+            except Exception as e:
+                logger.error(f"Error reproduciendo el fichero de auditoría: {str(e)}")
+            await asyncio.sleep(AUDIT_SPILL_REPLAY_INTERVAL)
+
+    # ---------- Ciclo de vida ----------
+    def start(self) -> None:
+        if not AUDIT_WRITE_BEHIND or self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._replayer = asyncio.create_task(self._replay_loop())
+
+    async def stop(self, timeout: float = AUDIT_SHUTDOWN_TIMEOUT) -> None:
+        """Vacía la cola antes de apagar con un plazo máximo; lo que no se escriba a tiempo queda en el fichero local"""
+        if not self.running:
+            return
+        self._replayer.cancel()
+        try:
+            await self._replayer
+        except asyncio.CancelledError:
+            pass
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            queued = []
+            while not self.queue.empty():
+                queued.append(self.queue.get_nowait())
+                self.queue.task_done()
+            logger.warning(f"Cola de auditoría sin vaciar en {timeout} s: {len(queued)} documentos al fichero local")
+            if queued:
+                await self._spill(queued)
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        # Lote en vuelo interrumpido por la cancelación: también al fichero (los upserts son idempotentes)
+        if self.pending:
+            await self._spill([(container_key, document) for (container_key, _), document in self.pending.items()])
+        self._flusher = self._replayer = None
+        logger.info(f"Cola de auditoría vaciada ({self.stats['written']} escritos, {self.stats['spilled']} en fichero)")
+
+    def snapshot(self) -> Dict[str, Any]:
+        flushes = self.stats["flushes"]
+        return {
+            "enabled": self.running,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "pending": len(self.pending),
+            **{k: v for k, v in self.stats.items() if k not in ("flush_ms_total", "flush_ms_max")},
+            "avg_flush_ms": round(self.stats["flush_ms_total"] / flushes, 2) if flushes else 0.0,
+            "max_flush_ms": round(self.stats["flush_ms_max"], 2),
+            "spill_bytes": self.spill_path.stat().st_size if self.spill_path.exists() else 0
+        }
+
+
+audit_writer = AuditWriter()
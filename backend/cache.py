@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Protocol, Tuple
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_MAXSIZE = int(os.getenv("ANALYSIS_CACHE_MAXSIZE", "2048"))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+ANALYSIS_CACHE_URL = os.getenv("ANALYSIS_CACHE_URL")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normaliza el prompt para que variaciones de espacios compartan entrada"""
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def config_fingerprint(*parts: Any) -> str:
+    """Huella de la configuración que afecta al resultado (umbrales, system prompts)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def analysis_cache_key(prompt: str, context: Optional[str], target_model: Optional[str],
+                       optimization_focus: Optional[list], generate_variants: Optional[bool],
+                       language: Optional[str] = None, analysis_mode: Optional[str] = None) -> str:
+    """Clave direccionada por contenido para un análisis de prompt"""
+    payload = json.dumps({
+        "prompt": hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest(),
+        "context": context,
+        "target_model": target_model,
+        "optimization_focus": optimization_focus or [],
+        "generate_variants": bool(generate_variants),
+        "language": language,
+        "analysis_mode": analysis_mode
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SharedCacheTier(Protocol):
+    """Nivel compartido entre réplicas (Redis, Memcached...)"""
+
+    async def get(self, key: str) -> Optional[dict]: ...
+
+    async def set(self, key: str, value: dict, ttl: int) -> None: ...
+
+
+class AiocacheSharedTier:
+    """Adaptador de aiocache como nivel compartido"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @classmethod
+    def from_url(cls, url: str) -> "AiocacheSharedTier":
+        from aiocache import Cache
+        from aiocache.serializers import JsonSerializer
+        cache = Cache.from_url(url)
+        cache.serializer = JsonSerializer()
+        return cls(cache)
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await self.cache.get(key)
+
+    async def set(self, key: str, value: dict, ttl: int) -> None:
+        await self.cache.set(key, value, ttl=ttl)
+
+
+class AnalysisCache:
+    """Caché en dos niveles: LRU con TTL en proceso y un nivel compartido opcional"""
+
+    def __init__(self, maxsize: int = ANALYSIS_CACHE_MAXSIZE, ttl: int = ANALYSIS_CACHE_TTL,
+                 shared: Optional[SharedCacheTier] = None):
+        self.ttl = ttl
+        # maxsize <= 0 desactiva el nivel local (solo nivel compartido, o sin caché)
+        self.local: Optional[TTLCache] = TTLCache(maxsize=maxsize, ttl=ttl) if maxsize > 0 else None
+        self.shared = shared
+        self.fingerprint: Optional[str] = None
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "shared_errors": 0}
+
+    def _namespaced(self, key: str) -> str:
+        return f"analysis:{self.fingerprint}:{key}"
+
+    def ensure_fingerprint(self, fingerprint: str) -> None:
+        """Invalida la caché si cambió la configuración que afecta al resultado"""
+        if self.fingerprint is not None and self.fingerprint != fingerprint:
+            logger.info("Configuración de análisis modificada, invalidando caché")
+            self.invalidate()
+        self.fingerprint = fingerprint
+
+    def invalidate(self) -> None:
+        """Vacía el nivel local; el compartido queda huérfano al cambiar el espacio de nombres"""
+        if self.local is not None:
+            self.local.clear()
+        self.stats["invalidations"] += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        namespaced = self._namespaced(key)
+        if self.local is not None and (value := self.local.get(namespaced)) is not None:
+            self.stats["local_hits"] += 1
+            return value
+
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(namespaced)
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                logger.warning(f"Error leyendo caché compartida: {str(e)}")
+                value = None
+            if value is not None:
+                self.stats["shared_hits"] += 1
+                if self.local is not None:
+                    self.local[namespaced] = value
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: dict) -> None:
+        namespaced = self._namespaced(key)
+        if self.local is not None:
+            self.local[namespaced] = value
+        if self.shared is not None:
+            try:
+                await self.shared.set(namespaced, value, self.ttl)
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                logger.warning(f"Error escribiendo caché compartida: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        hits = self.stats["local_hits"] + self.stats["shared_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self.local) if self.local is not None else 0,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "shared_tier": type(self.shared).__name__ if self.shared is not None else None
+        }
+
+
+analysis_cache = AnalysisCache(
+    shared=AiocacheSharedTier.from_url(ANALYSIS_CACHE_URL) if ANALYSIS_CACHE_URL else None
+)
+
+
+class StaleWhileRevalidateCache:
+    """Valores calculados bajo demanda: se sirven frescos durante ttl y, hasta max_stale más,
+    se sirve el anterior mientras un único recálculo corre en segundo plano"""
+
+    def __init__(self, ttl: float, max_stale: float):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.entries: Dict[Hashable, Tuple[Any, float]] = {}
+        self.refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Un solo recálculo por clave; las peticiones concurrentes comparten la misma tarea"""
+        if (task := self.refreshing.get(key)) is not None:
+            return task
+
+        async def run():
+            try:
+                value = await loader()
+                self.entries[key] = (value, time.monotonic())
+                self.stats["refreshes"] += 1
+                return value
+            except Exception:
+                self.stats["refresh_errors"] += 1
+                raise
+            finally:
+                self.refreshing.pop(key, None)
+
+        task = self.refreshing[key] = asyncio.create_task(run())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, float]:
+        """Devuelve (valor, antigüedad en segundos)"""
+        if (entry := self.entries.get(key)) is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return value, age
+            if age < self.ttl + self.max_stale:
+                self.stats["stale_hits"] += 1
+                self._refresh(key, loader)
+                return value, age
+
+        self.stats["misses"] += 1
+        # shield: si un cliente se desconecta no se cancela el cálculo que esperan los demás
+        value = await asyncio.shield(self._refresh(key, loader))
+        return value, 0.0
+
+    def invalidate(self) -> None:
+        self.entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self.entries), "ttl": self.ttl, "max_stale": self.max_stale}
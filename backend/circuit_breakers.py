@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Fallos consecutivos que abren el circuito y segundos hasta dejar pasar una llamada de prueba
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpenError(Exception):
+    """La dependencia está marcada como caída: la llamada se omite sin esperar su timeout"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"Circuito de {dependency} abierto; siguiente prueba en {retry_after:.1f}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def counts_as_failure(error: BaseException) -> bool:
+    """Errores de servidor, red y timeouts; los 4xx (incluido 429) indican que el servicio responde"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return not (isinstance(status, int) and status < 500)
+
+
+class CircuitBreaker:
+    """Circuito cerrado / abierto / semiabierto por dependencia, según fallos consecutivos"""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {"opened": 0, "short_circuited": 0, "failures": 0, "successes": 0}
+
+    def retry_in(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.retry_in() > 0:
+                return False
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open":
+            # Solo una llamada de prueba a la vez mientras el circuito está semiabierto
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.stats["successes"] += 1
+        self.failures = 0
+        self._probe_in_flight = False
+        if self.state != "closed":
+            logger.info(f"Circuito de {self.name} cerrado: la dependencia responde de nuevo")
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            logger.warning(f"Circuito de {self.name} abierto tras {self.failures} fallos consecutivos")
+
+    @asynccontextmanager
+    async def guard(self):
+        if not self.allow():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Cancelación propia (plazo o desconexión): no dice nada de la salud de la dependencia
+            self._probe_in_flight = False
+            raise
+        except Exception as e:
+            if counts_as_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_s": round(self.retry_in(), 1) if self.state == "open" else 0.0,
+            **self.stats
+        }
+
+
+circuit_breakers: Dict[str, CircuitBreaker] = {
+    name: CircuitBreaker(name) for name in ("content_safety", "text_analytics", "openai")
+}
+
+
+def breakers_snapshot() -> Dict[str, Any]:
+    return {name: breaker.snapshot() for name, breaker in circuit_breakers.items()}
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Set
+
+from backend.config import config
+
+# Los SDK se importan al crear cada cliente: importar la aplicación (workers, CLI, dashboard) no los carga
+if TYPE_CHECKING:
+    from azure.ai.contentsafety.aio import ContentSafetyClient
+    from azure.ai.textanalytics.aio import TextAnalyticsClient
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.cosmos.aio import CosmosClient
+    from openai import AsyncAzureOpenAI
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de los pools HTTP por servicio y timeouts (segundos)
+AZURE_HTTP_POOL_SIZE = int(os.getenv("AZURE_HTTP_POOL_SIZE", "100"))
+AZURE_HTTP_POOL_SIZE_PER_HOST = int(os.getenv("AZURE_HTTP_POOL_SIZE_PER_HOST", "50"))
+AZURE_HTTP_KEEPALIVE = float(os.getenv("AZURE_HTTP_KEEPALIVE", "60"))
+AZURE_HTTP_TIMEOUT = float(os.getenv("AZURE_HTTP_TIMEOUT", "30"))
+COSMOS_HTTP_POOL_SIZE = int(os.getenv("COSMOS_HTTP_POOL_SIZE", str(AZURE_HTTP_POOL_SIZE)))
+COSMOS_HTTP_POOL_SIZE_PER_HOST = int(os.getenv("COSMOS_HTTP_POOL_SIZE_PER_HOST", str(AZURE_HTTP_POOL_SIZE_PER_HOST)))
+COSMOS_HTTP_TIMEOUT = float(os.getenv("COSMOS_HTTP_TIMEOUT", str(AZURE_HTTP_TIMEOUT)))
+OPENAI_HTTP_POOL_SIZE = int(os.getenv("OPENAI_HTTP_POOL_SIZE", "100"))
+OPENAI_HTTP_TIMEOUT = float(os.getenv("OPENAI_HTTP_TIMEOUT", "60"))
+OPENAI_API_VERSION = "2024-05-01-preview"
+# Reintentos internos de los SDK de Content Safety, Text Analytics y OpenAI. Por defecto los gestiona la
+# aplicación (backend.rate_limits), que ve cada 429 y respeta Retry-After sin multiplicar intentos
+SDK_MAX_RETRIES = int(os.getenv("SDK_MAX_RETRIES", "0"))
+# Segundos que se mantiene abierto un cliente sustituido por rotación de secretos, para las peticiones en curso
+SECRET_ROTATION_GRACE = float(os.getenv("SECRET_ROTATION_GRACE", "60"))
+# "eager": los clientes (y sus SDK) se crean en el arranque; "background": justo después, sin retrasar el
+# arranque; "lazy": en el primer uso de cada etapa
+AZURE_CLIENTS_WARMUP = os.getenv("AZURE_CLIENTS_WARMUP", "eager").lower()
+
+REQUIRED_SECRETS = [
+    "COSMOS-ENDPOINT",
+    "COSMOS-kEY",
+    "AZURE-OPENAI-ENDPOINT",
+    "AZURE-OPENAI-KEY",
+    "AZURE-OPENAI-DEPLOYMENT-NAME",
+    "TEXT-ANALYTICS-ENDPOINT",
+    "TEXT-ANALYTICS-KEY",
+    "CONTENT-SAFETY-ENDPOINT",
+    "CONTENT-SAFETY-KEY"
+]
+# Secretos de los que depende cada cliente: si rotan, el cliente se vuelve a crear
+CLIENT_SECRETS = {
+    "_content_safety": ("CONTENT-SAFETY-ENDPOINT", "CONTENT-SAFETY-KEY"),
+    "_text_analytics": ("TEXT-ANALYTICS-ENDPOINT", "TEXT-ANALYTICS-KEY"),
+    "_openai": ("AZURE-OPENAI-ENDPOINT", "AZURE-OPENAI-KEY"),
+    "_cosmos": ("COSMOS-ENDPOINT", "COSMOS-kEY")
+}
+
+
+def _azure_transport(pool_size: int = AZURE_HTTP_POOL_SIZE,
+                     pool_size_per_host: int = AZURE_HTTP_POOL_SIZE_PER_HOST,
+                     timeout: float = AZURE_HTTP_TIMEOUT) -> "AioHttpTransport":
+    """Transporte aiohttp con pool de conexiones propio para un cliente de Azure"""
+    import aiohttp
+    # azure.core exporta el transporte de forma perezosa y pylint no lo resuelve
+    from azure.core.pipeline.transport import AioHttpTransport  # pylint: disable=no-name-in-module
+
+    connector = aiohttp.TCPConnector(
+        limit=pool_size,
+        limit_per_host=pool_size_per_host,
+        keepalive_timeout=AZURE_HTTP_KEEPALIVE,
+        ttl_dns_cache=300
+    )
+    session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+    return AioHttpTransport(session=session, session_owner=True)
+
+
+class AzureClients:
+    """Clientes asíncronos compartidos: se crean una vez y se cierran al apagar la aplicación"""
+
+    def __init__(self):
+        # Mismo diccionario que config.values: lo que se precarga o rota allí se ve aquí
+        self.secrets = config.values
+        self._content_safety = None
+        self._text_analytics = None
+        self._openai = None
+        self._cosmos = None
+        self._warm_task = None
+        # Cierres diferidos de clientes sustituidos por una rotación de secretos
+        self._closing: Set[asyncio.Task] = set()
+        self.warmup_ms = None
+
+    def install(self, **clients) -> None:
+        """Sustituye clientes por otros ya creados (servicios simulados de pruebas y benchmarks).
+
+        Acepta content_safety, text_analytics, openai y cosmos; la rotación y el cierre los tratan como propios.
+        """
+        for name, client in clients.items():
+            attr = f"_{name}"
+            if attr not in CLIENT_SECRETS:
+                raise ValueError(f"Cliente de Azure desconocido: {name}")
+            setattr(self, attr, client)
+
+    def secret(self, name: str) -> str:
+        """Secreto precargado en el arranque (o con valor local, sin lifespan)"""
+        return config.get_secret_cached(name)
+
+    @property
+    def openai_deployment(self) -> str:
+        return self.secret("AZURE-OPENAI-DEPLOYMENT-NAME")
+
+    @property
+    def content_safety(self) -> "ContentSafetyClient":
+        if self._content_safety is None:
+            from azure.ai.contentsafety.aio import ContentSafetyClient
+            from azure.core.credentials import AzureKeyCredential
+            self._content_safety = ContentSafetyClient(
+                endpoint=self.secret("CONTENT-SAFETY-ENDPOINT"),
+                credential=AzureKeyCredential(self.secret("CONTENT-SAFETY-KEY")),
+                transport=_azure_transport(),
+                retry_total=SDK_MAX_RETRIES
+            )
+        return self._content_safety
+
+    @property
+    def text_analytics(self) -> "TextAnalyticsClient":
+        if self._text_analytics is None:
+            from azure.ai.textanalytics.aio import TextAnalyticsClient
+            from azure.core.credentials import AzureKeyCredential
+            self._text_analytics = TextAnalyticsClient(
+                endpoint=self.secret("TEXT-ANALYTICS-ENDPOINT"),
+                credential=AzureKeyCredential(self.secret("TEXT-ANALYTICS-KEY")),
+                transport=_azure_transport(),
+                retry_total=SDK_MAX_RETRIES
+            )
+        return self._text_analytics
+
+    @property
+    def openai(self) -> "AsyncAzureOpenAI":
+        if self._openai is None:
+            import httpx
+            from openai import AsyncAzureOpenAI
+            self._openai = AsyncAzureOpenAI(
+                azure_endpoint=self.secret("AZURE-OPENAI-ENDPOINT"),
+                api_key=self.secret("AZURE-OPENAI-KEY"),
+                api_version=OPENAI_API_VERSION,
+                max_retries=SDK_MAX_RETRIES,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_HTTP_POOL_SIZE,
+                        max_keepalive_connections=OPENAI_HTTP_POOL_SIZE
+                    ),
+                    timeout=OPENAI_HTTP_TIMEOUT
+                )
+            )
+        return self._openai
+
+    @property
+    def cosmos(self) -> "CosmosClient":
+        if self._cosmos is None:
+            from azure.cosmos.aio import CosmosClient
+            self._cosmos = CosmosClient(
+                self.secret("COSMOS-ENDPOINT"),
+                credential=self.secret("COSMOS-kEY"),
+                transport=_azure_transport(COSMOS_HTTP_POOL_SIZE, COSMOS_HTTP_POOL_SIZE_PER_HOST, COSMOS_HTTP_TIMEOUT)
+            )
+        return self._cosmos
+
+    async def start(self, use_cosmos: bool = True) -> None:
+        """Precarga los secretos en paralelo, se suscribe a las rotaciones y calienta los clientes"""
+        await config.load(REQUIRED_SECRETS)
+        config.on_rotation(self.rotate)
+        if AZURE_CLIENTS_WARMUP == "eager":
+            await self.warm(use_cosmos)
+        elif AZURE_CLIENTS_WARMUP == "background":
+            self._warm_task = asyncio.create_task(self.warm(use_cosmos))
+
+    async def warm(self, use_cosmos: bool = True) -> None:
+        """Crea los clientes por adelantado; cada import de SDK cede el event loop antes del siguiente"""
+        start = time.perf_counter()
+        for name in ("content_safety", "text_analytics", "openai"):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                logger.warning(f"No se pudo crear el cliente {name}: {str(e)}")
+            await asyncio.sleep(0)
+
+        if use_cosmos:
+            try:
+                await self.cosmos.__aenter__()
+            except Exception as e:
+                logger.warning(f"No se pudo inicializar Cosmos DB: {str(e)}")
+        self.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Clientes de Azure listos en {self.warmup_ms} ms")
+
+    async def rotate(self, changed) -> None:
+        """Sustituye los clientes cuyos secretos cambiaron; los anteriores se cierran tras un periodo de gracia"""
+        replaced = []
+        for attr, names in CLIENT_SECRETS.items():
+            client = getattr(self, attr)
+            if client is None or not changed.intersection(names):
+                continue
+            setattr(self, attr, None)
+            replaced.append(attr)
+            logger.info(f"Secretos de {attr.lstrip('_')} rotados, se crea un cliente nuevo")
+            task = asyncio.create_task(self._close_later(client))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+        if "_cosmos" in replaced:
+            try:
+                await self.cosmos.__aenter__()
+            except Exception as e:
+                logger.warning(f"No se pudo reabrir Cosmos DB tras la rotación: {str(e)}")
+
+    async def _close_later(self, client) -> None:
+        """Cierra el cliente al terminar el periodo de gracia, o antes si se cancela al apagar"""
+        try:
+            await asyncio.sleep(SECRET_ROTATION_GRACE)
+        finally:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Error cerrando cliente {type(client).__name__}: {str(e)}")
+
+    async def close(self) -> None:
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+            self._warm_task = None
+        # Los cierres diferidos se adelantan; los recién creados arrancan antes de cancelarlos, porque una tarea
+        # cancelada antes de empezar no llegaría a cerrar su cliente
+        closing = list(self._closing)
+        await asyncio.sleep(0)
+        for task in closing:
+            task.cancel()
+        await asyncio.gather(*closing, return_exceptions=True)
+        clients = [self._content_safety, self._text_analytics, self._openai, self._cosmos]
+        for client in clients:
+            if client is None:
+                continue
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"Error cerrando cliente {type(client).__name__}: {str(e)}")
+        self._content_safety = self._text_analytics = self._openai = self._cosmos = None
+
+
+azure_clients = AzureClients()
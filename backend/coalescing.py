@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from backend.telemetry import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+# Peticiones que pueden compartir un mismo análisis en curso; el resto lo ejecuta por su cuenta
+COALESCE_MAX_WAITERS = int(os.getenv("COALESCE_MAX_WAITERS", "100"))
+
+
+class Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        # Llamadores esperando el resultado, incluido el que lo lanzó
+        self.waiters = 1
+
+
+class SingleFlight:
+    """Coalescencia de peticiones idénticas en curso: una única ejecución compartida por clave
+
+    Cada llamador espera la tarea a través de asyncio.shield, así que la cancelación de uno no afecta
+    al resto; la tarea solo se cancela cuando no queda nadie esperándola. Los errores llegan a todos.
+    """
+
+    def __init__(self, max_waiters: int = COALESCE_MAX_WAITERS):
+        self.max_waiters = max_waiters
+        self.flights: Dict[Hashable, Flight] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "overflow": 0, "errors": 0, "cancelled": 0, "peak_waiters": 0}
+
+    def _finish(self, key: Hashable, flight: Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self.stats["errors"] += 1
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Devuelve el resultado y si este llamador fue quien lanzó la ejecución"""
+        flight = self.flights.get(key)
+        if flight is not None and flight.waiters >= self.max_waiters:
+            self.stats["overflow"] += 1
+            COALESCED_REQUESTS.labels(role="overflow").inc()
+            return await factory(), True
+
+        leader = flight is None
+        if leader:
+            flight = Flight(asyncio.create_task(factory()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.stats["leaders"] += 1
+        else:
+            flight.waiters += 1
+            self.stats["coalesced"] += 1
+            self.stats["peak_waiters"] = max(self.stats["peak_waiters"], flight.waiters)
+        COALESCED_REQUESTS.labels(role="leader" if leader else "follower").inc()
+
+        try:
+            return await asyncio.shield(flight.task), leader
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                flight.waiters -= 1
+                if flight.waiters == 0:
+                    flight.task.cancel()
+                    self.stats["cancelled"] += 1
+                    logger.info("Análisis compartido cancelado: todos los llamadores se desconectaron")
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        joined = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            "enabled": COALESCE_ENABLED,
+            "max_waiters": self.max_waiters,
+            "in_flight": len(self.flights),
+            **self.stats,
+            # Cada petición coalescida es un pipeline completo (Content Safety, Text Analytics, OpenAI) no ejecutado
+            "saved_ratio": round(self.stats["coalesced"] / joined, 4) if joined else 0.0
+        }
+
+
+analysis_flights = SingleFlight()
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+# azure.identity y Key Vault solo se importan si algún secreto no tiene valor local
+if TYPE_CHECKING:
+    from azure.keyvault.secrets.aio import SecretClient as AsyncSecretClient
+
+logger = logging.getLogger(__name__)
+
+KEY_VAULT_URL = os.getenv("KEY_VAULT_URL", "https://keyvaultgrupo12.vault.azure.net/")
+# Fichero local con valores de secretos: JSON ({"COSMOS-ENDPOINT": "..."}) o formato .env (COSMOS_ENDPOINT=...)
+SECRETS_FILE = os.getenv("SECRETS_FILE", "")
+# Sin Key Vault: solo variables de entorno y SECRETS_FILE (desarrollo y pruebas sin red)
+SECRETS_OFFLINE = os.getenv("SECRETS_OFFLINE", "false").lower() == "true"
+# Cada cuánto se vuelven a leer los secretos para recoger rotaciones (segundos, 0 desactiva)
+SECRETS_REFRESH_INTERVAL = float(os.getenv("SECRETS_REFRESH_INTERVAL", "3600"))
+SECRETS_FETCH_TIMEOUT = float(os.getenv("SECRETS_FETCH_TIMEOUT", "10"))
+
+RotationListener = Callable[[Set[str]], Awaitable[None]]
+
+
+def env_name(secret_name: str) -> str:
+    """Nombre de variable de entorno de un secreto: COSMOS-kEY -> COSMOS_KEY"""
+    return secret_name.upper().replace("-", "_")
+
+
+def load_secrets_file(path: str) -> Dict[str, str]:
+    """Valores de un fichero JSON o .env, indexados por env_name"""
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+    except OSError as e:
+        logger.warning(f"No se pudo leer el fichero de secretos {path}: {str(e)}")
+        return {}
+    if content.lstrip().startswith("{"):
+        return {env_name(key): str(value) for key, value in json.loads(content).items()}
+    values = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[env_name(key.strip().removeprefix("export "))] = value.strip().strip("\"'")
+    return values
+
+
+# ========== Configuración Segura ==========
+class SecureConfig:
+    """Secretos de la aplicación con precarga concurrente y refresco periódico
+
+    Orden de resolución: variable de entorno, SECRETS_FILE y Key Vault. La credencial y el cliente asíncrono
+    de Key Vault solo se crean si algún secreto no tiene valor local; un secreto sin valor hace fallar el
+    arranque, así que ninguna petición espera a Key Vault.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.sources: Dict[str, str] = {}
+        self.missing: List[str] = []
+        self.cold_start_ms: Optional[float] = None
+        self.last_refresh: Optional[float] = None
+        self.stats = {"vault_fetches": 0, "vault_errors": 0, "refreshes": 0, "rotations": 0}
+        self._file_values: Optional[Dict[str, str]] = None
+        self._async_credential = None
+        self._async_client: Optional["AsyncSecretClient"] = None
+        self._listeners: List[RotationListener] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _vault(self) -> "AsyncSecretClient":
+        if self._async_client is None:
+            from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+            from azure.keyvault.secrets.aio import SecretClient as AsyncSecretClient
+            self._async_credential = AsyncDefaultAzureCredential()
+            self._async_client = AsyncSecretClient(vault_url=KEY_VAULT_URL, credential=self._async_credential)
+        return self._async_client
+
+    def override(self, secret_name: str) -> Optional[str]:
+        """Valor local del secreto (variable de entorno o SECRETS_FILE), si existe"""
+        if self._file_values is None:
+            self._file_values = load_secrets_file(SECRETS_FILE)
+        key = env_name(secret_name)
+        if key in os.environ:
+            self.sources[secret_name] = "env"
+            return os.environ[key]
+        if key in self._file_values:
+            self.sources[secret_name] = "file"
+            return self._file_values[key]
+        return None
+
+    async def _fetch(self, secret_name: str) -> str:
+        self.stats["vault_fetches"] += 1
+        try:
+            secret = await asyncio.wait_for(self._vault().get_secret(secret_name), SECRETS_FETCH_TIMEOUT)
+        except Exception:
+            self.stats["vault_errors"] += 1
+            raise
+        self.sources[secret_name] = "vault"
+        return secret.value
+
+    async def _resolve(self, names: Iterable[str]) -> Dict[str, Any]:
+        """Valores locales y, en paralelo, los de Key Vault; los fallos se devuelven como excepción"""
+        resolved: Dict[str, Any] = {}
+        remote = []
+        for name in names:
+            value = self.override(name)
+            if value is not None:
+                resolved[name] = value
+            elif SECRETS_OFFLINE:
+                resolved[name] = KeyError(f"{name} no tiene valor local (SECRETS_OFFLINE)")
+            else:
+                remote.append(name)
+        if remote:
+            results = await asyncio.gather(*(self._fetch(name) for name in remote), return_exceptions=True)
+            resolved.update(zip(remote, results))
+        return resolved
+
+    async def load(self, names: Iterable[str]) -> float:
+        """Precarga todos los secretos en paralelo; devuelve la duración en milisegundos y falla si falta alguno"""
+        start = time.perf_counter()
+        self.missing = []
+        for name, value in (await self._resolve(names)).items():
+            if isinstance(value, BaseException):
+                logger.warning(f"No se pudo precargar el secreto {name}: {str(value)}")
+                self.missing.append(name)
+            else:
+                self.values[name] = value
+        self.cold_start_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.last_refresh = time.monotonic()
+        logger.info(
+            f"Secretos precargados en {self.cold_start_ms} ms: {len(self.values)} disponibles, "
+            f"{len(self.missing)} sin valor ({self.source_counts()})"
+        )
+        if self.missing:
+            # Mejor no arrancar que resolverlos después, en mitad de una petición
+            raise RuntimeError(f"Secretos sin valor: {', '.join(self.missing)}")
+        return self.cold_start_ms
+
+    def get_secret_cached(self, secret_name: str) -> str:
+        """Secreto precargado o con valor local; no llama a Key Vault para no bloquear el event loop"""
+        if secret_name in self.values:
+            return self.values[secret_name]
+        value = self.override(secret_name)
+        if value is None:
+            raise KeyError(f"{secret_name} no se precargó en el arranque ni tiene valor local")
+        self.values[secret_name] = value
+        return value
+
+    def on_rotation(self, listener: RotationListener) -> None:
+        """Registra una corrutina que recibe los nombres de los secretos cuyo valor cambió"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    async def refresh(self) -> Set[str]:
+        """Vuelve a leer los secretos conocidos; conserva el valor anterior si la lectura falla"""
+        self._file_values = None
+        changed = set()
+        for name, value in (await self._resolve(list(self.values) + self.missing)).items():
+            if isinstance(value, BaseException):
+                logger.warning(f"No se pudo refrescar el secreto {name}: {str(value)}")
+                continue
+            if name in self.missing:
+                self.missing.remove(name)
+            if self.values.get(name) != value:
+                changed.add(name)
+                self.values[name] = value
+        self.stats["refreshes"] += 1
+        self.last_refresh = time.monotonic()
+        if changed:
+            self.stats["rotations"] += len(changed)
+            logger.info(f"Secretos rotados: {', '.join(sorted(changed))}")
+            for listener in self._listeners:
+                try:
+                    await listener(changed)
+                except Exception as e:
+                    logger.error(f"Error aplicando la rotación de secretos: {str(e)}")
+        return changed
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SECRETS_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refrescando secretos: {str(e)}")
+
+    def start_refresh(self) -> None:
+        if self._refresh_task is None and SECRETS_REFRESH_INTERVAL > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        for resource in (self._async_client, self._async_credential):
+            if resource is not None:
+                await resource.close()
+        self._async_client = self._async_credential = None
+
+    def source_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for name in self.values:
+            source = self.sources.get(name, "manual")
+            counts[source] = counts.get(source, 0) + 1
+        return counts
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "vault_url": None if SECRETS_OFFLINE else KEY_VAULT_URL,
+            "offline": SECRETS_OFFLINE,
+            "cold_start_ms": self.cold_start_ms,
+            "loaded": len(self.values),
+            "missing": list(self.missing),
+            "sources": self.source_counts(),
+            "refresh_interval_s": SECRETS_REFRESH_INTERVAL,
+            "last_refresh_age_s": round(time.monotonic() - self.last_refresh, 1) if self.last_refresh else None,
+            **self.stats
+        }
+
+
+config = SecureConfig()
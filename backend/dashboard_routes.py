@@ -1,53 +1,134 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Response
 from typing import List
 from datetime import datetime, timedelta
-from backend.models import *
-from backend.database import get_analytics_container, get_rejected_container
+from backend.models import CategoryMetric, DashboardMetrics, HistoricalData, IssueMetric
+from backend.cache import StaleWhileRevalidateCache
+from backend.database import STORAGE_BACKEND, get_analytics_container, get_rejected_container, iter_query_pages
+from backend.analytics_store import analytics_store
+from backend.aggregation import ColumnarAggregator
+from backend.rollups import (
+    ROLLUP_VALUE_KEYS, SAFETY_FIELDS, SCORE_FIELDS, SENTIMENT_FIELDS, average, merge_rollup, read_rollups
+)
+import asyncio
 import logging
+import os
 from collections import defaultdict
 
 router = APIRouter(prefix="/dashboard")
 logger = logging.getLogger(__name__)
 
+# "rollups": agregados diarios (O(días)); "local": GROUP BY sobre la copia plana del almacén analítico;
+# "raw": documentos de Analytics (O(documentos))
+DASHBOARD_SOURCE = os.getenv("DASHBOARD_SOURCE", "local" if STORAGE_BACKEND == "sqlite" else "rollups")
+
+# Métricas del dashboard: frescas durante el TTL y servidas caducadas mientras se recalculan
+dashboard_cache = StaleWhileRevalidateCache(
+    ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "30")),
+    max_stale=float(os.getenv("DASHBOARD_CACHE_MAX_STALE", "300"))
+)
+
 async def execute_query(query: str, params: list = None, container_name: str = "analytics"):
     try:
         container = get_analytics_container() if container_name == "analytics" else get_rejected_container()
-        return list(container.query_items(
+        return [item async for item in container.query_items(
             query=query,
-            parameters=params or [],
-            enable_cross_partition_query=True
-        ))
+            parameters=params or []
+        )]
     except Exception as e:
         logger.error(f"Cosmos DB Error: {str(e)}")
-        raise HTTPException(500, "Database operation failed")
+        raise HTTPException(500, "Database operation failed") from e
+
+def metrics_from_rollups(rollups: dict) -> DashboardMetrics:
+    total = {}
+    for rollup in rollups.values():
+        merge_rollup(total, {k: v for k, v in rollup.items() if k in ROLLUP_VALUE_KEYS})
+    scores = average(total, "scores", SCORE_FIELDS)
+
+    def count_since(days: int) -> int:
+        start = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+        return sum(rollup.get("count", 0) for date, rollup in rollups.items() if date >= start)
+
+    return DashboardMetrics(
+        totalPrompts=total.get("count", 0),
+        totalIssuesDetected=total.get("issues_total", 0),
+        avgSafetyScore=scores["safety"],
+        avgFairnessScore=scores["fairness"],
+        avgInclusivityScore=scores["inclusivity"],
+        promptsLastWeek=count_since(7),
+        promptsLastMonth=count_since(30),
+        percentChangeWeek=0.0,
+        percentChangeMonth=0.0,
+        topCategories=[CategoryMetric(category=k, count=v) for k, v in
+                      sorted(total.get("categories", {}).items(), key=lambda x: x[1], reverse=True)[:6]]
+    )
+
+def historical_from_rollups(rollups: dict) -> HistoricalData:
+    issue_counts = defaultdict(int)
+    for rollup in rollups.values():
+        for key, count in rollup.get("issues", {}).items():
+            issue_counts[tuple(key.split("|", 1))] += count
+
+    return HistoricalData(
+        promptVolume=[{"date": date, "count": rollup.get("count", 0)} for date, rollup in rollups.items()],
+        scoresTrend=[{"date": date, **average(rollup, "scores", SCORE_FIELDS)} for date, rollup in rollups.items()],
+        sentimentTrend=[
+            {"date": date, **average(rollup, "sentiment", SENTIMENT_FIELDS)} for date, rollup in rollups.items()
+        ],
+        contentSafetyTrend=[
+            {"date": date, **average(rollup, "content_safety", SAFETY_FIELDS)} for date, rollup in rollups.items()
+        ],
+        topIssues=[
+            IssueMetric(type=k[0], severity=k[1] if len(k) > 1 else "medium", count=v)
+            for k, v in sorted(issue_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+        ]
+    )
 
 @router.get("/metrics", response_model=DashboardMetrics)
-async def get_dashboard_metrics():
+async def get_dashboard_metrics(response: Response):
+    metrics, age = await dashboard_cache.get("metrics", compute_dashboard_metrics)
+    response.headers["X-Cache-Age"] = str(int(age))
+    response.headers["Cache-Control"] = f"max-age={max(int(dashboard_cache.ttl - age), 0)}"
+    return metrics
+
+async def compute_dashboard_metrics() -> DashboardMetrics:
+    if DASHBOARD_SOURCE in ("rollups", "local"):
+        try:
+            rollups = await (analytics_store.daily_rollups() if DASHBOARD_SOURCE == "local" else read_rollups())
+            return metrics_from_rollups(rollups)
+        except Exception as e:
+            logger.warning(f"Agregados no disponibles, usando documentos de Analytics: {str(e)}")
+    return await get_raw_dashboard_metrics()
+
+async def get_raw_dashboard_metrics():
     try:
-        total_query = "SELECT VALUE COUNT(1) FROM c"
-        total_prompts = (await execute_query(total_query))[0] or 0
+        async def get_value(query: str, params: list = None):
+            return (await execute_query(query, params))[0] or 0
 
         async def get_avg(field: str):
-            result = (await execute_query(f"SELECT VALUE AVG(c.analysis.{field}) FROM c"))[0]
+            result = await get_value(f"SELECT VALUE AVG(c.analysis.{field}) FROM c")
             return round(float(result or 0), 2)
 
-        avg_safety = await get_avg("safety_score")
-        avg_fairness = await get_avg("fairness_score")
-        avg_inclusivity = await get_avg("inclusivity_score")
-
         async def get_count(days: int):
-            return (await execute_query(
+            return await get_value(
                 "SELECT VALUE COUNT(1) FROM c WHERE c.timestamp >= @startDate",
                 [{"name": "@startDate", "value": (datetime.utcnow() - timedelta(days=days)).isoformat()}]
-            ))[0] or 0
-
-        week_count = await get_count(7)
-        month_count = await get_count(30)
-
-        total_issues = (await execute_query("SELECT VALUE SUM(ARRAY_LENGTH(c.analysis.issues)) FROM c"))[0] or 0
+            )
+
+        # Consultas independientes en paralelo sobre el cliente compartido
+        (total_prompts, avg_safety, avg_fairness, avg_inclusivity,
+         week_count, month_count, total_issues, key_phrases) = await asyncio.gather(
+            get_value("SELECT VALUE COUNT(1) FROM c"),
+            get_avg("safety_score"),
+            get_avg("fairness_score"),
+            get_avg("inclusivity_score"),
+            get_count(7),
+            get_count(30),
+            get_value("SELECT VALUE SUM(ARRAY_LENGTH(c.analysis.issues)) FROM c"),
+            execute_query("SELECT c.metadata.text_analytics.key_phrases FROM c")
+        )
 
         category_counts = defaultdict(int)
-        for item in await execute_query("SELECT c.metadata.text_analytics.key_phrases FROM c"):
+        for item in key_phrases:
             if item.get("key_phrases"):
                 category_counts[item["key_phrases"][0]] += 1
 
@@ -66,102 +147,68 @@ async def get_dashboard_metrics():
         )
     except Exception as e:
         logger.error(f"Metrics error: {str(e)}")
-        raise HTTPException(500, "Error generating metrics")
-
-def safe_aggregate(data: List[dict], fields: List[str]) -> List[dict]:
-    grouped = defaultdict(lambda: {f: [] for f in fields})
-    for item in data:
-        date = item.get("date", "")
-        for field in fields:
-            value = item.get(field, 0.0)
-            if isinstance(value, (int, float)):
-                grouped[date][field].append(float(value))
-    return [
-        {
-            "date": date,
-            **{field: round(sum(values)/len(values), 2) if values else 0.0 for field, values in fields_data.items()}
-        }
-        for date, fields_data in grouped.items()
-    ]
+        raise HTTPException(500, "Error generating metrics") from e
+
+PERIOD_DAYS = {"week": 7, "month": 30, "quarter": 90, "year": 365}
 
 @router.get("/historical", response_model=HistoricalData)
 async def get_historical_data(period: str = Query("week")):
+    if DASHBOARD_SOURCE in ("rollups", "local"):
+        days = PERIOD_DAYS.get(period, 7)
+        try:
+            rollups = await (analytics_store.daily_rollups(days) if DASHBOARD_SOURCE == "local" else read_rollups(days))
+            return historical_from_rollups(rollups)
+        except Exception as e:
+            logger.warning(f"Agregados no disponibles, usando documentos de Analytics: {str(e)}")
+    return await get_raw_historical_data(period)
+
+# Solo los campos que usa la agregación; variants, ambigüedad y el resto de metadatos no viajan
+HISTORICAL_PROJECTION_QUERY = """
+SELECT c.timestamp,
+    {"safety_score": c.analysis.safety_score, "fairness_score": c.analysis.fairness_score,
+     "inclusivity_score": c.analysis.inclusivity_score, "issues": c.analysis.issues} AS analysis,
+    {"text_analytics": {"sentiment": c.metadata.text_analytics.sentiment,
+                        "key_phrases": c.metadata.text_analytics.key_phrases},
+     "safety": c.metadata.safety} AS metadata
+FROM c
+WHERE c.timestamp >= @startDate
+"""
+
+async def aggregate_raw_history(days: int, stats: dict = None) -> dict:
+    """Agrega los documentos de la ventana página a página: memoria O(días), no O(documentos)"""
+    start = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+    aggregator = ColumnarAggregator()
+    async for page in iter_query_pages(
+        get_analytics_container(), HISTORICAL_PROJECTION_QUERY,
+        [{"name": "@startDate", "value": start}], stats=stats
+    ):
+        aggregator.add(page)
+    return aggregator.rollups()
+
+async def get_raw_historical_data(period: str):
     try:
-        days = {"week": 7, "month": 30, "quarter": 90, "year": 365}.get(period, 7)
-        all_data = await execute_query("SELECT * FROM c")
-        
-        date_set = set()
-        base_data = []
-        sentiment_data = []
-        safety_data = []
-        issue_counts = defaultdict(int)
-
-        for doc in all_data:
-            try:
-                date = doc["timestamp"][:10]
-                date_set.add(date)
-                
-                analysis = doc.get("analysis", {})
-                metadata = doc.get("metadata", {})
-                text_analytics = metadata.get("text_analytics", {})
-                safety = metadata.get("safety", {})
-
-                base_data.append({
-                    "date": date,
-                    "safety": analysis.get("safety_score", 0.0),
-                    "fairness": analysis.get("fairness_score", 0.0),
-                    "inclusivity": analysis.get("inclusivity_score", 0.0)
-                })
-
-                sentiment = text_analytics.get("sentiment", {}).get("scores", {})
-                sentiment_data.append({
-                    "date": date,
-                    "positive": sentiment.get("positive", 0.0),
-                    "neutral": sentiment.get("neutral", 0.0),
-                    "negative": sentiment.get("negative", 0.0)
-                })
-
-                safety_data.append({
-                    "date": date,
-                    "hate": safety.get("Hate", 0.0),
-                    "selfHarm": safety.get("SelfHarm", 0.0),
-                    "sexual": safety.get("Sexual", 0.0),
-                    "violence": safety.get("Violence", 0.0)
-                })
-
-                for issue in analysis.get("issues", []):
-                    key = (issue.get("type", "unknown"), issue.get("severity", "medium"))
-                    issue_counts[key] += 1
-            except KeyError as e:
-                logger.warning(f"Documento incompleto: {str(e)}")
-
-        processed_volume = [
-            {"date": date, "count": sum(1 for d in base_data if d["date"] == date)}
-            for date in sorted(date_set)
-        ]
-
-        return HistoricalData(
-            promptVolume=processed_volume,
-            scoresTrend=safe_aggregate(base_data, ["safety", "fairness", "inclusivity"]),
-            sentimentTrend=safe_aggregate(sentiment_data, ["positive", "neutral", "negative"]),
-            contentSafetyTrend=safe_aggregate(safety_data, ["hate", "selfHarm", "sexual", "violence"]),
-            topIssues=[
-                IssueMetric(type=k[0], severity=k[1], count=v)
-                for k, v in sorted(issue_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-            ]
+        stats = {}
+        history = historical_from_rollups(await aggregate_raw_history(PERIOD_DAYS.get(period, 7), stats))
+        logger.info(
+            f"Histórico {period}: {stats.get('documents', 0)} documentos en {stats.get('pages', 0)} páginas, "
+            f"{stats.get('request_charge', 0.0):.1f} RU"
         )
+        return history
     except Exception as e:
         logger.error(f"Historical data error: {str(e)}")
-        raise HTTPException(500, "Error generating historical data")
+        raise HTTPException(500, "Error generating historical data") from e
 
 @router.get("/rejected-prompts", response_model=List[dict])
 async def get_rejected_prompts(limit: int = Query(10)):
     try:
-        results = await execute_query(
-            "SELECT TOP @limit * FROM c WHERE c.status = 'rejected'",
-            [{"name": "@limit", "value": limit}],
-            "rejected"
-        )
+        if DASHBOARD_SOURCE == "local":
+            results = await analytics_store.rejected_prompts(limit)
+        else:
+            results = await execute_query(
+                "SELECT TOP @limit * FROM c WHERE c.status = 'rejected'",
+                [{"name": "@limit", "value": limit}],
+                "rejected"
+            )
         return [{
             "id": item["id"],
             "timestamp": item["timestamp"],
@@ -170,4 +217,4 @@ async def get_rejected_prompts(limit: int = Query(10)):
         } for item in results]
     except Exception as e:
         logger.error(f"Rejected prompts error: {str(e)}")
-        raise HTTPException(500, "Error retrieving rejected prompts")
\ No newline at end of file
+        raise HTTPException(500, "Error retrieving rejected prompts") from e
\ No newline at end of file
@@ -1,18 +1,236 @@
-from azure.cosmos import CosmosClient
-from backend.main import config 
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from backend.clients import azure_clients
+
+logger = logging.getLogger(__name__)
+
+# "cosmos": Azure Cosmos DB; "sqlite": almacén local embebido sin red (desarrollo y pruebas)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cosmos").lower()
+COSMOS_DATABASE = os.getenv("COSMOS_DATABASE", "PromptAnalysis")
+# Contenedores gestionados: clave lógica -> nombre en Cosmos
+COSMOS_CONTAINERS = {
+    "analytics": "Analytics",
+    "rejected": "RejectedPrompts",
+    "feedback": "Feedback",
+    "variants": "PromptVariants",
+    "rollups": os.getenv("ROLLUPS_CONTAINER", "DailyRollups")
+}
+COSMOS_HEALTH_PROBE_INTERVAL = float(os.getenv("COSMOS_HEALTH_PROBE_INTERVAL", "30"))
+COSMOS_HEALTH_PROBE_TIMEOUT = float(os.getenv("COSMOS_HEALTH_PROBE_TIMEOUT", "5"))
+
+# Documentos por página en las consultas recorridas con tokens de continuación
+QUERY_PAGE_SIZE = int(os.getenv("COSMOS_QUERY_PAGE_SIZE", "500"))
+
+# Operaciones puntuales que se miden por contenedor
+TIMED_OPERATIONS = ("read_item", "create_item", "upsert_item", "replace_item", "delete_item", "patch_item")
+
+
+class ContainerStats:
+    """Peticiones, errores y latencia acumulada de un contenedor"""
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.total_ms = defaultdict(float)
+        self.query_pages = 0
+
+    def record(self, operation: str, elapsed_ms: float, failed: bool = False) -> None:
+        self.requests[operation] += 1
+        self.total_ms[operation] += elapsed_ms
+        if failed:
+            self.errors[operation] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "query_pages": self.query_pages,
+            "operations": {
+                operation: {
+                    "requests": self.requests[operation],
+                    "errors": self.errors[operation],
+                    "avg_ms": round(self.total_ms[operation] / self.requests[operation], 2)
+                }
+                for operation in self.requests
+            }
+        }
+
+
+class InstrumentedContainer:
+    """Envuelve un ContainerProxy asíncrono contando peticiones y latencia; el resto se delega"""
+
+    def __init__(self, container, stats: ContainerStats):
+        self._container = container
+        self._stats = stats
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._container, name)
+        if name not in TIMED_OPERATIONS:
+            return attribute
+
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                return await attribute(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._stats.record(name, (time.perf_counter() - start) * 1000, failed)
+
+        return timed
+
+    def query_items(self, *args, **kwargs):
+        """Cada página recibida cuenta como una petición; la latencia es la de la primera página"""
+        start = time.perf_counter()
+        user_hook = kwargs.pop("response_hook", None)
+        first_page = True
+
+        def on_response(headers, result):
+            nonlocal first_page
+            self._stats.query_pages += 1
+            if first_page:
+                self._stats.record("query_items", (time.perf_counter() - start) * 1000)
+                first_page = False
+            if user_hook is not None:
+                user_hook(headers, result)
+
+        return self._container.query_items(*args, response_hook=on_response, **kwargs)
+
+
+class CosmosConnectionManager:
+    """Un único cliente Cosmos con handles de contenedor en caché, métricas y sonda de salud en segundo plano
+
+    Con STORAGE_BACKEND=sqlite el cliente es el almacén local, con la misma interfaz de contenedores.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._database = None
+        self._containers: Dict[str, InstrumentedContainer] = {}
+        self.stats: Dict[str, ContainerStats] = defaultdict(ContainerStats)
+        self.health: Dict[str, Any] = {"status": "unknown", "checked_at": None, "latency_ms": None, "error": None}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self):
+        client = self._local_client() if STORAGE_BACKEND == "sqlite" else azure_clients.cosmos
+        if client is not self._client:
+            # Cliente nuevo (arranque o reconexión): los handles anteriores ya no son válidos
+            self._client = client
+            self._database = client.get_database_client(COSMOS_DATABASE)
+            self._containers.clear()
+        return client
+
+    def _local_client(self):
+        # Importación diferida: analytics_store depende de rollups, que a su vez importa este módulo
+        from backend.analytics_store import LocalClient, analytics_store
+
+        if not isinstance(self._client, LocalClient):
+            return LocalClient(analytics_store, {name: key for key, name in COSMOS_CONTAINERS.items()})
+        return self._client
+
+    @property
+    def database(self):
+        # Leer client renueva _database si el cliente cambió desde el último acceso
+        _ = self.client
+        return self._database
+
+    def container(self, key: str) -> InstrumentedContainer:
+        database = self.database
+        if key not in self._containers:
+            self._containers[key] = InstrumentedContainer(
+                database.get_container_client(COSMOS_CONTAINERS[key]), self.stats[key]
+            )
+        return self._containers[key]
+
+    async def probe(self) -> Dict[str, Any]:
+        """Lectura ligera de la base de datos; actualiza el estado que expone /health"""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.database.read(), timeout=COSMOS_HEALTH_PROBE_TIMEOUT)
+            self.health = {"status": "connected", "error": None}
+        except Exception as e:
+            logger.warning(f"Sonda de salud de Cosmos DB fallida: {str(e)}")
+            self.health = {"status": "unavailable", "error": str(e)}
+        self.health["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        self.health["checked_at"] = datetime.utcnow().isoformat()
+        return self.health
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(COSMOS_HEALTH_PROBE_INTERVAL)
+
+    def start_health_probe(self) -> None:
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        if STORAGE_BACKEND == "sqlite" and self._client is not None:
+            await self._client.close()
+        self._client = self._database = None
+        self._containers.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": STORAGE_BACKEND,
+            "database": COSMOS_DATABASE,
+            "health": self.health,
+            "containers": {key: stats.snapshot() for key, stats in self.stats.items()}
+        }
+
+
+cosmos_connections = CosmosConnectionManager()
 
 def get_cosmos_client():
-    return CosmosClient(
-        config.get_secret_cached("COSMOS-ENDPOINT"),
-        credential=config.get_secret_cached("COSMOS-kEY")
-    )
+    return cosmos_connections.client
 
 def get_analytics_container():
-    client = get_cosmos_client()
-    database = client.get_database_client("PromptAnalysis")
-    return database.get_container_client("Analytics")
+    return cosmos_connections.container("analytics")
 
 def get_rejected_container():
-    client = get_cosmos_client()
-    database = client.get_database_client("PromptAnalysis")
-    return database.get_container_client("RejectedPrompts")
\ No newline at end of file
+    return cosmos_connections.container("rejected")
+
+def get_feedback_container():
+    return cosmos_connections.container("feedback")
+
+def get_variants_container():
+    return cosmos_connections.container("variants")
+
+def get_rollups_container():
+    return cosmos_connections.container("rollups")
+
+async def iter_query_pages(container, query: str, parameters: Optional[list] = None,
+                           page_size: int = QUERY_PAGE_SIZE,
+                           stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[List[dict]]:
+    """Recorre una consulta página a página; solo una página vive en memoria. stats acumula RU y páginas"""
+    def on_response(headers, _):
+        if stats is not None:
+            stats["request_charge"] = stats.get("request_charge", 0.0) + float(headers.get("x-ms-request-charge", 0) or 0)
+
+    pager = container.query_items(
+        query=query,
+        parameters=parameters or [],
+        max_item_count=page_size,
+        response_hook=on_response
+    ).by_page()
+    async for page in pager:
+        items = [item async for item in page]
+        if stats is not None:
+            stats["pages"] = stats.get("pages", 0) + 1
+            stats["documents"] = stats.get("documents", 0) + len(items)
+        logger.debug(f"Página de {len(items)} documentos, continuación: {bool(pager.continuation_token)}")
+        yield items
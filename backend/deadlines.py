@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, List, Optional
+
+from backend.telemetry import DEGRADED_STAGES
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto por defecto por debajo de los 30 s tras los que el frontend abandona la petición
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "25000"))
+REQUEST_DEADLINE_MAX_MS = int(os.getenv("REQUEST_DEADLINE_MAX_MS", "120000"))
+REQUEST_DEADLINE_MIN_MS = 500
+# Margen final para auditoría y serialización de la respuesta
+DEADLINE_RESERVE_MS = int(os.getenv("DEADLINE_RESERVE_MS", "300"))
+
+# Fracción máxima del presupuesto total por etapa (las etapas en paralelo comparten ventana)
+STAGE_BUDGET_SHARES = {
+    "content_safety": 0.3,
+    "text_analytics": 0.4,
+    "key_phrases": 0.3,
+    "opinion_mining": 0.3,
+    "ambiguity": 0.6,
+    "variants": 0.6,
+    "improved_prompt": 0.9,
+    "fused_analysis": 0.9
+}
+
+
+class DeadlineExceeded(Exception):
+    """Una etapa imprescindible no terminó dentro de su parte del presupuesto"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Plazo agotado en la etapa {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Presupuesto de latencia de una petición"""
+
+    def __init__(self, budget_ms: int):
+        self.budget = budget_ms / 1000
+        self.expires_at = time.monotonic() + self.budget
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def stage_timeout(self, stage: str) -> float:
+        share = STAGE_BUDGET_SHARES.get(stage, 1.0)
+        return max(min(self.budget * share, self.remaining() - DEADLINE_RESERVE_MS / 1000), 0.0)
+
+
+deadline_var: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+# Etapas omitidas por plazo o por fallo en la petición (o elemento de lote) en curso, haya plazo o no
+degraded_var: ContextVar[Optional[List[str]]] = ContextVar("degraded_stages", default=None)
+
+
+def resolve_budget_ms(*candidates: Optional[int]) -> int:
+    """Primer presupuesto indicado (campo o cabecera) acotado a los límites del servicio"""
+    budget = next((c for c in candidates if c), REQUEST_DEADLINE_MS)
+    return min(max(int(budget), REQUEST_DEADLINE_MIN_MS), REQUEST_DEADLINE_MAX_MS)
+
+
+@contextmanager
+def degradation_scope(inherited: Optional[List[str]] = None):
+    """Lista propia de etapas degradadas; inherited son las ya marcadas en una parte común (p. ej. de un lote)"""
+    stages = list(inherited or [])
+    token = degraded_var.set(stages)
+    try:
+        yield stages
+    finally:
+        degraded_var.reset(token)
+
+
+@contextmanager
+def request_deadline(budget_ms: int):
+    deadline = Deadline(budget_ms)
+    token = deadline_var.set(deadline)
+    try:
+        with degradation_scope():
+            yield deadline
+    finally:
+        deadline_var.reset(token)
+
+
+def deadline_bucket() -> Optional[int]:
+    """Presupuesto de la petición en curso redondeado al segundo: solo comparten análisis plazos parecidos"""
+    deadline = deadline_var.get()
+    return math.ceil(deadline.budget) if deadline is not None else None
+
+
+def mark_degraded(stage: str) -> None:
+    stages = degraded_var.get()
+    if stages is None:
+        # Sin ámbito la degradación no llegaría a la respuesta y el resultado parcial acabaría en caché
+        logger.warning(f"Etapa {stage} degradada fuera de un ámbito de degradación")
+        DEGRADED_STAGES.labels(stage=stage).inc()
+    elif stage not in stages:
+        stages.append(stage)
+        DEGRADED_STAGES.labels(stage=stage).inc()
+
+
+def degraded_stages() -> List[str]:
+    stages = degraded_var.get()
+    return list(stages) if stages is not None else []
+
+
+async def run_stage(stage: str, awaitable: Awaitable, optional: bool = False, fallback: Any = None) -> Any:
+    """Ejecuta una etapa dentro de su parte del presupuesto; sin plazo activo se espera sin límite.
+
+    Una etapa opcional devuelve fallback y queda marcada como degradada; una imprescindible lanza
+    DeadlineExceeded. Agotar el plazo no cuenta para los circuitos: el presupuesto lo elige el cliente y la
+    llamada cancelada no dice nada de la salud de la dependencia (los timeouts del transporte sí cuentan).
+    """
+    deadline = deadline_var.get()
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, deadline.stage_timeout(stage))
+    except asyncio.TimeoutError:
+        if not optional:
+            raise DeadlineExceeded(stage) from None
+        logger.warning(f"Etapa {stage} omitida: plazo agotado")
+        mark_degraded(stage)
+        return fallback
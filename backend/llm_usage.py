@@ -0,0 +1,51 @@
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Dict
+
+# Modo de análisis LLM de la petición en curso ("split" o "fused")
+analysis_mode_var: ContextVar[str] = ContextVar("analysis_mode", default="split")
+
+
+class LLMUsageStats:
+    """Latencia y tokens por modo de análisis para comparar el modo dividido con el fusionado"""
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.latency_ms = defaultdict(float)
+        self.completions = defaultdict(int)
+        self.prompt_tokens = defaultdict(int)
+        self.completion_tokens = defaultdict(int)
+        self.fallbacks = 0
+
+    def record_completion(self, usage) -> None:
+        mode = analysis_mode_var.get()
+        self.completions[mode] += 1
+        if usage is not None:
+            self.prompt_tokens[mode] += usage.prompt_tokens or 0
+            self.completion_tokens[mode] += usage.completion_tokens or 0
+
+    def record_request(self, mode: str, elapsed_ms: float) -> None:
+        self.requests[mode] += 1
+        self.latency_ms[mode] += elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        modes = set(self.requests) | set(self.completions)
+        return {
+            "fused_fallbacks": self.fallbacks,
+            "modes": {
+                mode: {
+                    "requests": self.requests[mode],
+                    "completions": self.completions[mode],
+                    "avg_llm_latency_ms": round(self.latency_ms[mode] / self.requests[mode], 2) if self.requests[mode] else 0.0,
+                    "prompt_tokens": self.prompt_tokens[mode],
+                    "completion_tokens": self.completion_tokens[mode],
+                    "avg_tokens_per_request": round(
+                        (self.prompt_tokens[mode] + self.completion_tokens[mode]) / self.requests[mode], 1
+                    ) if self.requests[mode] else 0.0
+                }
+                for mode in sorted(modes)
+            }
+        }
+
+
+llm_usage_stats = LLMUsageStats()
@@ -1,30 +1,76 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
-from typing import List, Literal, Optional, Dict, Any, Union
+from pydantic import BaseModel, Field, PrivateAttr, validator
+from typing import List, Literal, Optional, Any, Tuple, Union, Awaitable, Callable, AsyncIterator
 import json
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
 import uuid
 import logging
 import hashlib
-from functools import lru_cache
+from contextlib import asynccontextmanager
 import asyncio
-import re
-
-# Azure SDKs
-from azure.cosmos import CosmosClient
-from azure.ai.contentsafety import ContentSafetyClient
-from azure.ai.contentsafety.models import AnalyzeTextOptions
-from azure.ai.textanalytics import TextAnalyticsClient
-from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
-from openai import AzureOpenAI
+import time
+
+# Los SDK de Azure y OpenAI se importan en backend.clients al crear cada cliente (arranque o primer uso)
 
 # Optimización
-from tenacity import retry, stop_after_attempt, wait_exponential
-from aiocache import Cache, cached
-from aiocache.serializers import JsonSerializer
+from tenacity import retry, retry_if_exception, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+from backend.config import config
+from backend.clients import azure_clients
+from backend.database import (
+    STORAGE_BACKEND,
+    cosmos_connections,
+    get_analytics_container,
+    get_feedback_container,
+    get_rejected_container,
+    get_variants_container
+)
+from backend.cache import analysis_cache, analysis_cache_key, config_fingerprint
+from backend.text_analytics import analyze_text_features_batch, text_analytics_stats
+from backend.speculation import SpeculativeStage, speculation_stats
+from backend.streaming import JsonStringFieldStream, sse_event
+from backend.llm_usage import analysis_mode_var, llm_usage_stats
+from backend.prescreen import PRESCREEN_ENABLED, PrescreenHit, prescreener
+from backend.rollups import record_rollup
+from backend.audit_writer import audit_writer
+from backend.analytics_store import analytics_store
+from backend.coalescing import COALESCE_ENABLED, analysis_flights
+from backend.near_duplicates import NEAR_DUPLICATE_ENABLED, NearDuplicateHit, near_duplicates
+from backend.pii import pii_detector, redact_spans
+from backend.rejected_filter import REJECTED_FILTER_ENABLED, prompt_hash, rejected_prompts_filter
+from backend.circuit_breakers import CircuitOpenError, breakers_snapshot, circuit_breakers
+from backend.deadlines import (
+    REQUEST_DEADLINE_MAX_MS,
+    REQUEST_DEADLINE_MIN_MS,
+    DeadlineExceeded,
+    deadline_bucket,
+    degradation_scope,
+    degraded_stages,
+    mark_degraded,
+    request_deadline,
+    resolve_budget_ms,
+    run_stage
+)
+from backend.rate_limits import (
+    RateLimitExceeded,
+    content_safety_limiter,
+    estimate_tokens,
+    limiters_snapshot,
+    openai_limiter,
+    wait_retry_after
+)
+from backend.telemetry import (
+    REQUEST_LATENCY,
+    count_retry,
+    prometheus_payload,
+    server_timing_header,
+    stage_timings_var,
+    stages_snapshot,
+    timed_stage
+)
 
 # Configuración de logging
 logging.basicConfig(
@@ -33,25 +79,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ========== Configuración Segura ==========
-class SecureConfig:
-    def __init__(self):
-        self.credential = DefaultAzureCredential()
-        self.secret_client = SecretClient(
-            vault_url="https://keyvaultgrupo12.vault.azure.net/",
-            credential=self.credential
-        )
-    
-    @lru_cache(maxsize=1)
-    def get_secret_cached(self, secret_name: str) -> str:
-        try:
-            return self.secret_client.get_secret(secret_name).value
-        except Exception as e:
-            logger.error(f"Error obteniendo secreto {secret_name}: {str(e)}")
-            raise
-
-config = SecureConfig()
-
 # Umbrales de seguridad
 SAFETY_THRESHOLDS = {
     "Hate": 4,
@@ -65,28 +92,112 @@ AMBIGUITY_THRESHOLD = 0.6
 COMPLETENESS_THRESHOLD = 0.7
 CLARITY_THRESHOLD = 0.7
 
-# ========== Clientes con Conexiones Persistentes ==========
-@lru_cache(maxsize=1)
-def get_cosmos_client():
-    return CosmosClient(
-        config.get_secret_cached("COSMOS-ENDPOINT"),
-        credential=config.get_secret_cached("COSMOS-kEY")
-    )
+# Ambigüedad neutra cuando el análisis falla o se omite
+DEFAULT_AMBIGUITY = {
+    "ambiguity_score": 0.5,
+    "clarity_score": 0.5,
+    "completeness_score": 0.5,
+    "ambiguous_terms": [],
+    "missing_context": [],
+    "improvement_suggestions": []
+}
+
+# Modo de análisis LLM por defecto: "split" (tres llamadas) o "fused" (una llamada estructurada)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "split")
+
+# Modo especulativo por defecto (se puede elegir por petición)
+SPECULATIVE_PIPELINE = os.getenv("SPECULATIVE_PIPELINE", "false").lower() == "true"
+
+# Concurrencia del modo batch
+CONTENT_SAFETY_CONCURRENCY = int(os.getenv("CONTENT_SAFETY_CONCURRENCY", "8"))
+BATCH_ANALYSIS_CONCURRENCY = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+# ========== System Prompts ==========
+AMBIGUITY_SYSTEM_PROMPT = """Analiza este prompt para determinar su nivel de ambigüedad, claridad y completitud.
+                Devuelve SOLO un JSON válido con el siguiente formato:
+                {
+                    "ambiguity_score": float entre 0-1 (donde 0 es nada ambiguo y 1 es extremadamente ambiguo),  
+                    "clarity_score": float entre 0-1 (donde 0 es nada claro y 1 es perfectamente claro),
+                    "completeness_score": float entre 0-1 (donde 0 es muy incompleto y 1 es totalmente completo),
+                    "ambiguous_terms": ["lista", "de", "términos", "ambiguos"],
+                    "missing_context": ["lista", "de", "contexto", "faltante"],
+                    "improvement_suggestions": ["Lista", "de", "sugerencias", "concretas"]
+                }"""
+
+IMPROVED_PROMPT_SYSTEM_PROMPT = """Analiza el prompt y devuelve SOLO un JSON válido con:
+                        {
+                            "improved_prompt": "string con prompt mejorado",
+                            "safety_score": 0.0-1.0,
+                            "fairness_score": 0.0-1.0,
+                            "inclusivity_score": 0.0-1.0,
+                            "improvement_explanation": "explicación detallada de los cambios realizados",
+                            "issues": [
+                                {"type": "fairness" | "safety" | "privacy" | "inclusiveness" | "bias" | "ambiguity" | "clarity" | "completeness" | "other",
+                                "severity": "low" | "medium" | "high",
+                                "description": "...",
+                                "mitigation": "..."}
+                            ]
+                        }"""
+
+VARIANTS_SYSTEM_PROMPT = """Genera 3 variantes mejoradas del prompt proporcionado.
+        Cada variante debe optimizar:
+        1. Claridad: Reducir ambigüedad y ser específico
+        2. Estructura: Mejorar la organización de la solicitud
+        3. Especificidad: Incluir detalles relevantes
+        
+        Devuelve SOLO un JSON válido con el siguiente formato:
+        {
+            "variants": [
+                {
+                    "variant_text": "texto de la variante 1",
+                    "quality_score": float entre 0-1,
+                    "clarity_score": float entre 0-1,
+                    "specificity_score": float entre 0-1,
+                    "explanation": "explicación de las mejoras"
+                },
+                ...
+            ]
+        }"""
+
+FUSED_ANALYSIS_SYSTEM_PROMPT = """Analiza el prompt en una sola pasada (ambigüedad, mejora y problemas) y devuelve SOLO un JSON válido con:
+        {
+            "improved_prompt": "string con prompt mejorado",
+            "safety_score": 0.0-1.0,
+            "fairness_score": 0.0-1.0,
+            "inclusivity_score": 0.0-1.0,
+            "improvement_explanation": "explicación detallada de los cambios realizados",
+            "issues": [
+                {"type": "fairness" | "safety" | "privacy" | "inclusiveness" | "bias" | "ambiguity" | "clarity" | "completeness" | "other",
+                "severity": "low" | "medium" | "high",
+                "description": "...",
+                "mitigation": "..."}
+            ],
+            "ambiguity": {
+                "ambiguity_score": float entre 0-1 (donde 0 es nada ambiguo y 1 es extremadamente ambiguo),
+                "clarity_score": float entre 0-1 (donde 0 es nada claro y 1 es perfectamente claro),
+                "completeness_score": float entre 0-1 (donde 0 es muy incompleto y 1 es totalmente completo),
+                "ambiguous_terms": ["lista", "de", "términos", "ambiguos"],
+                "missing_context": ["lista", "de", "contexto", "faltante"],
+                "improvement_suggestions": ["Lista", "de", "sugerencias", "concretas"]
+            },
+            "variants": []
+        }"""
+
+FUSED_VARIANTS_INSTRUCTIONS = """
+        Incluye además en "variants" 3 variantes mejoradas del prompt, cada una con:
+        {"variant_text": "...", "quality_score": float entre 0-1, "clarity_score": float entre 0-1,
+        "specificity_score": float entre 0-1, "explanation": "explicación de las mejoras"}"""
 
-@lru_cache(maxsize=1)
+# ========== Clientes con Conexiones Persistentes ==========
 def get_openai_client():
-    return AzureOpenAI(
-        azure_endpoint=config.get_secret_cached("AZURE-OPENAI-ENDPOINT"),
-        api_key=config.get_secret_cached("AZURE-OPENAI-KEY"),
-        api_version="2024-05-01-preview"
-    )
+    return azure_clients.openai
     
-@lru_cache(maxsize=1)
 def get_text_analytics_client():
-    return TextAnalyticsClient(
-        endpoint=config.get_secret_cached("TEXT-ANALYTICS-ENDPOINT"),
-        credential=AzureKeyCredential(config.get_secret_cached("TEXT-ANALYTICS-KEY"))
-    )
+    return azure_clients.text_analytics
+
+def get_content_safety_client():
+    return azure_clients.content_safety
 
 # ========== Modelos Pydantic ==========
 class AnalysisIssue(BaseModel):
@@ -119,6 +230,17 @@ class AnalysisResponse(BaseModel):
     improvement_explanation: Optional[str] = None
     issues: List[AnalysisIssue] = []
     error: Optional[str] = None
+    # Etapas opcionales omitidas por plazo agotado, fallo o circuito abierto
+    degraded: List[str] = []
+    # Contenedor y documento de auditoría del análisis, para auditar las peticiones coalescidas que lo comparten
+    _audit_record: Optional[Tuple[str, dict]] = PrivateAttr(default=None)
+
+    @property
+    def audit_record(self) -> Optional[Tuple[str, dict]]:
+        return self._audit_record
+
+    def set_audit_record(self, container_key: str, audit_doc: dict) -> None:
+        self._audit_record = (container_key, audit_doc)
 
 class PromptRequest(BaseModel):
     prompt: str = Field(..., min_length=10, max_length=2000)
@@ -126,8 +248,13 @@ class PromptRequest(BaseModel):
     context: Optional[str] = None
     target_model: Optional[str] = None
     optimization_focus: Optional[List[str]] = None
+    language: Optional[str] = Field(None, min_length=2, max_length=10)
+    speculative: Optional[bool] = None
+    analysis_mode: Optional[Literal["split", "fused"]] = None
+    deadline_ms: Optional[int] = Field(None, ge=REQUEST_DEADLINE_MIN_MS, le=REQUEST_DEADLINE_MAX_MS)
     
     @validator('prompt')
+    @classmethod
     def validate_prompt_length(cls, v):
         if len(v) < 10:
             raise ValueError("El prompt debe tener al menos 10 caracteres")
@@ -135,6 +262,24 @@ class PromptRequest(BaseModel):
             raise ValueError("El prompt no puede exceder 2000 caracteres")
         return v
 
+class AmbiguityAnalysis(BaseModel):
+    ambiguity_score: float = Field(..., ge=0, le=1)
+    clarity_score: float = Field(..., ge=0, le=1)
+    completeness_score: float = Field(..., ge=0, le=1)
+    ambiguous_terms: List[str] = []
+    missing_context: List[str] = []
+    improvement_suggestions: List[str] = []
+
+class FusedAnalysis(BaseModel):
+    improved_prompt: str
+    safety_score: float = Field(..., ge=0, le=1)
+    fairness_score: float = Field(..., ge=0, le=1)
+    inclusivity_score: float = Field(..., ge=0, le=1)
+    improvement_explanation: str = ""
+    issues: List[AnalysisIssue] = []
+    ambiguity: AmbiguityAnalysis
+    variants: List[PromptVariant] = []
+
 class FeedbackRequest(BaseModel):
     analysis_id: str
     selected_variant: Optional[str] = None
@@ -143,16 +288,19 @@ class FeedbackRequest(BaseModel):
     was_useful: bool
 
 # ========== Funciones Principales ==========
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+@timed_stage("content_safety")
+@retry(stop=stop_after_attempt(3), wait=wait_retry_after(wait_exponential(multiplier=1, min=2, max=10)),
+       retry=retry_if_not_exception_type((RateLimitExceeded, CircuitOpenError, asyncio.CancelledError)),
+       reraise=True,
+       before_sleep=count_retry("content_safety"))
 async def analyze_content_safety(text: str) -> dict:
     try:
-        client = ContentSafetyClient(
-            endpoint=config.get_secret_cached("CONTENT-SAFETY-ENDPOINT"),
-            credential=AzureKeyCredential(config.get_secret_cached("CONTENT-SAFETY-KEY"))
-        )
+        client = get_content_safety_client()
+        from azure.ai.contentsafety.models import AnalyzeTextOptions
         
-        # Análisis de contenido dañino
-        content_response = client.analyze_text(AnalyzeTextOptions(text=text))
+        # Análisis de contenido dañino (concurrencia adaptativa según 429 y latencia)
+        async with content_safety_limiter.slot(), circuit_breakers["content_safety"].guard():
+            content_response = await client.analyze_text(AnalyzeTextOptions(text=text))
         
         # Detección de jailbreak (nuevo)
         #jailbreak_response = client.detect_jailbreak(
@@ -172,118 +320,93 @@ async def analyze_content_safety(text: str) -> dict:
         logger.error(f"Content Safety Error: {str(e)}")
         raise
 
-@retry(stop=stop_after_attempt(3), reraise=True)
-async def analyze_text_features(text: str) -> dict:
+async def analyze_text_features(text: str, language: Optional[str] = None) -> dict:
     try:
-        client = get_text_analytics_client()
-        
-        # Crear tareas para todas las llamadas
-        entities_task = asyncio.to_thread(client.recognize_entities, documents=[text])
-        sentiment_task = asyncio.to_thread(client.analyze_sentiment, documents=[text])
-        phrases_task = asyncio.to_thread(client.extract_key_phrases, documents=[text])
-        language_task = asyncio.to_thread(client.detect_language, documents=[text])
-        grammar_task = asyncio.to_thread(
-            client.analyze_sentiment, 
-            documents=[text],
-            show_opinion_mining=True
-        )
-        
-        # Ejecutar en paralelo
-        results = await asyncio.gather(
-            entities_task, sentiment_task, phrases_task, language_task, grammar_task,
-            return_exceptions=True
-        )
-        
-        # Manejar errores individuales
-        processed = []
-        for res in results:
-            if isinstance(res, Exception):
-                logger.error(f"Error en Text Analytics: {str(res)}")
-                raise res
-            processed.append(res)
-        
-        entities_result, sentiment_result, phrases_result, language_result, grammar_result = processed
-        
-        return {
-            "pii": [{"text": e.text, "category": e.category} for e in entities_result[0].entities],
-            "sentiment": {
-                "label": sentiment_result[0].sentiment,
-                "scores": sentiment_result[0].confidence_scores.__dict__
-            },
-            "key_phrases": phrases_result[0].key_phrases,
-            "language": language_result[0].primary_language.name,
-            "grammar_quality": {
-                "opinion_mining_present": len(grammar_result[0].sentences) > 0 and hasattr(grammar_result[0].sentences[0], 'mined_opinions')
-            }
-        }
+        result = (await analyze_text_features_batch(get_text_analytics_client(), [text], [language]))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
     except Exception as e:
         logger.error(f"Error Text Analytics: {str(e)}")
         raise
 
+def is_retryable_openai_error(error: BaseException) -> bool:
+    """429, timeouts, errores de conexión y 5xx; los errores del cliente no se reintentan"""
+    import openai  # ya cargado: el error viene del cliente de OpenAI
+    return isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)) or (
+        isinstance(error, openai.APIStatusError) and error.status_code >= 500
+    )
+
+@retry(stop=stop_after_attempt(3), wait=wait_retry_after(wait_exponential(multiplier=1, min=1, max=8)),
+       retry=retry_if_exception(is_retryable_openai_error), reraise=True, before_sleep=count_retry("openai"))
+async def openai_create(openai_client, **kwargs):
+    """Completion dentro de la cuota TPM/RPM; el usage real corrige la reserva estimada"""
+    async with openai_limiter.reserve(estimate_tokens(kwargs["messages"])) as reservation, \
+            circuit_breakers["openai"].guard():
+        response = await openai_client.chat.completions.create(**kwargs)
+        reservation.usage = getattr(response, "usage", None)
+    return response
+
+async def complete_json(
+    system_prompt: str,
+    user_content: str,
+    temperature: float,
+    on_delta: Optional[Callable[[str], None]] = None,
+    json_mode: bool = False
+) -> dict:
+    """Completion de OpenAI que devuelve JSON; con on_delta transmite el campo improved_prompt"""
+    openai_client = get_openai_client()
+    kwargs = {
+        "model": azure_clients.openai_deployment,
+        "messages": [{
+            "role": "system",
+            "content": system_prompt
+        }, {
+            "role": "user",
+            "content": user_content
+        }],
+        "temperature": temperature
+    }
+    if json_mode:
+        kwargs["response_format"] = {"type": "json_object"}
+
+    if on_delta is None:
+        response = await openai_create(openai_client, **kwargs)
+        llm_usage_stats.record_completion(response.usage)
+        return json.loads(response.choices[0].message.content)
+
+    # Streaming: los tokens de improved_prompt se emiten según llegan
+    field_stream = JsonStringFieldStream("improved_prompt")
+    content = []
+    stream = await openai_create(openai_client, **kwargs, stream=True)
+    try:
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            piece = chunk.choices[0].delta.content
+            content.append(piece)
+            if text := field_stream.feed(piece):
+                on_delta(text)
+    finally:
+        await stream.close()
+    llm_usage_stats.record_completion(None)
+    return json.loads("".join(content))
+
+@timed_stage("ambiguity")
 async def analyze_ambiguity(text: str) -> dict:
     """Analiza la ambigüedad y claridad del prompt"""
     try:
-        openai_client = get_openai_client()
-        
-        response = await asyncio.to_thread(
-            openai_client.chat.completions.create,
-            model=config.get_secret_cached("AZURE-OPENAI-DEPLOYMENT-NAME"),
-            messages=[{
-                "role": "system",
-                "content": """Analiza este prompt para determinar su nivel de ambigüedad, claridad y completitud.
-                Devuelve SOLO un JSON válido con el siguiente formato:
-                {
-                    "ambiguity_score": float entre 0-1 (donde 0 es nada ambiguo y 1 es extremadamente ambiguo),  
-                    "clarity_score": float entre 0-1 (donde 0 es nada claro y 1 es perfectamente claro),
-                    "completeness_score": float entre 0-1 (donde 0 es muy incompleto y 1 es totalmente completo),
-                    "ambiguous_terms": ["lista", "de", "términos", "ambiguos"],
-                    "missing_context": ["lista", "de", "contexto", "faltante"],
-                    "improvement_suggestions": ["Lista", "de", "sugerencias", "concretas"]
-                }"""
-            }, {
-                "role": "user",
-                "content": text
-            }],
-            temperature=0.2
-        )
-        
-        analysis = json.loads(response.choices[0].message.content)
-        return analysis
+        return await complete_json(AMBIGUITY_SYSTEM_PROMPT, text, temperature=0.2)
     except Exception as e:
         logger.error(f"Ambiguity analysis error: {str(e)}")
-        return {
-            "ambiguity_score": 0.5,
-            "clarity_score": 0.5,
-            "completeness_score": 0.5,
-            "ambiguous_terms": [],
-            "missing_context": [],
-            "improvement_suggestions": []
-        }
+        mark_degraded("ambiguity")
+        return dict(DEFAULT_AMBIGUITY)
 
+@timed_stage("variants")
 async def generate_prompt_variants(original_prompt: str, context: str = None, optimization_focus: List[str] = None) -> List[PromptVariant]:
     """Genera variantes optimizadas del prompt original"""
     try:
-        openai_client = get_openai_client()
-        
-        system_prompt = """Genera 3 variantes mejoradas del prompt proporcionado.
-        Cada variante debe optimizar:
-        1. Claridad: Reducir ambigüedad y ser específico
-        2. Estructura: Mejorar la organización de la solicitud
-        3. Especificidad: Incluir detalles relevantes
-        
-        Devuelve SOLO un JSON válido con el siguiente formato:
-        {
-            "variants": [
-                {
-                    "variant_text": "texto de la variante 1",
-                    "quality_score": float entre 0-1,
-                    "clarity_score": float entre 0-1,
-                    "specificity_score": float entre 0-1,
-                    "explanation": "explicación de las mejoras"
-                },
-                ...
-            ]
-        }"""
+        system_prompt = VARIANTS_SYSTEM_PROMPT
         
         if optimization_focus:
             system_prompt += f"\n\nEnfócate especialmente en: {', '.join(optimization_focus)}"
@@ -292,20 +415,7 @@ async def generate_prompt_variants(original_prompt: str, context: str = None, op
         if context:
             user_content = f"Contexto: {context}\n\nPrompt original: {original_prompt}"
         
-        response = await asyncio.to_thread(
-            openai_client.chat.completions.create,
-            model=config.get_secret_cached("AZURE-OPENAI-DEPLOYMENT-NAME"),
-            messages=[{
-                "role": "system",
-                "content": system_prompt
-            }, {
-                "role": "user",
-                "content": user_content
-            }],
-            temperature=0.7
-        )
-        
-        variants_data = json.loads(response.choices[0].message.content)
+        variants_data = await complete_json(system_prompt, user_content, temperature=0.7)
         variants = []
         
         for variant in variants_data.get("variants", []):
@@ -320,23 +430,24 @@ async def generate_prompt_variants(original_prompt: str, context: str = None, op
         return variants
     except Exception as e:
         logger.error(f"Error generando variantes: {str(e)}")
+        mark_degraded("variants")
         return []
 
 async def log_rejected_prompt(analysis_id: str, prompt: str, safety_data: dict):
     """Registra en Cosmos DB los prompts rechazados por motivos de seguridad"""
-    container = get_cosmos_client().get_database_client("PromptAnalysis").get_container_client("RejectedPrompts")
     audit_doc = {
         "id": analysis_id,
         "timestamp": datetime.utcnow().isoformat(),
-        "prompt_hash": hashlib.sha256(prompt.encode()).hexdigest(),
+        "prompt_hash": prompt_hash(prompt),
         "safety_analysis": safety_data,
         "status": "rejected"
     }
-    await asyncio.to_thread(container.upsert_item, audit_doc)
+    rejected_prompts_filter.add(audit_doc["prompt_hash"], safety_data)
+    await audit_writer.write("rejected", audit_doc)
+    return audit_doc
 
 async def log_feedback(feedback_data: dict):
     """Registra el feedback del usuario para mejorar el sistema"""
-    container = get_cosmos_client().get_database_client("PromptAnalysis").get_container_client("Feedback")
     feedback_doc = {
         "id": str(uuid.uuid4()),
         "analysis_id": feedback_data["analysis_id"],
@@ -346,7 +457,7 @@ async def log_feedback(feedback_data: dict):
         "feedback_comments": feedback_data.get("feedback_comments"),
         "was_useful": feedback_data["was_useful"]
     }
-    await asyncio.to_thread(container.upsert_item, feedback_doc)
+    await audit_writer.write("feedback", feedback_doc)
 
 def check_safety_violations(safety_results: dict) -> Optional[str]:
     """Verifica violaciones de seguridad en los resultados del análisis"""
@@ -354,6 +465,10 @@ def check_safety_violations(safety_results: dict) -> Optional[str]:
         if SAFETY_THRESHOLDS.get(category, 6) <= severity:
             return f"Contenido no permitido en categoría: {category}"
     
+    # Coincidencia con la lista de bloqueo local
+    if blocklist_data := safety_results.get("blocklist_match"):
+        return f"Contenido no permitido en categoría: {blocklist_data.get('category', 'Blocklist')}"
+    
     # Comprobar detección de jailbreak
     jailbreak_data = safety_results.get("jailbreak_detection", {})
     if jailbreak_data.get("result") == "JailbreakDetected" or jailbreak_data.get("probability", 0) > 0.7:
@@ -373,19 +488,63 @@ def calculate_fairness_bias_score(text_results: dict, safety_results: dict) -> f
     
     return max(0.0, min(1.0, fairness_score))
 
+@timed_stage("pii_redaction")
 def redact_pii(text: str, pii_list: List[dict]) -> str:
-    """Redacta información personal identificable del texto"""
-    redacted = text
-    for entity in pii_list:
-        redacted = redacted.replace(entity["text"], f"[{entity['category']}]")
-    return redacted
+    """Redacta información personal identificable del texto en una pasada, a partir de los offsets"""
+    return redact_spans(text, pii_list)
+
+def analysis_config_fingerprint() -> str:
+    """Huella de umbrales y system prompts: si cambia, la caché de análisis se invalida"""
+    return config_fingerprint(
+        SAFETY_THRESHOLDS, AMBIGUITY_THRESHOLD, COMPLETENESS_THRESHOLD,
+        AMBIGUITY_SYSTEM_PROMPT, IMPROVED_PROMPT_SYSTEM_PROMPT, VARIANTS_SYSTEM_PROMPT,
+        FUSED_ANALYSIS_SYSTEM_PROMPT, FUSED_VARIANTS_INSTRUCTIONS
+    )
+
+def response_from_cache(payload: dict, prompt: str) -> AnalysisResponse:
+    """Reconstruye una respuesta cacheada con identificadores nuevos"""
+    analysis_id = str(uuid.uuid4())
+    return AnalysisResponse(**{
+        **{key: value for key, value in payload.items() if key != "audit"},
+        "original_prompt": prompt,
+        "analysis_id": analysis_id,
+        "accountability_id": analysis_id
+    })
+
+async def get_cached_analysis(cache_key: str) -> Optional[dict]:
+    """Entrada de caché con el documento de auditoría de su análisis; sin él se trata como fallo"""
+    payload = await analysis_cache.get(cache_key)
+    return payload if payload is not None and "audit" in payload else None
+
+async def audit_reused_analysis(
+    container_key: str,
+    source: dict,
+    response: AnalysisResponse,
+    background_tasks: BackgroundTasks,
+    reused_from: str
+):
+    """Auditoría propia de una respuesta que reutiliza otro análisis: mismo contenido con su id y su fecha"""
+    audit_doc = {
+        **source,
+        "id": response.analysis_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "prompt_hash": prompt_hash(response.original_prompt),
+        "reused_from": {"source": reused_from, "analysis_id": source["id"]}
+    }
+    await audit_writer.write(container_key, audit_doc)
+    if container_key == "analytics":
+        background_tasks.add_task(record_rollup, audit_doc)
+
+async def respond_from_cache(payload: dict, prompt: str, background_tasks: BackgroundTasks) -> AnalysisResponse:
+    """Acierto de caché: respuesta con identificadores nuevos y su propio registro de auditoría"""
+    response = response_from_cache(payload, prompt)
+    await audit_reused_analysis("analytics", payload["audit"], response, background_tasks, "cache")
+    return response
 
 async def log_prompt_variants_for_learning(original_prompt: str, variants: List[str]):
     """Registra variantes de prompts generadas automáticamente."""
     try:
-        container = get_cosmos_client() \
-            .get_database_client("PromptAnalysis") \
-            .get_container_client("PromptVariants")
+        container = get_variants_container()
 
         audit_doc = {
             "id": str(uuid.uuid4()),
@@ -395,15 +554,639 @@ async def log_prompt_variants_for_learning(original_prompt: str, variants: List[
             "status": "generated"
         }
 
-        await asyncio.to_thread(container.upsert_item, audit_doc)
+        await container.upsert_item(audit_doc)
         logger.info("Prompt variants logged successfully.")
 
     except Exception as e:
         logger.error(f"Error logging prompt variants: {str(e)}")
 
 
+# ========== Pipeline de Análisis ==========
+def prompt_cache_key(request: PromptRequest, clean_prompt: str) -> str:
+    return analysis_cache_key(
+        clean_prompt,
+        request.context,
+        request.target_model,
+        request.optimization_focus,
+        request.generate_variants,
+        request.language,
+        request.analysis_mode or ANALYSIS_MODE
+    )
+
+@timed_stage("prescreen")
+def prescreen_prompt(clean_prompt: str) -> Optional[PrescreenHit]:
+    return prescreener.screen(clean_prompt) if PRESCREEN_ENABLED else None
+
+def safety_thresholds_fingerprint() -> str:
+    return config_fingerprint(SAFETY_THRESHOLDS)
+
+def is_current_rejection(safety_data: dict) -> bool:
+    """El resultado de seguridad guardado sigue siendo un rechazo con los umbrales actuales"""
+    return check_safety_violations(safety_data) is not None
+
+async def local_rejection(clean_prompt: str) -> Optional[dict]:
+    """Rechazo sin Content Safety: prefiltro local o prompt idéntico ya rechazado"""
+    if local_hit := prescreen_prompt(clean_prompt):
+        return local_hit.safety_data()
+    return await find_known_rejection(clean_prompt)
+
+@timed_stage("known_rejection")
+async def find_known_rejection(clean_prompt: str) -> Optional[dict]:
+    """Resultado de seguridad de un prompt idéntico ya rechazado; evita repetir la llamada a Content Safety"""
+    if not REJECTED_FILTER_ENABLED:
+        return None
+    rejected_prompts_filter.ensure_fingerprint(safety_thresholds_fingerprint(), is_current_rejection)
+    digest = prompt_hash(clean_prompt)
+    if not rejected_prompts_filter.might_contain(digest):
+        return None
+    safety_data = await rejected_prompts_filter.confirm(digest)
+    # Con umbrales más permisivos que los del rechazo original se vuelve a analizar
+    if safety_data is None or not is_current_rejection(safety_data):
+        return None
+    return {**safety_data, "source": "known_rejection"}
+
+@timed_stage("near_duplicate")
+def find_near_duplicate(clean_prompt: str) -> Optional[NearDuplicateHit]:
+    if not NEAR_DUPLICATE_ENABLED:
+        return None
+    near_duplicates.ensure_fingerprint(analysis_config_fingerprint())
+    return near_duplicates.lookup(clean_prompt)
+
+def variants_reuse_key(request: PromptRequest) -> str:
+    """Las variantes dependen del contexto y del enfoque pedido, no solo del texto"""
+    return config_fingerprint(request.context, request.optimization_focus or [])
+
+def near_duplicate_payload(
+    request: PromptRequest,
+    analysis_id: str,
+    ambiguity_results: dict,
+    variants_result: List[PromptVariant],
+    pii_list: List[dict]
+) -> dict:
+    """Ambigüedad y variantes reutilizables por prompts casi idénticos, sin la PII del prompt de origen"""
+    # Los offsets son del prompt, no del texto generado: sin ellos redact_spans busca cada aparición
+    unplaced = [{k: v for k, v in entity.items() if k not in ("offset", "length")} for entity in pii_list]
+
+    def scrub(text: Any) -> Any:
+        return redact_spans(text, unplaced) if isinstance(text, str) else text
+
+    return {
+        "analysis_id": analysis_id,
+        "variants_key": variants_reuse_key(request),
+        "ambiguity": {
+            **ambiguity_results,
+            **{
+                field: [scrub(item) for item in ambiguity_results.get(field, [])]
+                for field in ("ambiguous_terms", "missing_context", "improvement_suggestions")
+            }
+        },
+        "variants": [
+            {**v.dict(), "variant_text": scrub(v.variant_text), "explanation": scrub(v.explanation)}
+            for v in variants_result
+        ]
+    }
+
+def build_rejected_response(analysis_id: str, clean_prompt: str, error_msg: str) -> AnalysisResponse:
+    """Respuesta para prompts rechazados por motivos de seguridad"""
+    return AnalysisResponse(
+        analysis_id=analysis_id,
+        original_prompt=clean_prompt,
+        error=error_msg,
+        fairness_score=0.0,
+        safety_score=0.0,
+        inclusivity_score=0.0,
+        clarity_score=0.0,
+        completeness_score=0.0,
+        ambiguity_score=1.0,
+        privacy_measures=[],
+        transparency_report={},
+        accountability_id=analysis_id,
+        issues=[AnalysisIssue(
+            type="safety",
+            description=error_msg,
+            severity="high",
+            mitigation="El prompt ha sido rechazado por motivos de seguridad. Por favor, reformule eliminando contenido inapropiado."
+        )]
+    )
+
+def build_failed_response(clean_prompt: str, error_msg: str) -> AnalysisResponse:
+    """Respuesta para un elemento de lote que no pudo analizarse"""
+    analysis_id = str(uuid.uuid4())
+    return AnalysisResponse(
+        analysis_id=analysis_id,
+        original_prompt=clean_prompt,
+        error=error_msg,
+        fairness_score=0.0,
+        safety_score=0.0,
+        inclusivity_score=0.0,
+        clarity_score=0.0,
+        completeness_score=0.0,
+        ambiguity_score=0.0,
+        privacy_measures=[],
+        transparency_report={},
+        accountability_id=analysis_id
+    )
+
+@timed_stage("improved_prompt")
+async def get_improved_prompt(redacted_prompt: str, on_delta: Optional[Callable[[str], None]] = None) -> dict:
+    """Genera el prompt mejorado y las puntuaciones de OpenAI; con on_delta transmite el texto mejorado"""
+    try:
+        return await complete_json(IMPROVED_PROMPT_SYSTEM_PROMPT, redacted_prompt, temperature=0.2, on_delta=on_delta)
+    except Exception as e:
+        logger.error(f"Error OpenAI improved prompt: {str(e)}")
+        raise
+
+@timed_stage("fused_analysis")
+async def analyze_fused(
+    redacted_prompt: str,
+    request: PromptRequest,
+    on_delta: Optional[Callable[[str], None]] = None
+) -> Optional[FusedAnalysis]:
+    """Ambigüedad, prompt mejorado, puntuaciones, issues y variantes en una sola completion estructurada"""
+    system_prompt = FUSED_ANALYSIS_SYSTEM_PROMPT
+    if request.generate_variants:
+        system_prompt += FUSED_VARIANTS_INSTRUCTIONS
+        if request.optimization_focus:
+            system_prompt += f"\n\nEnfócate especialmente en: {', '.join(request.optimization_focus)}"
+
+    user_content = redacted_prompt
+    if request.context:
+        user_content = f"Contexto: {request.context}\n\nPrompt original: {redacted_prompt}"
+
+    try:
+        data = await complete_json(system_prompt, user_content, temperature=0.2, on_delta=on_delta, json_mode=True)
+        return FusedAnalysis(**data)
+    except Exception as e:
+        # Respuesta no válida: el llamador recurre al modo dividido
+        llm_usage_stats.fallbacks += 1
+        logger.warning(f"Análisis fusionado no válido, usando modo dividido: {str(e)}")
+        return None
+
+async def run_prompt_analysis(
+    request: PromptRequest,
+    background_tasks: BackgroundTasks,
+    emit: Optional[Callable[[str, Any], None]] = None
+) -> AnalysisResponse:
+    """Pipeline completo para un prompt: caché, seguridad, análisis y auditoría; emit recibe resultados parciales"""
+    # Validación inicial
+    clean_prompt = request.prompt.strip()
+    if len(clean_prompt) < 10:
+        raise HTTPException(400, "Prompt inválido: demasiado corto")
+    
+    # Prefiltro local (contenido conocido y jailbreaks) y prompts idénticos a uno ya rechazado (reincidentes):
+    # se rechazan antes de llamar a Content Safety
+    if local_safety := await local_rejection(clean_prompt):
+        return await verify_and_complete(request, clean_prompt, local_safety, None, background_tasks, emit=emit)
+
+    # Caché direccionada por contenido: un acierto no llama a ningún servicio de Azure
+    cache_key = prompt_cache_key(request, clean_prompt)
+    analysis_cache.ensure_fingerprint(analysis_config_fingerprint())
+    if cached_payload := await get_cached_analysis(cache_key):
+        return await respond_from_cache(cached_payload, clean_prompt, background_tasks)
+
+    # Casi duplicado (misma plantilla con otro nombre, fecha o ID): la seguridad se revisa igualmente
+    # sobre el texto nuevo, pero se reutilizan la ambigüedad y las variantes del análisis previo
+    reuse = find_near_duplicate(clean_prompt)
+
+    # Peticiones idénticas concurrentes comparten un único análisis en curso (el streaming necesita sus eventos).
+    # La tarea compartida hereda el plazo del primero: solo se unen peticiones con el mismo modo y plazo parecido
+    if COALESCE_ENABLED and emit is None:
+        response, leader = await analysis_flights.run(
+            (cache_key, deadline_bucket()), lambda: analyze_uncached(request, clean_prompt, cache_key, background_tasks, reuse=reuse)
+        )
+        if leader:
+            return response
+        # Cada petición coalescida recibe su id y su propio registro de auditoría
+        follower = response_from_cache(response.dict(exclude={"analysis_id", "accountability_id"}), clean_prompt)
+        if response.audit_record is not None:
+            await audit_reused_analysis(*response.audit_record, follower, background_tasks, "coalesced")
+        return follower
+    return await analyze_uncached(request, clean_prompt, cache_key, background_tasks, emit, reuse)
+
+async def analyze_uncached(
+    request: PromptRequest,
+    clean_prompt: str,
+    cache_key: str,
+    background_tasks: BackgroundTasks,
+    emit: Optional[Callable[[str, Any], None]] = None,
+    reuse: Optional[NearDuplicateHit] = None
+) -> AnalysisResponse:
+    """Seguridad y análisis completo de un prompt sin entrada en caché"""
+    # Modo especulativo: Text Analytics arranca junto a Content Safety; OpenAI espera al veredicto
+    speculative = request.speculative if request.speculative is not None else SPECULATIVE_PIPELINE
+    text_stage = SpeculativeStage(
+        "text_analytics", analyze_text_features(clean_prompt, request.language)
+    ) if speculative else None
+
+    # Análisis de seguridad (mejorado con detección de jailbreak)
+    safety_started = time.perf_counter()
+    try:
+        safety_results = await run_stage("content_safety", analyze_content_safety(clean_prompt))
+    except BaseException:
+        if text_stage:
+            text_stage.discard("error de seguridad")
+        raise
+    safety_ms = (time.perf_counter() - safety_started) * 1000
+    return await verify_and_complete(
+        request, clean_prompt, safety_results, cache_key, background_tasks, text_stage, safety_ms, emit, reuse
+    )
+
+async def verify_and_complete(
+    request: PromptRequest,
+    clean_prompt: str,
+    safety_results: dict,
+    cache_key: Optional[str],
+    background_tasks: BackgroundTasks,
+    text_stage: Optional[SpeculativeStage] = None,
+    safety_ms: float = 0.0,
+    emit: Optional[Callable[[str, Any], None]] = None,
+    reuse: Optional[NearDuplicateHit] = None
+) -> AnalysisResponse:
+    """Aplica el veredicto de seguridad: rechaza y audita, o continúa con el análisis"""
+    # Verificar violaciones de seguridad
+    error_msg = check_safety_violations(safety_results)
+    if emit:
+        emit("safety", {
+            "categories": safety_results.get("categories", {}),
+            "source": safety_results.get("source", "azure"),
+            "rejected": error_msg is not None,
+            "error": error_msg
+        })
+    if error_msg:
+        if text_stage:
+            text_stage.discard("prompt rechazado")
+        analysis_id = str(uuid.uuid4())
+        audit_doc = await log_rejected_prompt(analysis_id, clean_prompt, safety_results)
+        response = build_rejected_response(analysis_id, clean_prompt, error_msg)
+        response.set_audit_record("rejected", audit_doc)
+        return response
+
+    return await complete_analysis(
+        request, clean_prompt, safety_results, cache_key, background_tasks,
+        text_task=text_stage.commit(safety_ms) if text_stage else None,
+        emit=emit,
+        reuse=reuse
+    )
+
+async def complete_analysis(
+    request: PromptRequest,
+    clean_prompt: str,
+    safety_results: dict,
+    cache_key: str,
+    background_tasks: BackgroundTasks,
+    text_results: Optional[dict] = None,
+    text_task: Optional[Awaitable[dict]] = None,
+    emit: Optional[Callable[[str, Any], None]] = None,
+    reuse: Optional[NearDuplicateHit] = None
+) -> AnalysisResponse:
+    """Etapas posteriores a la verificación de seguridad; admite Text Analytics ya calculado o en curso
+    y ambigüedad y variantes de un análisis casi idéntico"""
+    reused_ambiguity = reused_variants = None
+    if reuse is not None:
+        reused_ambiguity = reuse.payload["ambiguity"]
+        if request.generate_variants and reuse.payload["variants"] \
+                and reuse.payload["variants_key"] == variants_reuse_key(request):
+            reused_variants = [PromptVariant(**v) for v in reuse.payload["variants"]]
+    # Con la ambigüedad reutilizada solo falta el prompt mejorado: una completion del modo dividido
+    mode = "near_duplicate" if reuse is not None else request.analysis_mode or ANALYSIS_MODE
+    analysis_mode_var.set(mode)
+    on_delta = (lambda text: emit("improved_prompt", {"delta": text})) if emit else None
+    llm_started = time.perf_counter()
+
+    async def resolve_text_results() -> dict:
+        results = text_results
+        if results is None:
+            results = await run_stage(
+                "text_analytics", text_task or analyze_text_features(clean_prompt, request.language)
+            )
+        if emit:
+            emit("text_analytics", {
+                "sentiment": results.get("sentiment", {}).get("label", "neutral"),
+                "key_phrases": results.get("key_phrases", [])[:5],
+                "language": results.get("language", "unknown"),
+                "pii_detected": bool(results["pii"])
+            })
+        return results
+
+    fused = None
+    if mode == "fused":
+        # Modo fusionado: una única completion sobre el prompt redactado
+        text_results = await resolve_text_results()
+        redacted_prompt = redact_pii(clean_prompt, text_results["pii"])
+        fused = await run_stage("fused_analysis", analyze_fused(redacted_prompt, request, on_delta))
+        if fused is None and emit:
+            emit("improved_prompt_reset", {})
+
+    if fused is not None:
+        improved_data = fused.dict(exclude={"ambiguity", "variants"})
+        ambiguity_results = fused.ambiguity.dict()
+        variants_result = fused.variants if request.generate_variants else []
+        if emit:
+            emit("ambiguity", ambiguity_results)
+            if variants_result:
+                emit("variants", [v.dict() for v in variants_result])
+    else:
+        # Ambigüedad y variantes no dependen de Text Analytics: arrancan de inmediato
+        # Con plazo activo son prescindibles: si agotan su parte se omiten y la respuesta queda degradada
+        ambiguity_task = asyncio.create_task(run_stage(
+            "ambiguity", analyze_ambiguity(clean_prompt), optional=True, fallback=dict(DEFAULT_AMBIGUITY)
+        )) if reused_ambiguity is None else None
+        variants_task = asyncio.create_task(run_stage("variants", generate_prompt_variants(
+            clean_prompt, 
+            request.context, 
+            request.optimization_focus
+        ), optional=True, fallback=[])) if request.generate_variants and reused_variants is None else None
+        if emit:
+            if ambiguity_task:
+                ambiguity_task.add_done_callback(
+                    lambda task: task.cancelled() or task.exception() or emit("ambiguity", task.result())
+                )
+            else:
+                emit("ambiguity", reused_ambiguity)
+            if reused_variants:
+                emit("variants", [v.dict() for v in reused_variants])
+            if variants_task:
+                variants_task.add_done_callback(
+                    lambda task: task.cancelled() or task.exception()
+                    or emit("variants", [v.dict() for v in task.result()])
+                )
+
+        try:
+            if mode != "fused":
+                text_results = await resolve_text_results()
+            
+            # Redactar PII
+            redacted_prompt = redact_pii(clean_prompt, text_results["pii"])
+
+            # El prompt mejorado se solapa con la ambigüedad y las variantes
+            improved_data = await run_stage("improved_prompt", get_improved_prompt(redacted_prompt, on_delta=on_delta))
+            ambiguity_results = await ambiguity_task if ambiguity_task else reused_ambiguity
+            variants_result = await variants_task if variants_task else reused_variants or []
+        finally:
+            for task in (ambiguity_task, variants_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    llm_usage_stats.record_request(mode, (time.perf_counter() - llm_started) * 1000)
+
+    # Calcular puntuación de equidad ajustada
+    calculated_fairness = calculate_fairness_bias_score(text_results, safety_results)
+    adjusted_fairness = (improved_data["fairness_score"] + calculated_fairness) / 2
+
+    # Registrar variantes para aprendizaje automático (las reutilizadas ya se registraron con su prompt)
+    if request.generate_variants and variants_result and reused_variants is None:
+        background_tasks.add_task(
+            log_prompt_variants_for_learning,
+            clean_prompt,
+            [v.variant_text for v in variants_result]
+        )
+
+    # Preparar lista de problemas detectados
+    issues = []
+    
+    # Añadir problemas de ambigüedad y completitud
+    if ambiguity_results.get("ambiguity_score", 0) > AMBIGUITY_THRESHOLD:
+        issues.append(AnalysisIssue(
+            type="ambiguity",
+            description="Prompt con alto nivel de ambigüedad",
+            severity="medium" if ambiguity_results["ambiguity_score"] > 0.8 else "low",
+            mitigation="Considera especificar los términos ambiguos y proveer contexto adicional"
+        ))
+        
+    if ambiguity_results.get("completeness_score", 0) < COMPLETENESS_THRESHOLD:
+        issues.append(AnalysisIssue(
+            type="completeness",
+            description="Prompt incompleto, falta información relevante",
+            severity="medium",
+            mitigation="Añade contexto y especificaciones adicionales"
+        ))
+
+    # Añadir issues de OpenAI
+    if "issues" in improved_data and isinstance(improved_data["issues"], list):
+        for issue in improved_data["issues"]:
+            issues.append(AnalysisIssue(**issue))
+
+    # Auditoría y registro
+    analysis_id = str(uuid.uuid4())
+    audit_doc = {
+        "id": analysis_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "prompt_hash": hashlib.sha256(clean_prompt.encode()).hexdigest(),
+        "analysis": {
+            **improved_data,
+            "ambiguity_analysis": ambiguity_results
+        },
+        "metadata": {
+            "safety": safety_results,
+            "text_analytics": text_results,
+            "compliance": ["GDPR", "ISO27001", "NIST"]
+        },
+        "variants": [v.dict() for v in variants_result] if variants_result else []
+    }
+    near_duplicate_report = None
+    if reuse is not None:
+        near_duplicate_report = {
+            "similarity": reuse.similarity,
+            "reused": ["ambiguity"] + (["variants"] if reused_variants else [])
+        }
+        audit_doc["metadata"]["near_duplicate"] = {
+            **near_duplicate_report, "source_analysis_id": reuse.payload["analysis_id"]
+        }
+    
+    # Escritura diferida: la respuesta no espera a Cosmos
+    await audit_writer.write("analytics", audit_doc)
+    # Agregado diario del dashboard, fuera del camino crítico
+    background_tasks.add_task(record_rollup, audit_doc)
+    
+    # Respuesta final
+    transparency_report = {
+        "safety_analysis": {
+            "categories": safety_results.get("categories", {}),
+            "jailbreak_probability": safety_results.get("jailbreak_detection", {}).get("probability", 0)
+        },
+        "text_analysis": {
+            "sentiment": text_results.get("sentiment", {}).get("label", "neutral"),
+            "key_phrases": text_results.get("key_phrases", [])[:5],
+            "language": text_results.get("language", "unknown")
+        },
+        "ambiguity_analysis": {
+            "ambiguous_terms": ambiguity_results.get("ambiguous_terms", []),
+            "missing_context": ambiguity_results.get("missing_context", [])
+        }
+    }
+    if near_duplicate_report:
+        transparency_report["near_duplicate"] = near_duplicate_report
+    response = AnalysisResponse(
+        analysis_id=analysis_id,
+        original_prompt=clean_prompt,
+        improved_prompt=improved_data["improved_prompt"],
+        fairness_score=adjusted_fairness,
+        safety_score=improved_data["safety_score"],
+        inclusivity_score=improved_data["inclusivity_score"],
+        clarity_score=ambiguity_results.get("clarity_score", 0.5),
+        completeness_score=ambiguity_results.get("completeness_score", 0.5),
+        ambiguity_score=ambiguity_results.get("ambiguity_score", 0.5),
+        privacy_measures=["pii_redaction"] if text_results["pii"] else [],
+        transparency_report=transparency_report,
+        accountability_id=analysis_id,
+        suggested_variants=variants_result if variants_result else None,
+        improvement_explanation=improved_data.get("improvement_explanation", ""),
+        issues=issues,
+        degraded=degraded_stages()
+    )
+    response.set_audit_record("analytics", audit_doc)
+    # Un resultado parcial no se cachea: la siguiente petición puede obtenerlo completo
+    if not response.degraded:
+        await analysis_cache.set(cache_key, {
+            **response.dict(exclude={"analysis_id", "accountability_id"}), "audit": audit_doc
+        })
+        # Solo análisis completos y propios alimentan el índice de casi duplicados
+        if NEAR_DUPLICATE_ENABLED and reuse is None:
+            near_duplicates.add(clean_prompt, near_duplicate_payload(
+                request, analysis_id, ambiguity_results, variants_result, text_results["pii"]
+            ))
+    return response
+
+async def run_with_deadline(coro: Awaitable[AnalysisResponse], budget_ms: int) -> AnalysisResponse:
+    """Ejecuta el pipeline con plazo propagado a sus etapas; wait_for corta lo que quede al agotarlo"""
+    with request_deadline(budget_ms) as deadline:
+        return await asyncio.wait_for(coro, deadline.remaining())
+
+async def stream_prompt_analysis(
+    request: PromptRequest,
+    background_tasks: BackgroundTasks,
+    budget_ms: int
+) -> AsyncIterator[str]:
+    """Ejecuta el pipeline emitiendo cada resultado parcial como evento SSE"""
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(run_with_deadline(run_prompt_analysis(
+        request, background_tasks, emit=lambda event, data: queue.put_nowait((event, data))
+    ), budget_ms))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (item := await queue.get()) is not None:
+            yield sse_event(*item)
+        response = task.result()
+        yield sse_event("result", response.dict())
+    except (DeadlineExceeded, asyncio.TimeoutError) as e:
+        logger.warning(f"Análisis en streaming sin terminar dentro del plazo: {str(e) or 'plazo total agotado'}")
+        yield sse_event("error", {"error": "El análisis no terminó dentro del plazo"})
+    except Exception as e:
+        logger.error(f"Error en análisis en streaming: {str(e)}", exc_info=True)
+        yield sse_event("error", {"error": "Error procesando la solicitud"})
+    finally:
+        # Si el cliente se desconecta se cancelan las llamadas pendientes a OpenAI
+        if not task.done():
+            task.cancel()
+
+async def run_batch_analysis(requests: List[PromptRequest], background_tasks: BackgroundTasks) -> List[AnalysisResponse]:
+    """Analiza un lote agrupando Text Analytics y limitando la concurrencia del resto de llamadas"""
+    analysis_cache.ensure_fingerprint(analysis_config_fingerprint())
+    results: List[Optional[AnalysisResponse]] = [None] * len(requests)
+    clean_prompts = [r.prompt.strip() for r in requests]
+    cache_keys = [prompt_cache_key(r, p) for r, p in zip(requests, clean_prompts)]
+
+    # Prefiltro local y aciertos de caché
+    pending = []
+    rejections = []
+    for i, (clean_prompt, cache_key) in enumerate(zip(clean_prompts, cache_keys)):
+        if len(clean_prompt) < 10:
+            results[i] = build_failed_response(clean_prompt, "Prompt inválido: demasiado corto")
+        elif safety_results := await local_rejection(clean_prompt):
+            analysis_id = str(uuid.uuid4())
+            rejections.append(log_rejected_prompt(analysis_id, clean_prompt, safety_results))
+            results[i] = build_rejected_response(analysis_id, clean_prompt, check_safety_violations(safety_results))
+        elif cached_payload := await get_cached_analysis(cache_key):
+            results[i] = await respond_from_cache(cached_payload, clean_prompt, background_tasks)
+        else:
+            pending.append(i)
+
+    # Content Safety en paralelo con concurrencia acotada
+    safety_semaphore = asyncio.Semaphore(CONTENT_SAFETY_CONCURRENCY)
+
+    async def screen(i: int) -> dict:
+        async with safety_semaphore:
+            return await analyze_content_safety(clean_prompts[i])
+
+    safety_list = await asyncio.gather(*(screen(i) for i in pending), return_exceptions=True)
+
+    accepted = []
+    for i, safety_results in zip(pending, safety_list):
+        if isinstance(safety_results, Exception):
+            logger.error(f"Error de seguridad en elemento {i} del lote: {str(safety_results)}")
+            results[i] = build_failed_response(clean_prompts[i], "Error en el análisis de seguridad")
+        elif error_msg := check_safety_violations(safety_results):
+            analysis_id = str(uuid.uuid4())
+            rejections.append(log_rejected_prompt(analysis_id, clean_prompts[i], safety_results))
+            results[i] = build_rejected_response(analysis_id, clean_prompts[i], error_msg)
+        else:
+            accepted.append((i, safety_results))
+    await asyncio.gather(*rejections, return_exceptions=True)
+
+    # Text Analytics agrupado en el mínimo de llamadas; una acción opcional omitida degrada todo el lote
+    with degradation_scope() as batch_degraded:
+        text_list = await analyze_text_features_batch(
+            get_text_analytics_client(),
+            [clean_prompts[i] for i, _ in accepted],
+            [requests[i].language for i, _ in accepted]
+        )
+
+    # OpenAI y auditoría por elemento
+    analysis_semaphore = asyncio.Semaphore(BATCH_ANALYSIS_CONCURRENCY)
+
+    async def finish(i: int, safety_results: dict, text_results: Union[dict, Exception]) -> AnalysisResponse:
+        if isinstance(text_results, Exception):
+            logger.error(f"Error de Text Analytics en elemento {i} del lote: {str(text_results)}")
+            return build_failed_response(clean_prompts[i], "Error en el análisis de texto")
+        # Cada elemento lleva su propia lista de etapas degradadas: un resultado parcial no se cachea
+        async with analysis_semaphore:
+            try:
+                with degradation_scope(batch_degraded):
+                    return await complete_analysis(
+                        requests[i], clean_prompts[i], safety_results, cache_keys[i], background_tasks,
+                        text_results=text_results
+                    )
+            except Exception as e:
+                logger.error(f"Error en elemento {i} del lote: {str(e)}")
+                return build_failed_response(clean_prompts[i], "Error procesando el prompt")
+
+    finished = await asyncio.gather(*(
+        finish(i, safety_results, text_results)
+        for (i, safety_results), text_results in zip(accepted, text_list)
+    ))
+    for (i, _), response in zip(accepted, finished):
+        results[i] = response
+
+    return results
+
+
 # ========== Configuración FastAPI ==========
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Crea los clientes de Azure al arrancar y los cierra al apagar"""
+    start = time.perf_counter()
+    await azure_clients.start(use_cosmos=STORAGE_BACKEND == "cosmos")
+    config.start_refresh()
+    cosmos_connections.start_health_probe()
+    audit_writer.start()
+    if REJECTED_FILTER_ENABLED:
+        rejected_prompts_filter.ensure_fingerprint(safety_thresholds_fingerprint(), is_current_rejection)
+        rejected_prompts_filter.start_rebuild()
+    logger.info(
+        f"Arranque completado en {(time.perf_counter() - start) * 1000:.0f} ms "
+        f"(secretos: {config.cold_start_ms} ms)"
+    )
+    try:
+        yield
+    finally:
+        await rejected_prompts_filter.stop()
+        await audit_writer.stop()
+        await cosmos_connections.stop()
+        await config.stop()
+        await azure_clients.close()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Azure Prompt Guardian API",
     version="5.0",
     docs_url="/docs",
@@ -424,15 +1207,43 @@ app.add_middleware(
     max_age=600
 )
 
+@app.middleware("http")
+async def stage_timing_middleware(request: Request, call_next):
+    """Server-Timing con las etapas de la petición y latencia por ruta para Prometheus"""
+    timings = []
+    token = stage_timings_var.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        stage_timings_var.reset(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code)
+    ).observe(elapsed)
+    # En streaming las cabeceras salen antes de que terminen las etapas
+    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+        response.headers["Server-Timing"] = ", ".join(
+            filter(None, [server_timing_header(timings), f"total;dur={elapsed * 1000:.1f}"])
+        )
+    return response
+
 # Importar el router de dashboard
-from backend.dashboard_routes import router as dashboard_router 
+from backend.dashboard_routes import dashboard_cache, router as dashboard_router 
 
 # Agregar el router a la aplicación
 app.include_router(dashboard_router)
 
 # ========== Endpoints ==========
 @app.post("/analyze-prompt", response_model=AnalysisResponse)
-async def analyze_prompt(request: PromptRequest, background_tasks: BackgroundTasks):
+async def analyze_prompt(
+    request: PromptRequest,
+    background_tasks: BackgroundTasks,
+    x_deadline_ms: Optional[int] = Header(None)
+):
     """
     Analiza un prompt, detecta problemas de seguridad, privacidad, equidad y claridad,
     y proporciona recomendaciones y mejoras.
@@ -442,192 +1253,60 @@ async def analyze_prompt(request: PromptRequest, background_tasks: BackgroundTas
     - **context**: Opcional, contexto adicional para entender mejor el prompt
     - **target_model**: Opcional, modelo al que va dirigido el prompt
     - **optimization_focus**: Opcional, aspectos específicos a optimizar
+    - **deadline_ms**: Opcional, presupuesto de latencia (también cabecera `X-Deadline-Ms`);
+      las etapas opcionales que no terminan a tiempo se listan en `degraded`
     """
     try:
-        # Validación inicial
-        clean_prompt = request.prompt.strip()
-        if len(clean_prompt) < 10:
-            raise HTTPException(400, "Prompt inválido: demasiado corto")
-        
-        # Análisis de seguridad (mejorado con detección de jailbreak)
-        safety_results = await analyze_content_safety(clean_prompt)
-        
-        # Verificar violaciones de seguridad
-        if error_msg := check_safety_violations(safety_results):
-            analysis_id = str(uuid.uuid4())
-            await log_rejected_prompt(analysis_id, clean_prompt, safety_results)
-            return AnalysisResponse(
-                analysis_id=analysis_id,
-                original_prompt=clean_prompt,
-                error=error_msg,
-                fairness_score=0.0,
-                safety_score=0.0,
-                inclusivity_score=0.0,
-                clarity_score=0.0,
-                completeness_score=0.0,
-                ambiguity_score=1.0,
-                privacy_measures=[],
-                transparency_report={},
-                accountability_id=analysis_id,
-                issues=[AnalysisIssue(
-                    type="safety",
-                    description=error_msg,
-                    severity="high",
-                    mitigation="El prompt ha sido rechazado por motivos de seguridad. Por favor, reformule eliminando contenido inapropiado."
-                )]
-            )
-        
-        # Análisis paralelo de texto y ambigüedad
-        text_task = analyze_text_features(clean_prompt)
-        ambiguity_task = analyze_ambiguity(clean_prompt)
-        text_results, ambiguity_results = await asyncio.gather(text_task, ambiguity_task)
-        
-        # Redactar PII
-        redacted_prompt = redact_pii(clean_prompt, text_results["pii"])
-
-        # Función auxiliar para la generación del prompt mejorado
-        async def get_improved_prompt() -> dict:
-            try:
-                openai_client = get_openai_client()
-                response = await asyncio.to_thread(
-                    openai_client.chat.completions.create,
-                    model=config.get_secret_cached("AZURE-OPENAI-DEPLOYMENT-NAME"),
-                    messages=[{
-                        "role": "system",
-                        "content": """Analiza el prompt y devuelve SOLO un JSON válido con:
-                        {
-                            "improved_prompt": "string con prompt mejorado",
-                            "safety_score": 0.0-1.0,
-                            "fairness_score": 0.0-1.0,
-                            "inclusivity_score": 0.0-1.0,
-                            "improvement_explanation": "explicación detallada de los cambios realizados",
-                            "issues": [
-                                {"type": "fairness" | "safety" | "privacy" | "inclusiveness" | "bias" | "ambiguity" | "clarity" | "completeness" | "other",
-                                "severity": "low" | "medium" | "high",
-                                "description": "...",
-                                "mitigation": "..."}
-                            ]
-                        }"""
-                    }, {
-                        "role": "user",
-                        "content": redacted_prompt
-                    }],
-                    temperature=0.2
-                )
-                return json.loads(response.choices[0].message.content)
-            except Exception as e:
-                logger.error(f"Error OpenAI improved prompt: {str(e)}")
-                raise
-
-        # Ejecutar en paralelo la generación del prompt mejorado y las variantes
-        improved_task = get_improved_prompt()
-        variants_task = generate_prompt_variants(
-            clean_prompt, 
-            request.context, 
-            request.optimization_focus
-        ) if request.generate_variants else asyncio.sleep(0)
-
-        # Esperar resultados paralelos
-        if request.generate_variants:
-            improved_data, variants_result = await asyncio.gather(improved_task, variants_task)
-        else:
-            improved_data = await improved_task
-            variants_result = []
-
-        # Calcular puntuación de equidad ajustada
-        calculated_fairness = calculate_fairness_bias_score(text_results, safety_results)
-        adjusted_fairness = (improved_data["fairness_score"] + calculated_fairness) / 2
-
-        # Registrar variantes para aprendizaje automático
-        if request.generate_variants and variants_result:
-            background_tasks.add_task(
-                log_prompt_variants_for_learning,
-                clean_prompt,
-                [v.variant_text for v in variants_result]
-            )
-
-        # Preparar lista de problemas detectados
-        issues = []
-        
-        # Añadir problemas de ambigüedad y completitud
-        if ambiguity_results.get("ambiguity_score", 0) > AMBIGUITY_THRESHOLD:
-            issues.append(AnalysisIssue(
-                type="ambiguity",
-                description="Prompt con alto nivel de ambigüedad",
-                severity="medium" if ambiguity_results["ambiguity_score"] > 0.8 else "low",
-                mitigation="Considera especificar los términos ambiguos y proveer contexto adicional"
-            ))
-            
-        if ambiguity_results.get("completeness_score", 0) < COMPLETENESS_THRESHOLD:
-            issues.append(AnalysisIssue(
-                type="completeness",
-                description="Prompt incompleto, falta información relevante",
-                severity="medium",
-                mitigation="Añade contexto y especificaciones adicionales"
-            ))
-
-        # Añadir issues de OpenAI
-        if "issues" in improved_data and isinstance(improved_data["issues"], list):
-            for issue in improved_data["issues"]:
-                issues.append(AnalysisIssue(**issue))
-
-        # Auditoría y registro
-        analysis_id = str(uuid.uuid4())
-        audit_doc = {
-            "id": analysis_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "prompt_hash": hashlib.sha256(clean_prompt.encode()).hexdigest(),
-            "analysis": {
-                **improved_data,
-                "ambiguity_analysis": ambiguity_results
-            },
-            "metadata": {
-                "safety": safety_results,
-                "text_analytics": text_results,
-                "compliance": ["GDPR", "ISO27001", "NIST"]
-            },
-            "variants": [v.dict() for v in variants_result] if variants_result else []
-        }
-        
-        container = get_cosmos_client().get_database_client("PromptAnalysis").get_container_client("Analytics")
-        await asyncio.to_thread(container.upsert_item, audit_doc)
-        
-        # Respuesta final
-        return AnalysisResponse(
-            analysis_id=analysis_id,
-            original_prompt=clean_prompt,
-            improved_prompt=improved_data["improved_prompt"],
-            fairness_score=adjusted_fairness,
-            safety_score=improved_data["safety_score"],
-            inclusivity_score=improved_data["inclusivity_score"],
-            clarity_score=ambiguity_results.get("clarity_score", 0.5),
-            completeness_score=ambiguity_results.get("completeness_score", 0.5),
-            ambiguity_score=ambiguity_results.get("ambiguity_score", 0.5),
-            privacy_measures=["pii_redaction"] if text_results["pii"] else [],
-            transparency_report={
-                "safety_analysis": {
-                    "categories": safety_results.get("categories", {}),
-                    "jailbreak_probability": safety_results.get("jailbreak_detection", {}).get("probability", 0)
-                },
-                "text_analysis": {
-                    "sentiment": text_results.get("sentiment", {}).get("label", "neutral"),
-                    "key_phrases": text_results.get("key_phrases", [])[:5],
-                    "language": text_results.get("language", "unknown")
-                },
-                "ambiguity_analysis": {
-                    "ambiguous_terms": ambiguity_results.get("ambiguous_terms", []),
-                    "missing_context": ambiguity_results.get("missing_context", [])
-                }
-            },
-            accountability_id=analysis_id,
-            suggested_variants=variants_result if variants_result else None,
-            improvement_explanation=improved_data.get("improvement_explanation", ""),
-            issues=issues
+        return await run_with_deadline(
+            run_prompt_analysis(request, background_tasks),
+            resolve_budget_ms(request.deadline_ms, x_deadline_ms)
         )
-        
+    except (RateLimitExceeded, CircuitOpenError) as e:
+        # Cuota agotada o dependencia caída: el cliente debe reintentar más tarde
+        logger.warning(f"Análisis rechazado: {str(e)}")
+        raise HTTPException(503, "Servicio saturado, inténtalo más tarde",
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))}) from e
+    except (DeadlineExceeded, asyncio.TimeoutError) as e:
+        logger.warning(f"Análisis sin terminar dentro del plazo: {str(e) or 'plazo total agotado'}")
+        raise HTTPException(504, "El análisis no terminó dentro del plazo") from e
     except Exception as e:
         logger.error(f"Error en análisis: {str(e)}", exc_info=True)
-        raise HTTPException(500, "Error procesando la solicitud")
+        raise HTTPException(500, "Error procesando la solicitud") from e
+
+@app.post("/analyze-prompt/stream")
+async def analyze_prompt_stream(
+    request: PromptRequest,
+    background_tasks: BackgroundTasks,
+    x_deadline_ms: Optional[int] = Header(None)
+):
+    """
+    Variante en streaming (Server-Sent Events) de /analyze-prompt.
+    
+    Eventos en orden de llegada: `safety`, `text_analytics`, `ambiguity`,
+    `improved_prompt` (fragmentos en `delta`), `variants` y `result` con la
+    respuesta completa y el `analysis_id`. Si falla se emite `error`.
+    """
+    return StreamingResponse(
+        stream_prompt_analysis(request, background_tasks, resolve_budget_ms(request.deadline_ms, x_deadline_ms)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/analyze-prompts", response_model=List[AnalysisResponse])
+async def analyze_prompts(requests: List[PromptRequest], background_tasks: BackgroundTasks):
+    """
+    Analiza un lote de prompts agrupando las llamadas a Azure.
+    
+    Devuelve un resultado por elemento, en el mismo orden; un fallo en un elemento
+    se informa en su campo `error` sin afectar al resto del lote.
+    """
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"El lote no puede exceder {BATCH_MAX_ITEMS} prompts")
+    try:
+        return await run_batch_analysis(requests, background_tasks)
+    except Exception as e:
+        logger.error(f"Error en análisis por lotes: {str(e)}", exc_info=True)
+        raise HTTPException(500, "Error procesando el lote") from e
 
 @app.post("/feedback", tags=["Feedback"])
 async def submit_feedback(feedback: FeedbackRequest):
@@ -645,7 +1324,7 @@ async def submit_feedback(feedback: FeedbackRequest):
         return {"status": "Feedback registrado correctamente"}
     except Exception as e:
         logger.error(f"Error al registrar feedback: {str(e)}")
-        raise HTTPException(500, "Error al registrar feedback")
+        raise HTTPException(500, "Error al registrar feedback") from e
 
 @app.get("/audit/{analysis_id}", tags=["Accountability"])
 async def get_audit_trail(analysis_id: str):
@@ -655,15 +1334,15 @@ async def get_audit_trail(analysis_id: str):
     - **analysis_id**: ID único generado durante el análisis
     """
     try:
-        container = get_cosmos_client()\
-            .get_database_client("PromptAnalysis")\
-            .get_container_client("Analytics")
-        
-        document = await asyncio.to_thread(
-            container.read_item,
-            analysis_id,
-            partition_key=analysis_id
-        )
+        # Documentos aún en la cola de escritura diferida, luego Cosmos y por último el fichero local
+        document = audit_writer.find_pending("analytics", analysis_id)
+        if document is None:
+            try:
+                document = await get_analytics_container().read_item(analysis_id, partition_key=analysis_id)
+            except Exception:
+                document = await audit_writer.find_spilled("analytics", analysis_id)
+                if document is None:
+                    raise
         
         return {
             "analysis_id": document["id"],
@@ -674,8 +1353,8 @@ async def get_audit_trail(analysis_id: str):
             "prompt_hash": document["prompt_hash"],
             "variants": document.get("variants", [])
         }
-    except Exception as e:
-        raise HTTPException(404, "Registro de auditoría no encontrado")
+    except Exception:
+        raise HTTPException(404, "Registro de auditoría no encontrado") from None
 
 @app.get("/metrics", tags=["Analytics"])
 async def get_system_metrics():
@@ -683,41 +1362,25 @@ async def get_system_metrics():
     Obtiene métricas agregadas sobre el rendimiento del sistema
     """
     try:
-        analytics_container = get_cosmos_client()\
-            .get_database_client("PromptAnalysis")\
-            .get_container_client("Analytics")
-            
-        rejected_container = get_cosmos_client()\
-            .get_database_client("PromptAnalysis")\
-            .get_container_client("RejectedPrompts")
-            
-        feedback_container = get_cosmos_client()\
-            .get_database_client("PromptAnalysis")\
-            .get_container_client("Feedback")
+        analytics_container = get_analytics_container()
+        rejected_container = get_rejected_container()
+        feedback_container = get_feedback_container()
         
         # Consultas para obtener estadísticas
-        total_analyzed = await asyncio.to_thread(
-            lambda: list(analytics_container.query_items(
-                query="SELECT VALUE COUNT(1) FROM c WHERE c._ts > @threshold",
-                parameters=[{"name": "@threshold", "value": int((datetime.now() - datetime.timedelta(days=30)).timestamp())}],
-                enable_cross_partition_query=True
-            ))
-        )
+        threshold = int((datetime.now() - timedelta(days=30)).timestamp())
+        total_analyzed = [item async for item in analytics_container.query_items(
+            query="SELECT VALUE COUNT(1) FROM c WHERE c._ts > @threshold",
+            parameters=[{"name": "@threshold", "value": threshold}]
+        )]
         
-        total_rejected = await asyncio.to_thread(
-            lambda: list(rejected_container.query_items(
-                query="SELECT VALUE COUNT(1) FROM c WHERE c._ts > @threshold",
-                parameters=[{"name": "@threshold", "value": int((datetime.now() - datetime.timedelta(days=30)).timestamp())}],
-                enable_cross_partition_query=True
-            ))
-        )
+        total_rejected = [item async for item in rejected_container.query_items(
+            query="SELECT VALUE COUNT(1) FROM c WHERE c._ts > @threshold",
+            parameters=[{"name": "@threshold", "value": threshold}]
+        )]
         
-        average_satisfaction = await asyncio.to_thread(
-            lambda: list(feedback_container.query_items(
-                query="SELECT VALUE AVG(c.satisfaction_rating) FROM c WHERE c.satisfaction_rating IS NOT NULL",
-                enable_cross_partition_query=True
-            ))
-        )
+        average_satisfaction = [item async for item in feedback_container.query_items(
+            query="SELECT VALUE AVG(c.satisfaction_rating) FROM c WHERE c.satisfaction_rating IS NOT NULL"
+        )]
         
         return {
             "total_prompts_analyzed_30d": total_analyzed[0] if total_analyzed else 0,
@@ -729,22 +1392,48 @@ async def get_system_metrics():
                 "average_clarity_improvement": 0.32,  # Simulado
                 "average_safety_improvement": 0.45,  # Simulado
                 "average_fairness_improvement": 0.28   # Simulado
-            }
+            },
+            "analysis_cache": analysis_cache.snapshot(),
+            "text_analytics": text_analytics_stats.snapshot(),
+            "speculation": speculation_stats.snapshot(),
+            "coalescing": analysis_flights.snapshot(),
+            "near_duplicates": near_duplicates.snapshot(),
+            "pii": pii_detector.snapshot(),
+            "rejected_filter": rejected_prompts_filter.snapshot(),
+            "rate_limits": limiters_snapshot(),
+            "circuit_breakers": breakers_snapshot(),
+            "secrets": config.snapshot(),
+            "llm_usage": llm_usage_stats.snapshot(),
+            "prescreen": prescreener.snapshot(),
+            "dashboard_cache": dashboard_cache.snapshot(),
+            "cosmos": cosmos_connections.snapshot(),
+            "audit_writer": audit_writer.snapshot(),
+            "analytics_store": analytics_store.snapshot(),
+            "latency": stages_snapshot()
         }
     except Exception as e:
         logger.error(f"Error obteniendo métricas: {str(e)}")
-        raise HTTPException(500, "Error obteniendo métricas del sistema")
+        raise HTTPException(500, "Error obteniendo métricas del sistema") from e
+
+@app.get("/metrics/prometheus", tags=["Analytics"])
+async def get_prometheus_metrics():
+    """Histogramas de latencia por etapa y reintentos en formato de exposición de Prometheus"""
+    payload, content_type = prometheus_payload()
+    return Response(content=payload, headers={"Content-Type": content_type})
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint that verifies key dependencies are accessible"""
+    """Health check endpoint: reports the last out-of-band dependency probe without calling Cosmos"""
     try:
-        # Check Azure services connectivity
-        cosmos_client = get_cosmos_client()
-        await asyncio.to_thread(cosmos_client.list_databases)
+        # La sonda de Cosmos corre en segundo plano; sin lifespan se ejecuta una vez bajo demanda
+        cosmos_health = cosmos_connections.health
+        if cosmos_health["status"] == "unknown":
+            cosmos_health = await cosmos_connections.probe()
+        if cosmos_health["status"] != "connected":
+            raise RuntimeError(f"Cosmos DB: {cosmos_health.get('error')}")
         
         # Check OpenAI client
-        openai_client = get_openai_client()
+        get_openai_client()
         
         return {
             "status": "OK", 
@@ -753,15 +1442,18 @@ async def health_check():
             "dependencies": {
                 "cosmos": "connected",
                 "openai": "available"
-            }
+            },
+            "cosmos_probe": cosmos_health,
+            "circuit_breakers": breakers_snapshot(),
+            "secrets": config.snapshot()
         }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
-        return {
+        return JSONResponse({
             "status": "ERROR",
             "error": str(e),
             "timestamp": datetime.utcnow().isoformat()
-        }, 500
+        }, status_code=500)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,212 @@
+import logging
+import math
+import os
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from backend.prescreen import normalize_for_screening
+
+# numpy se importa al primer análisis indexado o buscado, no al arrancar
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+# Similitud de Jaccard estimada a partir de la que se reutiliza un análisis previo
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "50000"))
+NEAR_DUPLICATE_TTL = int(os.getenv("NEAR_DUPLICATE_TTL", "86400"))
+
+# 64 permutaciones en 16 bandas de 4 filas: un par con similitud 0.8 es candidato con probabilidad > 0.999
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Huecos por cubeta de cada banda; si se llena se sobrescribe uno (se pierde un candidato, no un resultado)
+BUCKET_WIDTH = 4
+
+_DIGITS = re.compile(r"\d+")
+_WORDS = re.compile(r"\w+")
+
+
+def prompt_tokens(text: str) -> List[str]:
+    """Palabras normalizadas; los números (fechas, IDs, importes) se igualan para que las plantillas coincidan"""
+    return _WORDS.findall(_DIGITS.sub("0", normalize_for_screening(text)))
+
+
+@lru_cache(maxsize=None)
+def _hash_coefficients() -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Coeficientes de hashing multiply-shift: (a·x + b) mod 2^64, quedándose con los 32 bits altos"""
+    import numpy as np
+
+    rng = np.random.default_rng(20250)
+    perm_a = rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+    perm_b = rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+    band_coeffs = rng.integers(1, 2 ** 63, (BANDS, ROWS), dtype=np.uint64) | np.uint64(1)
+    return perm_a, perm_b, band_coeffs
+
+
+def minhash_signature(text: str) -> "np.ndarray":
+    """Firma MinHash sobre palabras y bigramas; se guardan los 16 bits bajos de cada mínimo (b-bit MinHash)
+
+    Las palabras sueltas suavizan el peso de un hueco de plantilla rellenado (nombre, empresa) frente a
+    usar solo bigramas, en los que cada palabra distinta cambia dos elementos del conjunto.
+    """
+    import numpy as np
+
+    perm_a, perm_b, _ = _hash_coefficients()
+    tokens = prompt_tokens(text)
+    shingles = set(tokens) | {f"{first} {second}" for first, second in zip(tokens, tokens[1:])} or {""}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (hashes[:, None] * perm_a + perm_b) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint16)
+
+
+@dataclass
+class NearDuplicateHit:
+    similarity: float
+    payload: Dict[str, Any]
+
+
+class NearDuplicateIndex:
+    """Índice LSH de firmas MinHash en memoria acotada
+
+    Firmas, marcas de tiempo y tablas de bandas son arrays de numpy de tamaño fijo, reservados con la primera
+    inserción; al llenarse se reutiliza el hueco más antiguo (FIFO) y las entradas más viejas que el TTL se
+    ignoran en la búsqueda.
+    """
+
+    def __init__(self, capacity: int = NEAR_DUPLICATE_MAX_ENTRIES, threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                 ttl: float = NEAR_DUPLICATE_TTL):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        # Cubetas por banda: potencia de 2 con carga media de 2 entradas
+        self.bucket_bits = max(math.ceil(math.log2(max(capacity // 2, 16))), 4)
+        self.signatures: Optional["np.ndarray"] = None
+        self.added_at: Optional["np.ndarray"] = None
+        self.tables: Optional["np.ndarray"] = None
+        self.payloads: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.size = 0
+        self.next_slot = 0
+        self.fingerprint: Optional[str] = None
+        self.stats = {"lookups": 0, "hits": 0, "expired": 0, "inserts": 0, "evictions": 0, "invalidations": 0,
+                      "total_us": 0.0}
+        self._bands: Optional["np.ndarray"] = None
+
+    def _allocate(self) -> None:
+        import numpy as np
+
+        self.signatures = np.zeros((self.capacity, NUM_PERM), dtype=np.uint16)
+        self.added_at = np.zeros(self.capacity, dtype=np.float64)
+        self.tables = np.full((BANDS, 1 << self.bucket_bits, BUCKET_WIDTH), -1, dtype=np.int32)
+        self._bands = np.arange(BANDS)
+
+    def _buckets(self, signature: "np.ndarray") -> "np.ndarray":
+        import numpy as np
+
+        keys = (signature.reshape(BANDS, ROWS).astype(np.uint64) * _hash_coefficients()[2]).sum(axis=1)
+        return (keys >> np.uint64(64 - self.bucket_bits)).astype(np.int64)
+
+    def ensure_fingerprint(self, fingerprint: str) -> None:
+        """Vacía el índice si cambió la configuración que produjo los análisis guardados"""
+        if self.fingerprint is not None and self.fingerprint != fingerprint:
+            logger.info("Configuración de análisis modificada, vaciando el índice de casi duplicados")
+            self.clear()
+        self.fingerprint = fingerprint
+
+    def clear(self) -> None:
+        if self.tables is not None:
+            self.tables.fill(-1)
+        self.payloads = [None] * self.capacity
+        self.size = 0
+        self.next_slot = 0
+        self.stats["invalidations"] += 1
+
+    def _evict(self, slot: int) -> None:
+        buckets = self._buckets(self.signatures[slot])
+        rows = self.tables[self._bands, buckets]
+        rows[rows == slot] = -1
+        self.tables[self._bands, buckets] = rows
+        self.payloads[slot] = None
+        self.stats["evictions"] += 1
+
+    def add_signature(self, signature: "np.ndarray", payload: Dict[str, Any]) -> None:
+        import numpy as np
+
+        if self.tables is None:
+            self._allocate()
+        slot = self.next_slot
+        if self.payloads[slot] is not None:
+            self._evict(slot)
+        self.signatures[slot] = signature
+        self.added_at[slot] = time.monotonic()
+        self.payloads[slot] = payload
+
+        buckets = self._buckets(signature)
+        rows = self.tables[self._bands, buckets]
+        free = rows == -1
+        positions = np.where(free.any(axis=1), free.argmax(axis=1), slot % BUCKET_WIDTH)
+        self.tables[self._bands, buckets, positions] = slot
+
+        self.next_slot = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.stats["inserts"] += 1
+
+    def add(self, text: str, payload: Dict[str, Any]) -> None:
+        self.add_signature(minhash_signature(text), payload)
+
+    def lookup_signature(self, signature: "np.ndarray") -> Optional[NearDuplicateHit]:
+        import numpy as np
+
+        if self.tables is None:
+            return None
+        candidates = self.tables[self._bands, self._buckets(signature)].ravel()
+        candidates = np.unique(candidates[candidates >= 0])
+        if not len(candidates):
+            return None
+        fresh = self.added_at[candidates] >= time.monotonic() - self.ttl
+        if not fresh.all():
+            self.stats["expired"] += int((~fresh).sum())
+            candidates = candidates[fresh]
+            if not len(candidates):
+                return None
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        return NearDuplicateHit(similarity=round(float(similarities[best]), 4), payload=self.payloads[candidates[best]])
+
+    def lookup(self, text: str) -> Optional[NearDuplicateHit]:
+        """Análisis previo más parecido por encima del umbral, o None"""
+        start = time.perf_counter()
+        hit = self.lookup_signature(minhash_signature(text)) if self.size else None
+        self.stats["lookups"] += 1
+        self.stats["hits"] += hit is not None
+        self.stats["total_us"] += (time.perf_counter() - start) * 1e6
+        return hit
+
+    def memory_bytes(self) -> int:
+        if self.tables is None:
+            return 0
+        return self.signatures.nbytes + self.added_at.nbytes + self.tables.nbytes
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        return {
+            "enabled": NEAR_DUPLICATE_ENABLED,
+            **{k: v for k, v in self.stats.items() if k != "total_us"},
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_us": round(self.stats["total_us"] / lookups, 2) if lookups else 0.0,
+            "size": self.size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "memory_mb": round(self.memory_bytes() / 2 ** 20, 1)
+        }
+
+
+near_duplicates = NearDuplicateIndex()
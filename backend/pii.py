@@ -0,0 +1,195 @@
+import ipaddress
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "hybrid": detector local + entidades de Text Analytics; "local": solo PII estructurada, sin llamada
+# remota de entidades; "remote": solo Text Analytics (comportamiento anterior)
+PII_MODE = os.getenv("PII_MODE", "hybrid")
+PII_LOCAL_ENABLED = PII_MODE in ("hybrid", "local")
+PII_REMOTE_ENABLED = PII_MODE in ("hybrid", "remote")
+
+DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, char in enumerate(reversed(digits)):
+        value = int(char)
+        if i % 2:
+            value = value * 2 - 9 if value > 4 else value * 2
+        total += value
+    return total % 10 == 0
+
+
+def _only_digits(text: str) -> str:
+    return "".join(c for c in text if c.isdigit())
+
+
+def _valid_card(text: str) -> bool:
+    digits = _only_digits(text)
+    return 13 <= len(digits) <= 19 and luhn_valid(digits)
+
+
+def _valid_iban(text: str) -> bool:
+    compact = text.replace(" ", "").upper()
+    if not 15 <= len(compact) <= 34:
+        return False
+    rearranged = compact[4:] + compact[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+def _valid_spanish_id(text: str) -> bool:
+    compact = text.replace("-", "").upper()
+    number = compact[:-1].replace("X", "0").replace("Y", "1").replace("Z", "2")
+    return DNI_LETTERS[int(number) % 23] == compact[-1]
+
+
+def _valid_ip(text: str) -> bool:
+    try:
+        ipaddress.ip_address(text)
+        return True
+    except ValueError:
+        return False
+
+
+def _valid_phone(text: str) -> bool:
+    """Exige estructura de teléfono: prefijo +, prefijo entre paréntesis o grupos separados que no sean
+    años ni un número con separadores de miles"""
+    if not 9 <= len(_only_digits(text)) <= 15:
+        return False
+    if text.startswith("+") or "(" in text:
+        return True
+    groups = [group for group in re.split(r"[ .-]+", text) if group]
+    if len(groups) < 2:
+        return False
+    if all(len(group) == 4 and group[:2] in ("19", "20") for group in groups):
+        return False
+    if "." in text and " " not in text and "-" not in text and all(len(group) == 3 for group in groups[1:]):
+        return False
+    return True
+
+
+# Una cuádrupla con puntos tras "v", "versión" o "release" es un número de versión, no una IP
+_VERSION_PREFIXES = ("v", "ver", "version", "versión", "release")
+_NOT_VERSION = "".join(
+    rf"(?<!\b{prefix}{separator}\d)"
+    for prefix in ("".join(f"[{c.upper()}{c}]" for c in word) for word in _VERSION_PREFIXES)
+    for separator in ("", " ", ". ", ": ")
+)
+
+
+# Categoría, condición previa barata, patrón y validación. En solapes gana el tramo que empieza antes y, si
+# empiezan igual, el más largo (a igual longitud, el primero de la lista). Los patrones numéricos empiezan por
+# el dígito y comprueban el contexto con lookbehind después, para que re salte directamente a los dígitos.
+STRUCTURED_PII_PATTERNS: List[Tuple[str, str, str, Optional[Callable[[str], bool]]]] = [
+    ("Email", "@", r"(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}\b", None),
+    ("IBAN", "digit", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,4})?\b", _valid_iban),
+    ("CreditCardNumber", "digit", r"\d(?<![\d-]\d)(?:[ -]?\d){12,18}(?![\d-])", _valid_card),
+    ("NationalID", "digit", r"\b(?:\d{8}|[XYZxyz]-?\d{7})-?[A-Za-z]\b", _valid_spanish_id),
+    ("NationalID", "digit", r"\b(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b", None),
+    ("IPAddress", "digit", r"\d(?<![\d.]\d)" + _NOT_VERSION + r"\d{0,2}(?:\.\d{1,3}){3}(?!\.?\d)", _valid_ip),
+    ("IPAddress", ":", r"(?<![\w:])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![\w:])", _valid_ip),
+    ("PhoneNumber", "digit",
+     r"(?<![\w+])(?:\+\d{1,3}[ .-]?)?(?:\(\d{1,4}\)[ .-]?)?\d{2,4}(?:[ .-]?\d{2,4}){2,5}(?!\w)", _valid_phone)
+]
+
+_DIGIT = re.compile(r"\d")
+
+
+def pii_entity(text: str, category: str, offset: int, source: str) -> Dict[str, Any]:
+    return {"text": text, "category": category, "offset": offset, "length": len(text), "source": source}
+
+
+def resolve_overlaps(entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tramos sin solape ordenados por posición: gana el que empieza antes y, a igual inicio, el más largo"""
+    ranked = sorted(enumerate(entities), key=lambda item: (item[1]["offset"], -item[1]["length"], item[0]))
+    resolved: List[Dict[str, Any]] = []
+    for _, entity in ranked:
+        if resolved and entity["offset"] < resolved[-1]["offset"] + resolved[-1]["length"]:
+            continue
+        resolved.append(entity)
+    return resolved
+
+
+def locate_entities(text: str, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Completa offset y length; las entidades sin posición válida (resultados antiguos) se buscan en una pasada"""
+    located, missing = [], {}
+    for entity in entities:
+        offset, length = entity.get("offset"), entity.get("length")
+        if offset is not None and length is not None and text[offset:offset + length] == entity["text"]:
+            located.append(entity)
+        elif entity.get("text"):
+            missing.setdefault(entity["text"], entity)
+    if missing:
+        pattern = re.compile("|".join(re.escape(t) for t in sorted(missing, key=len, reverse=True)))
+        for match in pattern.finditer(text):
+            located.append({**missing[match.group(0)], "offset": match.start(), "length": len(match.group(0))})
+    return located
+
+
+def redact_spans(text: str, entities: List[Dict[str, Any]]) -> str:
+    """Redacción en una sola pasada a partir de offsets: cada tramo se sustituye por [Categoría]"""
+    if not entities:
+        return text
+    pieces, position = [], 0
+    for entity in resolve_overlaps(locate_entities(text, entities)):
+        pieces.append(text[position:entity["offset"]])
+        pieces.append(f"[{entity['category']}]")
+        position = entity["offset"] + entity["length"]
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+class PiiDetector:
+    """Detector local de PII estructurada con expresiones compiladas y validación de dígitos de control"""
+
+    def __init__(self, patterns: Optional[List[Tuple[str, str, str, Optional[Callable[[str], bool]]]]] = None):
+        self.patterns = [
+            (category, trigger, re.compile(pattern), validate)
+            for category, trigger, pattern, validate in patterns or STRUCTURED_PII_PATTERNS
+        ]
+        self.stats = {"scanned": 0, "entities": 0, "rejected_candidates": 0, "total_us": 0.0}
+        self.by_category: Dict[str, int] = {}
+
+    def detect(self, text: str) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        found = []
+        has_digit = _DIGIT.search(text) is not None
+        for category, trigger, pattern, validate in self.patterns:
+            # La mayoría de prompts no tienen dígitos ni @: se evita recorrer el texto con cada patrón
+            if not (has_digit if trigger == "digit" else trigger in text):
+                continue
+            for match in pattern.finditer(text):
+                if validate is not None and not validate(match.group(0)):
+                    self.stats["rejected_candidates"] += 1
+                    continue
+                found.append(pii_entity(match.group(0), category, match.start(), "local"))
+        entities = resolve_overlaps(found)
+        for entity in entities:
+            self.by_category[entity["category"]] = self.by_category.get(entity["category"], 0) + 1
+        self.stats["scanned"] += 1
+        self.stats["entities"] += len(entities)
+        self.stats["total_us"] += (time.perf_counter() - start) * 1e6
+        return entities
+
+    def snapshot(self) -> Dict[str, Any]:
+        scanned = self.stats["scanned"]
+        return {
+            "mode": PII_MODE,
+            **{k: v for k, v in self.stats.items() if k != "total_us"},
+            "avg_us": round(self.stats["total_us"] / scanned, 2) if scanned else 0.0,
+            "by_category": dict(self.by_category)
+        }
+
+
+pii_detector = PiiDetector()
+
+
+def merge_pii(text: str, local: List[Dict[str, Any]], remote: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Une la PII local y la de Text Analytics en tramos sin solape"""
+    return resolve_overlaps(local + locate_entities(text, remote))
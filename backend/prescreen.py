@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / "data"
+PRESCREEN_BLOCKLIST_PATH = Path(os.getenv("PRESCREEN_BLOCKLIST_PATH", DATA_DIR / "blocklist.txt"))
+PRESCREEN_JAILBREAK_RULES_PATH = Path(os.getenv("PRESCREEN_JAILBREAK_RULES_PATH", DATA_DIR / "jailbreak_rules.json"))
+PRESCREEN_RELOAD_INTERVAL = float(os.getenv("PRESCREEN_RELOAD_INTERVAL", "30"))
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "true").lower() == "true"
+
+
+def normalize_for_screening(text: str) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados para resistir variaciones triviales"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+@dataclass
+class PrescreenHit:
+    kind: str  # "blocklist" o "jailbreak"
+    rule: str
+    category: str
+
+    def safety_data(self) -> Dict[str, Any]:
+        """Resultado con el formato de analyze_content_safety, marcado como origen local"""
+        data = {"source": "local", "categories": {}, "local_rule": {"kind": self.kind, "rule": self.rule}}
+        if self.kind == "jailbreak":
+            data["jailbreak_detection"] = {"result": "JailbreakDetected", "probability": 1.0}
+        else:
+            data["blocklist_match"] = {"category": self.category}
+        return data
+
+
+class PromptPrescreener:
+    """Filtro local previo a cualquier llamada de red: lista de bloqueo y heurísticas de jailbreak"""
+
+    def __init__(self, blocklist_path: Path = PRESCREEN_BLOCKLIST_PATH,
+                 rules_path: Path = PRESCREEN_JAILBREAK_RULES_PATH,
+                 reload_interval: float = PRESCREEN_RELOAD_INTERVAL):
+        self.blocklist_path = Path(blocklist_path)
+        self.rules_path = Path(rules_path)
+        self.reload_interval = reload_interval
+        self._mtimes: Tuple[float, float] = (0.0, 0.0)
+        self._checked_at = 0.0
+        self._blocklist_regex: Optional[re.Pattern] = None
+        self._blocklist_categories: Dict[str, str] = {}
+        self._jailbreak_regex: Optional[re.Pattern] = None
+        self._rule_names: Dict[str, str] = {}
+        self.stats = {"screened": 0, "blocklist_hits": 0, "jailbreak_hits": 0, "reloads": 0, "total_us": 0.0}
+        self.reload()
+
+    def _file_mtimes(self) -> Tuple[float, float]:
+        return tuple(path.stat().st_mtime if path.exists() else 0.0 for path in (self.blocklist_path, self.rules_path))
+
+    def _load_blocklist(self) -> Tuple[Dict[str, str], Optional[re.Pattern]]:
+        entries = {}
+        if self.blocklist_path.exists():
+            for line in self.blocklist_path.read_text(encoding="utf-8").splitlines():
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                category, _, term = line.partition(":") if ":" in line else ("Blocklist", "", line)
+                if term := normalize_for_screening(term):
+                    entries[term] = category.strip()
+
+        # Una sola alternancia compilada; los términos largos primero para preferir la coincidencia más específica
+        terms = sorted(entries, key=len, reverse=True)
+        regex = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\b") if terms else None
+        return entries, regex
+
+    def _load_rules(self) -> Tuple[Dict[str, str], Optional[re.Pattern]]:
+        rules = json.loads(self.rules_path.read_text(encoding="utf-8")) if self.rules_path.exists() else []
+        groups = []
+        names = {}
+        for index, rule in enumerate(rules):
+            group = f"r{index}"
+            re.compile(rule["pattern"])  # valida cada regla por separado para un error claro
+            names[group] = rule["name"]
+            groups.append(f"(?P<{group}>{rule['pattern']})")
+        # Todas las reglas empiezan en inicio de palabra: anclarlo fuera de la alternancia evita probarlas en cada carácter
+        regex = re.compile(r"(?<!\w)(?=\w)(?:" + "|".join(groups) + ")") if groups else None
+        return names, regex
+
+    def reload(self) -> None:
+        """Recompila la lista de bloqueo y las reglas; si fallan se conservan las anteriores"""
+        try:
+            mtimes = self._file_mtimes()
+            blocklist = self._load_blocklist()
+            rules = self._load_rules()
+            # Se sustituye todo a la vez: un fichero inválido no deja un filtro a medio cargar
+            self._blocklist_categories, self._blocklist_regex = blocklist
+            self._rule_names, self._jailbreak_regex = rules
+            self._mtimes = mtimes
+            self.stats["reloads"] += 1
+            logger.info(
+                f"Prefiltro local cargado: {len(self._blocklist_categories)} términos, "
+                f"{len(self._rule_names)} reglas de jailbreak"
+            )
+        except Exception as e:
+            logger.error(f"Error recargando el prefiltro local: {str(e)}")
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            if self._file_mtimes() != self._mtimes:
+                self.reload()
+        except OSError as e:
+            logger.warning(f"No se pudo comprobar el prefiltro local: {str(e)}")
+
+    def screen(self, text: str) -> Optional[PrescreenHit]:
+        """Devuelve la primera coincidencia local o None si el texto pasa el filtro"""
+        self._maybe_reload()
+        start = time.perf_counter()
+        normalized = normalize_for_screening(text)
+        hit = None
+
+        if self._jailbreak_regex and (match := self._jailbreak_regex.search(normalized)):
+            hit = PrescreenHit(kind="jailbreak", rule=self._rule_names[match.lastgroup], category="Jailbreak")
+            self.stats["jailbreak_hits"] += 1
+        elif self._blocklist_regex and (match := self._blocklist_regex.search(normalized)):
+            category = self._blocklist_categories.get(match.group(0), "Blocklist")
+            hit = PrescreenHit(kind="blocklist", rule=match.group(0), category=category)
+            self.stats["blocklist_hits"] += 1
+
+        self.stats["screened"] += 1
+        self.stats["total_us"] += (time.perf_counter() - start) * 1e6
+        return hit
+
+    def snapshot(self) -> Dict[str, Any]:
+        screened = self.stats["screened"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_us"},
+            "avg_us": round(self.stats["total_us"] / screened, 2) if screened else 0.0,
+            "blocklist_terms": len(self._blocklist_categories),
+            "jailbreak_rules": len(self._rule_names)
+        }
+
+
+prescreener = PromptPrescreener()
@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Deque, Dict, Optional
+
+from backend.telemetry import record_stage
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo que una petición espera turno antes de rendirse con RateLimitExceeded
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+# Retry-After más largo que se respeta dentro de una petición
+RETRY_AFTER_MAX = float(os.getenv("RETRY_AFTER_MAX", "20"))
+
+# Cuota del despliegue de Azure OpenAI (0 desactiva el límite)
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "120000"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "720"))
+# Tokens de respuesta reservados por completion hasta conocer el usage real
+OPENAI_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "600"))
+
+CONTENT_SAFETY_MAX_INFLIGHT = int(os.getenv("CONTENT_SAFETY_MAX_INFLIGHT", "32"))
+CONTENT_SAFETY_LATENCY_TARGET_MS = float(os.getenv("CONTENT_SAFETY_LATENCY_TARGET_MS", "2000"))
+TEXT_ANALYTICS_MAX_INFLIGHT = int(os.getenv("TEXT_ANALYTICS_MAX_INFLIGHT", "16"))
+TEXT_ANALYTICS_LATENCY_TARGET_MS = float(os.getenv("TEXT_ANALYTICS_LATENCY_TARGET_MS", "3000"))
+
+
+class RateLimitExceeded(Exception):
+    """La cuota local de una dependencia no se libera dentro del tiempo de espera permitido"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"Límite de {dependency} agotado; reintentar en {retry_after:.1f}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+# ---------- Retry-After ----------
+def _headers(error: BaseException):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def is_throttled(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Retry-After de una respuesta de Azure u OpenAI (milisegundos, segundos o fecha HTTP)"""
+    headers = _headers(error)
+    for header, scale in (("retry-after-ms", 1000), ("x-ms-retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(header)
+        if not value:
+            continue
+        try:
+            return max(float(value) / scale, 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+def wait_retry_after(fallback: Callable) -> Callable:
+    """Espera de tenacity que respeta Retry-After y, si no lo hay, usa la estrategia indicada"""
+    def wait(retry_state) -> float:
+        error = retry_state.outcome.exception() if retry_state.outcome else None
+        if error is not None and (seconds := retry_after_seconds(error)) is not None:
+            return min(seconds, RETRY_AFTER_MAX)
+        return fallback(retry_state)
+    return wait
+
+
+# ---------- Concurrencia adaptativa ----------
+class AdaptiveConcurrencyLimiter:
+    """Límite de llamadas simultáneas con AIMD: +1/límite por éxito, mitad ante 429 o latencia excesiva
+
+    Un 429 con Retry-After además pausa la dependencia; las peticiones esperan en cola hasta max_wait.
+    """
+
+    DECREASE_COOLDOWN = 1.0
+
+    def __init__(self, name: str, max_limit: int, min_limit: int = 1,
+                 latency_target_ms: Optional[float] = None, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_target_ms = latency_target_ms
+        self.max_wait = max_wait
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.stats = {"calls": 0, "throttled": 0, "slow": 0, "decreases": 0, "queued": 0, "rejected": 0,
+                      "wait_ms_total": 0.0}
+
+    def _wake(self) -> None:
+        """Traspasa los huecos libres a los primeros de la cola: nadie que llegue después se los adelanta"""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _leave_queue(self, waiter: asyncio.Future) -> bool:
+        """Saca de la cola a quien deja de esperar; True si ya se le había traspasado un hueco"""
+        if waiter.done() and not waiter.cancelled():
+            return True
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        return False
+
+    async def _acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        if self.blocked_until > deadline:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded(self.name, self.blocked_until - loop.time())
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            self.stats["queued"] += 1
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, self.max_wait)
+            except asyncio.TimeoutError:
+                # El hueco pudo traspasarse justo al agotarse la espera: entonces se aprovecha
+                if not self._leave_queue(waiter):
+                    self.stats["rejected"] += 1
+                    raise RateLimitExceeded(self.name, self.max_wait) from None
+            except asyncio.CancelledError:
+                if self._leave_queue(waiter):
+                    self._release()
+                raise
+        # Con el hueco ya reservado se respeta la pausa de un Retry-After
+        try:
+            while (now := loop.time()) < self.blocked_until:
+                if self.blocked_until > deadline:
+                    self.stats["rejected"] += 1
+                    raise RateLimitExceeded(self.name, self.blocked_until - now)
+                await asyncio.sleep(self.blocked_until - now)
+        except BaseException:
+            self._release()
+            raise
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # Una sola reducción por ventana: una ráfaga de 429 simultáneos no hunde el límite a cero
+        if now - self._last_decrease >= self.DECREASE_COOLDOWN:
+            self.limit = max(float(self.min_limit), self.limit / 2)
+            self._last_decrease = now
+            self.stats["decreases"] += 1
+            logger.warning(f"{self.name}: límite de concurrencia reducido a {int(self.limit)}")
+
+    def on_throttle(self, retry_after: Optional[float]) -> None:
+        self.stats["throttled"] += 1
+        self._decrease()
+        if retry_after:
+            loop_now = asyncio.get_running_loop().time()
+            self.blocked_until = max(self.blocked_until, loop_now + min(retry_after, RETRY_AFTER_MAX))
+
+    def on_success(self, elapsed_ms: float) -> None:
+        if self.latency_target_ms and elapsed_ms > self.latency_target_ms:
+            self.stats["slow"] += 1
+            self._decrease()
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        wait_started = time.perf_counter()
+        await self._acquire()
+        waited = time.perf_counter() - wait_started
+        self.stats["wait_ms_total"] += waited * 1000
+        if waited > 0.001:
+            record_stage(f"queue.{self.name}", waited)
+        self.stats["calls"] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if is_throttled(e):
+                self.on_throttle(retry_after_seconds(e))
+            raise
+        else:
+            self.on_success((time.perf_counter() - started) * 1000)
+        finally:
+            self._release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            **{k: v for k, v in self.stats.items() if k != "wait_ms_total"},
+            "avg_wait_ms": round(self.stats["wait_ms_total"] / self.stats["calls"], 2) if self.stats["calls"] else 0.0
+        }
+
+
+# ---------- Cuota de OpenAI ----------
+class TokenBucket:
+    """Cubo que se rellena de forma continua hasta per_minute unidades"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # Una petición mayor que la capacidad espera a tener el cubo lleno
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def give_back(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class OpenAIReservation:
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.usage = None
+
+
+class OpenAIRateLimiter:
+    """Cubos de tokens por minuto (TPM) y peticiones por minuto (RPM) de Azure OpenAI
+
+    Cada completion reserva una estimación; al recibir usage se devuelve o se cobra la diferencia.
+    """
+
+    def __init__(self, tpm: int = OPENAI_TPM_LIMIT, rpm: int = OPENAI_RPM_LIMIT, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.max_wait = max_wait
+        self.blocked_until = 0.0
+        # Turnos en orden de llegada; el lock se crea por event loop (pruebas y CLI usan varios)
+        self._turn: Optional[asyncio.Lock] = None
+        self._turn_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"calls": 0, "throttled": 0, "queued": 0, "rejected": 0, "wait_ms_total": 0.0,
+                      "estimated_tokens": 0, "actual_tokens": 0}
+
+    def _wait_time(self, tokens: int) -> float:
+        return max(
+            self.blocked_until - time.monotonic(),
+            self.tokens.wait_time(tokens) if self.tokens else 0.0,
+            self.requests.wait_time(1) if self.requests else 0.0
+        )
+
+    def _turn_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._turn_loop is not loop:
+            self._turn, self._turn_loop = asyncio.Lock(), loop
+        return self._turn
+
+    async def acquire(self, tokens: int) -> None:
+        started = time.monotonic()
+        lock = self._turn_lock()
+        queued = lock.locked()
+        if queued:
+            self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(lock.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise RateLimitExceeded("openai", self.max_wait) from None
+        try:
+            # Con el turno, el saldo se vuelve a comprobar tras cada espera antes de descontar: dos peticiones
+            # que esperaban no cobran a la vez los mismos tokens
+            while (wait := self._wait_time(tokens)) > 0:
+                if time.monotonic() - started + wait > self.max_wait:
+                    self.stats["rejected"] += 1
+                    raise RateLimitExceeded("openai", wait)
+                if not queued:
+                    self.stats["queued"] += 1
+                    queued = True
+                await asyncio.sleep(wait)
+            if self.tokens:
+                self.tokens.take(tokens)
+            if self.requests:
+                self.requests.take(1)
+        finally:
+            lock.release()
+        waited = time.monotonic() - started
+        self.stats["wait_ms_total"] += waited * 1000
+        if waited > 0.001:
+            record_stage("queue.openai", waited)
+
+    def settle(self, reserved: int, used: int) -> None:
+        if self.tokens:
+            if used < reserved:
+                self.tokens.give_back(reserved - used)
+            else:
+                self.tokens.take(used - reserved)
+
+    def on_throttle(self, retry_after: Optional[float]) -> None:
+        self.stats["throttled"] += 1
+        # Sin Retry-After se asume que la cuota se recupera en el siguiente segundo
+        pause = min(retry_after if retry_after is not None else 1.0, RETRY_AFTER_MAX)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    @asynccontextmanager
+    async def reserve(self, estimated_tokens: int):
+        """Reserva cuota para una completion; quien llama deja el usage en la reserva si lo recibe"""
+        await self.acquire(estimated_tokens)
+        self.stats["calls"] += 1
+        reservation = OpenAIReservation(estimated_tokens)
+        try:
+            yield reservation
+        except Exception as e:
+            # Una petición rechazada no consume cuota
+            self.settle(estimated_tokens, 0)
+            if is_throttled(e):
+                self.on_throttle(retry_after_seconds(e))
+            raise
+        else:
+            used = getattr(reservation.usage, "total_tokens", None) or estimated_tokens
+            self.settle(estimated_tokens, used)
+            self.stats["estimated_tokens"] += estimated_tokens
+            self.stats["actual_tokens"] += used
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "tpm_limit": int(self.tokens.capacity) if self.tokens else None,
+            "rpm_limit": int(self.requests.capacity) if self.requests else None,
+            "tokens_available": int(self.tokens.tokens) if self.tokens else None,
+            **{k: v for k, v in self.stats.items() if k != "wait_ms_total"},
+            "avg_wait_ms": round(self.stats["wait_ms_total"] / self.stats["calls"], 2) if self.stats["calls"] else 0.0
+        }
+
+
+def estimate_tokens(messages: list) -> int:
+    """Aproximación de ~4 caracteres por token más la respuesta esperada"""
+    return sum(len(message["content"]) for message in messages) // 4 + OPENAI_COMPLETION_TOKENS_ESTIMATE
+
+
+openai_limiter = OpenAIRateLimiter()
+content_safety_limiter = AdaptiveConcurrencyLimiter(
+    "content_safety", CONTENT_SAFETY_MAX_INFLIGHT, latency_target_ms=CONTENT_SAFETY_LATENCY_TARGET_MS
+)
+text_analytics_limiter = AdaptiveConcurrencyLimiter(
+    "text_analytics", TEXT_ANALYTICS_MAX_INFLIGHT, latency_target_ms=TEXT_ANALYTICS_LATENCY_TARGET_MS
+)
+
+
+def limiters_snapshot() -> Dict[str, Any]:
+    return {
+        "openai": openai_limiter.snapshot(),
+        "content_safety": content_safety_limiter.snapshot(),
+        "text_analytics": text_analytics_limiter.snapshot()
+    }
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.database import get_rejected_container, iter_query_pages
+
+logger = logging.getLogger(__name__)
+
+REJECTED_FILTER_ENABLED = os.getenv("REJECTED_FILTER_ENABLED", "true").lower() == "true"
+# Hashes distintos previstos y tasa de falsos positivos objetivo: 1M con 0.1% ocupa ~1.7 MB
+REJECTED_FILTER_CAPACITY = int(os.getenv("REJECTED_FILTER_CAPACITY", "1000000"))
+REJECTED_FILTER_FP_RATE = float(os.getenv("REJECTED_FILTER_FP_RATE", "0.001"))
+REJECTED_FILTER_CONFIRM_TIMEOUT = float(os.getenv("REJECTED_FILTER_CONFIRM_TIMEOUT", "1"))
+# Rechazos recientes de este proceso: se confirman sin leer la base de datos mientras la escritura diferida
+# de auditoría aún no los ha guardado
+REJECTED_FILTER_RECENT = int(os.getenv("REJECTED_FILTER_RECENT", "1000"))
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre un bytearray; las k posiciones salen del SHA-256 por doble hashing"""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(capacity, 1)
+        self.fp_rate = fp_rate
+        self.num_bits = max(math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2), 64)
+        self.num_hashes = max(round(self.num_bits / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: str) -> List[int]:
+        first, second = int(digest[:16], 16), int(digest[16:32], 16) | 1
+        return [(first + i * second) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, digest: str) -> None:
+        if digest in self:
+            return
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def estimated_fp_rate(self) -> float:
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class RejectedPromptFilter:
+    """Índice de pertenencia de los prompts rechazados (prompt_hash de RejectedPrompts)
+
+    Un fallo del filtro es definitivo y cuesta unos microsegundos; un acierto se confirma leyendo un único
+    documento con ese hash antes de rechazar sin llamar a Content Safety.
+    """
+
+    def __init__(self, capacity: int = REJECTED_FILTER_CAPACITY, fp_rate: float = REJECTED_FILTER_FP_RATE):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.bloom = BloomFilter(capacity, fp_rate)
+        self.recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.fingerprint: Optional[str] = None
+        self.is_rejection: Callable[[Dict[str, Any]], bool] = lambda safety_analysis: True
+        self.loaded = False
+        self.load_ms: Optional[float] = None
+        self.stats = {"lookups": 0, "filter_hits": 0, "confirmed": 0, "false_positives": 0, "stale": 0,
+                      "confirm_errors": 0, "added": 0, "rebuilds": 0, "loaded_documents": 0, "total_us": 0.0}
+        # Hashes añadidos mientras se reconstruye el filtro, para copiarlos al nuevo
+        self._pending: Optional[List[str]] = None
+        self._load_task: Optional[asyncio.Task] = None
+
+    def add(self, digest: str, safety_analysis: Dict[str, Any]) -> None:
+        self.bloom.add(digest)
+        if self._pending is not None:
+            self._pending.append(digest)
+        self.recent[digest] = safety_analysis
+        self.recent.move_to_end(digest)
+        while len(self.recent) > REJECTED_FILTER_RECENT:
+            self.recent.popitem(last=False)
+        self.stats["added"] += 1
+
+    def might_contain(self, digest: str) -> bool:
+        start = time.perf_counter()
+        hit = digest in self.bloom
+        self.stats["lookups"] += 1
+        self.stats["filter_hits"] += hit
+        self.stats["total_us"] += (time.perf_counter() - start) * 1e6
+        return hit
+
+    async def confirm(self, digest: str) -> Optional[Dict[str, Any]]:
+        """safety_analysis de un rechazo guardado con ese hash y vigente con los umbrales actuales, o None
+        (falso positivo, rechazo ya no vigente o error de lectura)"""
+        safety_analysis = self.recent.get(digest)
+        if safety_analysis is None:
+            query = (
+                "SELECT TOP 1 c.id, c.safety_analysis FROM c "
+                "WHERE c.prompt_hash = @prompt_hash AND c.status = 'rejected'"
+            )
+            try:
+                items = await asyncio.wait_for(self._first_match(query, digest), REJECTED_FILTER_CONFIRM_TIMEOUT)
+            except Exception as e:
+                self.stats["confirm_errors"] += 1
+                logger.warning(f"No se pudo confirmar un prompt rechazado previamente: {str(e)}")
+                return None
+            safety_analysis = items[0].get("safety_analysis") if items else None
+        if safety_analysis is None:
+            self.stats["false_positives"] += 1
+            return None
+        if not self.is_rejection(safety_analysis):
+            # Acierto real del filtro sobre un rechazo que ya no es vigente: no es una colisión de hashes
+            self.stats["stale"] += 1
+            return None
+        self.stats["confirmed"] += 1
+        return safety_analysis
+
+    async def _first_match(self, query: str, digest: str) -> List[dict]:
+        parameters = [{"name": "@prompt_hash", "value": digest}]
+        return [item async for item in get_rejected_container().query_items(query=query, parameters=parameters)]
+
+    def ensure_fingerprint(self, fingerprint: str, is_rejection: Callable[[Dict[str, Any]], bool]) -> None:
+        """Reconstruye el filtro si cambiaron los umbrales de seguridad: solo cuentan los rechazos vigentes"""
+        self.is_rejection = is_rejection
+        changed = self.fingerprint is not None and self.fingerprint != fingerprint
+        self.fingerprint = fingerprint
+        if changed:
+            logger.info("Umbrales de seguridad modificados, reconstruyendo el filtro de prompts rechazados")
+            self.recent.clear()
+            self.start_rebuild()
+
+    async def rebuild(self) -> int:
+        """Carga los hashes de RejectedPrompts en un filtro nuevo y lo sustituye al terminar"""
+        start = time.perf_counter()
+        self._pending = []
+        bloom = BloomFilter(self.capacity, self.fp_rate)
+        query = "SELECT c.prompt_hash, c.safety_analysis FROM c WHERE c.status = 'rejected'"
+        documents = 0
+        try:
+            async for page in iter_query_pages(get_rejected_container(), query):
+                for document in page:
+                    if document.get("prompt_hash") and self.is_rejection(document.get("safety_analysis") or {}):
+                        bloom.add(document["prompt_hash"])
+                documents += len(page)
+            for digest in self._pending:
+                bloom.add(digest)
+        finally:
+            self._pending = None
+        self.bloom = bloom
+        self.loaded = True
+        self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.stats["rebuilds"] += 1
+        self.stats["loaded_documents"] = documents
+        if bloom.count > self.capacity:
+            logger.warning(
+                f"Filtro de prompts rechazados por encima de su capacidad ({bloom.count} > {self.capacity}): "
+                f"aumenta REJECTED_FILTER_CAPACITY"
+            )
+        logger.info(
+            f"Filtro de prompts rechazados cargado en {self.load_ms} ms: {bloom.count} hashes de {documents} documentos"
+        )
+        return bloom.count
+
+    async def _rebuild_safely(self) -> None:
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.error(f"Error cargando el filtro de prompts rechazados: {str(e)}")
+
+    def start_rebuild(self) -> None:
+        if self._load_task is None or self._load_task.done():
+            self._load_task = asyncio.create_task(self._rebuild_safely())
+
+    async def stop(self) -> None:
+        if self._load_task is not None:
+            self._load_task.cancel()
+            try:
+                await self._load_task
+            except asyncio.CancelledError:
+                pass
+            self._load_task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["lookups"]
+        # Falsos positivos sobre los prompts sin documento guardado (sin rechazos no vigentes ni lecturas fallidas)
+        negatives = lookups - self.stats["confirmed"] - self.stats["stale"] - self.stats["confirm_errors"]
+        return {
+            "enabled": REJECTED_FILTER_ENABLED,
+            "loaded": self.loaded,
+            "load_ms": self.load_ms,
+            **{k: v for k, v in self.stats.items() if k != "total_us"},
+            "avg_lookup_us": round(self.stats["total_us"] / lookups, 2) if lookups else 0.0,
+            "entries": self.bloom.count,
+            "capacity": self.capacity,
+            "num_hashes": self.bloom.num_hashes,
+            "memory_kb": round(len(self.bloom.bits) / 1024, 1),
+            "target_fp_rate": self.fp_rate,
+            "estimated_fp_rate": round(self.bloom.estimated_fp_rate(), 6),
+            "observed_fp_rate": round(self.stats["false_positives"] / negatives, 6) if negatives else 0.0
+        }
+
+
+rejected_prompts_filter = RejectedPromptFilter()
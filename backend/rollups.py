@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from backend.database import cosmos_connections, get_analytics_container, get_rollups_container, iter_query_pages
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_CONTAINER = os.getenv("ROLLUPS_CONTAINER", "DailyRollups")
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+# Varios documentos por día reparten la contención de escritura; la lectura los suma
+ROLLUP_SHARDS = int(os.getenv("ROLLUP_SHARDS", "4"))
+ROLLUP_MAX_RETRIES = int(os.getenv("ROLLUP_MAX_RETRIES", "5"))
+# Margen tras medianoche (UTC) en el que el día anterior aún puede recibir incrementos en vivo
+ROLLUP_CLOSE_GRACE = int(os.getenv("ROLLUP_CLOSE_GRACE", "300"))
+
+SCORE_FIELDS = {"safety": "safety_score", "fairness": "fairness_score", "inclusivity": "inclusivity_score"}
+SENTIMENT_FIELDS = ["positive", "neutral", "negative"]
+SAFETY_FIELDS = {"hate": "Hate", "selfHarm": "SelfHarm", "sexual": "Sexual", "violence": "Violence"}
+ROLLUP_VALUE_KEYS = {"count", "issues_total", "scores", "sentiment", "content_safety", "issues", "categories"}
+
+
+# El contenedor se crea con la primera lectura o escritura de cada proceso
+_container_state = {"ready": False}
+
+
+def number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def rollup_increments(doc: dict) -> Dict[str, Any]:
+    """Contribución de un documento de auditoría al agregado de su día"""
+    analysis = doc.get("analysis", {})
+    metadata = doc.get("metadata", {})
+    text_analytics = metadata.get("text_analytics") or {}
+    safety = metadata.get("safety") or {}
+    # analyze_content_safety guarda las severidades bajo "categories"
+    safety_categories = safety.get("categories", safety)
+    sentiment = text_analytics.get("sentiment", {}).get("scores", {})
+    issues = analysis.get("issues", []) or []
+
+    increments = {
+        "count": 1,
+        "issues_total": len(issues),
+        "scores": {field: number(analysis.get(source)) for field, source in SCORE_FIELDS.items()},
+        "sentiment": {field: number(sentiment.get(field)) for field in SENTIMENT_FIELDS},
+        "content_safety": {field: number(safety_categories.get(source)) for field, source in SAFETY_FIELDS.items()},
+        "issues": defaultdict(int),
+        "categories": {}
+    }
+    for issue in issues:
+        increments["issues"][f"{issue.get('type', 'unknown')}|{issue.get('severity', 'medium')}"] += 1
+    increments["issues"] = dict(increments["issues"])
+    if key_phrases := text_analytics.get("key_phrases"):
+        increments["categories"] = {key_phrases[0]: 1}
+    return increments
+
+
+def merge_rollup(target: Dict[str, Any], increments: Dict[str, Any]) -> Dict[str, Any]:
+    """Suma recursivamente los contadores de increments sobre target"""
+    for key, value in increments.items():
+        if isinstance(value, dict):
+            merge_rollup(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+    return target
+
+
+def rollup_id(date: str, shard: int) -> str:
+    return f"{date}:{shard}"
+
+
+def new_rollup(date: str, shard: int) -> Dict[str, Any]:
+    return {"id": rollup_id(date, shard), "date": date, "shard": shard, "type": "daily_rollup"}
+
+
+async def ensure_rollups_container() -> None:
+    """Crea el contenedor de agregados (partición /date) si aún no existe"""
+    if _container_state["ready"]:
+        return
+    from azure.cosmos import PartitionKey
+
+    await cosmos_connections.database.create_container_if_not_exists(
+        id=ROLLUPS_CONTAINER, partition_key=PartitionKey(path="/date")
+    )
+    _container_state["ready"] = True
+
+
+def first_open_date() -> str:
+    """Primer día que todavía puede recibir incrementos en vivo"""
+    return (datetime.utcnow() - timedelta(seconds=ROLLUP_CLOSE_GRACE)).date().isoformat()
+
+
+async def record_rollup(doc: dict) -> None:
+    """Incrementa el agregado diario con concurrencia optimista (ETag)"""
+    if not ROLLUPS_ENABLED:
+        return
+    # El SDK de Cosmos se importa con la primera escritura, no al arrancar
+    from azure.core import MatchConditions
+    from azure.cosmos.exceptions import (
+        CosmosAccessConditionFailedError,
+        CosmosResourceExistsError,
+        CosmosResourceNotFoundError
+    )
+
+    date = doc["timestamp"][:10]
+    increments = rollup_increments(doc)
+    container = get_rollups_container()
+    shard = random.randrange(ROLLUP_SHARDS)
+
+    try:
+        await ensure_rollups_container()
+        for _ in range(ROLLUP_MAX_RETRIES):
+            try:
+                current = await container.read_item(item=rollup_id(date, shard), partition_key=date)
+            except CosmosResourceNotFoundError:
+                try:
+                    await container.create_item(merge_rollup(new_rollup(date, shard), increments))
+                    return
+                except CosmosResourceExistsError:
+                    continue
+            try:
+                await container.replace_item(
+                    item=current["id"],
+                    body=merge_rollup(current, increments),
+                    etag=current["_etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+                return
+            except CosmosAccessConditionFailedError:
+                # Otra escritura modificó el agregado: se relee y se reintenta
+                continue
+        logger.error(f"Agregado diario {date} no actualizado tras {ROLLUP_MAX_RETRIES} intentos")
+    except Exception as e:
+        logger.error(f"Error actualizando agregado diario {date}: {str(e)}")
+
+
+async def read_rollups(days: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """Agregados por fecha (fragmentos ya sumados); days=None devuelve todo el histórico"""
+    await ensure_rollups_container()
+    container = get_rollups_container()
+    if days is None:
+        query, parameters = "SELECT * FROM c", []
+    else:
+        start = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+        query, parameters = "SELECT * FROM c WHERE c.date >= @startDate", [{"name": "@startDate", "value": start}]
+
+    by_date: Dict[str, Dict[str, Any]] = {}
+    async for shard_doc in container.query_items(query=query, parameters=parameters):
+        merged = by_date.setdefault(shard_doc["date"], {"date": shard_doc["date"]})
+        merge_rollup(merged, {k: v for k, v in shard_doc.items() if k in ROLLUP_VALUE_KEYS})
+    return dict(sorted(by_date.items()))
+
+
+def average(rollup: Dict[str, Any], section: str, fields: Iterable[str]) -> Dict[str, float]:
+    count = rollup.get("count", 0)
+    values = rollup.get(section, {})
+    return {field: round(values.get(field, 0.0) / count, 2) if count else 0.0 for field in fields}
+
+
+def build_rollups(docs: Iterable[dict],
+                  by_date: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Agrega documentos de auditoría por día en memoria; by_date permite acumular página a página"""
+    by_date = {} if by_date is None else by_date
+    for doc in docs:
+        try:
+            date = doc["timestamp"][:10]
+        except (KeyError, TypeError):
+            logger.warning(f"Documento sin timestamp: {doc.get('id')}")
+            continue
+        merge_rollup(by_date.setdefault(date, {"date": date}), rollup_increments(doc))
+    return by_date
+
+
+async def backfill(days: Optional[int] = None) -> List[str]:
+    """Recalcula los agregados desde Analytics y sustituye los existentes de esas fechas
+
+    Con las escrituras en vivo activas (ROLLUPS_ENABLED) solo se recalculan los días cerrados: sustituir los
+    fragmentos de un día abierto perdería los incrementos que lleguen entre la lectura y la escritura.
+    """
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+    await ensure_rollups_container()
+
+    conditions, parameters = [], []
+    if days is not None:
+        conditions.append("c.timestamp >= @startDate")
+        parameters.append({"name": "@startDate", "value": (datetime.utcnow() - timedelta(days=days)).date().isoformat()})
+    if ROLLUPS_ENABLED:
+        logger.warning(f"Escrituras en vivo activas: el backfill omite los días desde {first_open_date()}")
+        conditions.append("c.timestamp < @openDate")
+        parameters.append({"name": "@openDate", "value": first_open_date()})
+    query = "SELECT * FROM c" + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+    rollups: Dict[str, Dict[str, Any]] = {}
+    documents = 0
+    async for page in iter_query_pages(get_analytics_container(), query, parameters):
+        documents += len(page)
+        build_rollups(page, rollups)
+
+    container = get_rollups_container()
+    for date, rollup in rollups.items():
+        for shard in range(ROLLUP_SHARDS):
+            try:
+                await container.delete_item(item=rollup_id(date, shard), partition_key=date)
+            except CosmosResourceNotFoundError:
+                pass
+        await container.upsert_item({**new_rollup(date, 0), **{k: v for k, v in rollup.items() if k != "date"}})
+    logger.info(f"Backfill de agregados: {documents} documentos en {len(rollups)} días")
+    return sorted(rollups)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    from backend.clients import azure_clients
+
+    await azure_clients.start()
+    try:
+        dates = await backfill(args.days)
+        print(f"Agregados recalculados para {len(dates)} días")
+    finally:
+        await azure_clients.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Agregados diarios del dashboard")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Recalcula los agregados desde el contenedor Analytics")
+    backfill_parser.add_argument("--days", type=int, default=None, help="Solo los últimos N días")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculationStats:
+    """Trabajo ahorrado y desperdiciado por las etapas especulativas"""
+
+    def __init__(self):
+        self.started = 0
+        self.committed = 0
+        self.cancelled = 0
+        self.wasted_ms = 0.0
+        self.overlap_ms = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "committed": self.committed,
+            "cancelled": self.cancelled,
+            "wasted_ms": round(self.wasted_ms, 2),
+            "overlap_saved_ms": round(self.overlap_ms, 2),
+            "waste_ratio": round(self.cancelled / self.started, 4) if self.started else 0.0
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+class SpeculativeStage:
+    """Etapa lanzada antes de conocer el veredicto de seguridad"""
+
+    def __init__(self, name: str, coro: Awaitable):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.task = asyncio.create_task(coro)
+        self.task.add_done_callback(self._on_done)
+        speculation_stats.started += 1
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self.finished_at = time.perf_counter()
+        # Evita el aviso de excepción no recuperada si la etapa se descarta
+        if not task.cancelled():
+            task.exception()
+
+    def elapsed_ms(self) -> float:
+        return ((self.finished_at or time.perf_counter()) - self.started_at) * 1000
+
+    def commit(self, safety_ms: float) -> asyncio.Task:
+        """La verificación pasó: el trabajo solapado con la seguridad se contabiliza como ahorro"""
+        speculation_stats.committed += 1
+        speculation_stats.overlap_ms += min(safety_ms, self.elapsed_ms())
+        return self.task
+
+    def discard(self, reason: str) -> None:
+        """La verificación rechazó el prompt o falló: se cancela y se contabiliza como desperdicio"""
+        self.task.cancel()
+        wasted = self.elapsed_ms()
+        speculation_stats.cancelled += 1
+        speculation_stats.wasted_ms += wasted
+        logger.info(f"Etapa especulativa {self.name} descartada ({reason}) tras {wasted:.1f} ms")
@@ -0,0 +1,78 @@
+import json
+from typing import Any, Optional
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class JsonStringFieldStream:
+    """Extrae de forma incremental el valor de un campo de texto de un JSON recibido por fragmentos"""
+
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field: str):
+        self.key = json.dumps(field)
+        self.buffer = ""
+        self.position: Optional[int] = None
+        self.finished = False
+
+    def _find_value_start(self) -> None:
+        key_index = self.buffer.find(self.key)
+        if key_index < 0:
+            return
+        index = key_index + len(self.key)
+        while index < len(self.buffer) and self.buffer[index] in " \t\r\n:":
+            index += 1
+        if index < len(self.buffer):
+            if self.buffer[index] == '"':
+                self.position = index + 1
+            else:
+                # El campo no es un texto: no hay nada que transmitir
+                self.finished = True
+
+    def feed(self, chunk: str) -> str:
+        """Añade un fragmento y devuelve el texto nuevo decodificado del campo"""
+        if self.finished:
+            return ""
+        self.buffer += chunk
+        if self.position is None:
+            self._find_value_start()
+            if self.position is None:
+                return ""
+
+        output = []
+        index = self.position
+        while index < len(self.buffer):
+            char = self.buffer[index]
+            if char == '"':
+                self.finished = True
+                index += 1
+                break
+            if char == '\\':
+                # Un escape partido entre fragmentos espera al siguiente
+                if index + 1 >= len(self.buffer):
+                    break
+                code = self.buffer[index + 1]
+                if code == 'u':
+                    if index + 6 > len(self.buffer):
+                        break
+                    code_point = int(self.buffer[index + 2:index + 6], 16)
+                    if 0xD800 <= code_point < 0xDC00:
+                        # Par sustituto: se necesitan los dos escapes completos
+                        if index + 12 > len(self.buffer):
+                            break
+                        low = int(self.buffer[index + 8:index + 12], 16)
+                        code_point = 0x10000 + ((code_point - 0xD800) << 10) + (low - 0xDC00)
+                        index += 6
+                    output.append(chr(code_point))
+                    index += 6
+                else:
+                    output.append(self.ESCAPES.get(code, code))
+                    index += 2
+                continue
+            output.append(char)
+            index += 1
+        self.position = index
+        return "".join(output)
@@ -0,0 +1,127 @@
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Registro propio: solo las métricas del servicio, sin las del proceso por defecto
+registry = CollectorRegistry()
+
+STAGE_LATENCY = Histogram(
+    "prompt_guardian_stage_duration_seconds",
+    "Duración de cada etapa del pipeline de análisis",
+    ["stage", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry=registry
+)
+RETRIES = Counter(
+    "prompt_guardian_retries_total",
+    "Reintentos de tenacity por operación",
+    ["operation"],
+    registry=registry
+)
+COALESCED_REQUESTS = Counter(
+    "prompt_guardian_coalesced_requests_total",
+    "Análisis por papel en la coalescencia: leader ejecuta, follower espera, overflow supera el límite",
+    ["role"],
+    registry=registry
+)
+DEGRADED_STAGES = Counter(
+    "prompt_guardian_degraded_stages_total",
+    "Etapas opcionales omitidas por plazo agotado, fallo o circuito abierto",
+    ["stage"],
+    registry=registry
+)
+REQUEST_LATENCY = Histogram(
+    "prompt_guardian_request_duration_seconds",
+    "Duración de las peticiones HTTP por ruta",
+    ["method", "route", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    registry=registry
+)
+
+# Etapas medidas en la petición en curso, para la cabecera Server-Timing
+stage_timings_var: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+
+def record_stage(stage: str, elapsed_s: float, outcome: str = "ok") -> None:
+    STAGE_LATENCY.labels(stage=stage, outcome=outcome).observe(elapsed_s)
+    if (timings := stage_timings_var.get()) is not None:
+        timings.append((stage, elapsed_s * 1000))
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Mide un bloque como etapa; los errores se registran con outcome=error"""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, outcome)
+
+
+def timed_stage(stage: str) -> Callable:
+    """Decorador de track_stage para funciones síncronas o asíncronas"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track_stage(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_retry(operation: str) -> Callable:
+    """Hook before_sleep de tenacity que cuenta cada reintento"""
+    def before_sleep(_retry_state) -> None:
+        RETRIES.labels(operation=operation).inc()
+    return before_sleep
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Agrega por etapa (las acciones repetidas suman) en formato Server-Timing"""
+    totals: Dict[str, float] = {}
+    for stage, elapsed_ms in timings:
+        totals[stage] = totals.get(stage, 0.0) + elapsed_ms
+    return ", ".join(f"{stage.replace('.', '-')};dur={elapsed_ms:.1f}" for stage, elapsed_ms in totals.items())
+
+
+def prometheus_payload() -> Tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def stages_snapshot() -> Dict[str, Any]:
+    """Resumen JSON de las etapas (recuento y media) para /metrics"""
+    summary: Dict[str, Dict[str, float]] = {}
+    for metric in STAGE_LATENCY.collect():
+        for sample in metric.samples:
+            stage = sample.labels["stage"]
+            if sample.name.endswith("_count"):
+                summary.setdefault(stage, {"count": 0, "sum": 0.0})["count"] += sample.value
+            elif sample.name.endswith("_sum"):
+                summary.setdefault(stage, {"count": 0, "sum": 0.0})["sum"] += sample.value
+    retries = {
+        sample.labels["operation"]: sample.value
+        for metric in RETRIES.collect() for sample in metric.samples if sample.name.endswith("_total")
+    }
+    return {
+        "stages": {
+            stage: {"count": int(data["count"]), "avg_ms": round(data["sum"] * 1000 / data["count"], 2) if data["count"] else 0.0}
+            for stage, data in sorted(summary.items())
+        },
+        "retries": retries
+    }
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Union
+
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+from backend.circuit_breakers import CircuitOpenError, circuit_breakers
+from backend.deadlines import mark_degraded, run_stage
+from backend.pii import PII_LOCAL_ENABLED, PII_REMOTE_ENABLED, merge_pii, pii_detector
+from backend.rate_limits import RateLimitExceeded, text_analytics_limiter, wait_retry_after
+from backend.telemetry import count_retry, track_stage
+
+logger = logging.getLogger(__name__)
+
+# Límites de documentos por llamada de Text Analytics
+TEXT_ANALYTICS_DOCUMENT_LIMITS = {
+    "entities": 5,
+    "sentiment": 10,
+    "key_phrases": 10,
+    "language": 1000,
+    "analyze_actions": 25
+}
+TEXT_ANALYTICS_CONCURRENCY = int(os.getenv("TEXT_ANALYTICS_CONCURRENCY", "4"))
+
+# "single_pass": una llamada por acción (sentimiento y opinion mining fusionados)
+# "actions": una operación multi-acción (begin_analyze_actions) para entidades, sentimiento y frases clave;
+# sentimiento y frases clave siguen siendo opcionales en ambos modos
+TEXT_ANALYTICS_MODE = os.getenv("TEXT_ANALYTICS_MODE", "single_pass")
+
+LANGUAGE_NAMES = {
+    "es": "Spanish",
+    "en": "English",
+    "pt": "Portuguese",
+    "fr": "French",
+    "de": "German",
+    "it": "Italian"
+}
+
+# Acciones por documento del diseño anterior (entidades, sentimiento, frases, idioma y opinion mining)
+LEGACY_ACTION_LIMITS = ["entities", "sentiment", "key_phrases", "language", "sentiment"]
+
+
+class TextAnalyticsStats:
+    """Tiempos y número de llamadas por acción, comparados con el diseño de cinco llamadas"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.documents = defaultdict(int)
+        self.total_ms = defaultdict(float)
+        self.legacy_round_trips = 0
+
+    def record(self, action: str, documents: int, elapsed_ms: float) -> None:
+        self.calls[action] += 1
+        self.documents[action] += documents
+        self.total_ms[action] += elapsed_ms
+
+    def record_legacy_equivalent(self, documents: int) -> None:
+        self.legacy_round_trips += sum(
+            math.ceil(documents / TEXT_ANALYTICS_DOCUMENT_LIMITS[action]) for action in LEGACY_ACTION_LIMITS
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        round_trips = sum(self.calls.values())
+        return {
+            "mode": TEXT_ANALYTICS_MODE,
+            "round_trips": round_trips,
+            "legacy_round_trips": self.legacy_round_trips,
+            "round_trips_saved": self.legacy_round_trips - round_trips,
+            "actions": {
+                action: {
+                    "calls": self.calls[action],
+                    "documents": self.documents[action],
+                    "total_ms": round(self.total_ms[action], 2),
+                    "avg_ms": round(self.total_ms[action] / self.calls[action], 2)
+                }
+                for action in self.calls
+            }
+        }
+
+
+text_analytics_stats = TextAnalyticsStats()
+
+
+def language_name(language: str) -> str:
+    return LANGUAGE_NAMES.get(language.lower(), language)
+
+
+def remote_pii(entities) -> List[dict]:
+    return [
+        {"text": e.text, "category": e.category, "offset": getattr(e, "offset", None),
+         "length": getattr(e, "length", None), "source": "text_analytics"}
+        for e in entities.entities
+    ]
+
+
+def text_features_from_results(entities, sentiment, phrases, language: Union[Any, str], text: str) -> dict:
+    """Construye el resumen de Text Analytics de un documento; entities (PII_MODE=local), sentiment y
+    phrases son None si no se pidieron o se omitieron"""
+    for res in (entities, sentiment, phrases, language):
+        if isinstance(res, Exception):
+            raise res
+        if getattr(res, "is_error", False):
+            raise ValueError(f"Text Analytics document error: {res.error}")
+
+    # El resultado con opinion mining cubre también el sentimiento del documento
+    return {
+        "pii": merge_pii(
+            text,
+            pii_detector.detect(text) if PII_LOCAL_ENABLED else [],
+            remote_pii(entities) if entities is not None else []
+        ),
+        "sentiment": {
+            "label": sentiment.sentiment,
+            "scores": sentiment.confidence_scores.__dict__
+        } if sentiment is not None else {"label": "neutral", "scores": {}},
+        "key_phrases": phrases.key_phrases if phrases is not None else [],
+        "language": language if isinstance(language, str) else language.primary_language.name,
+        "grammar_quality": {
+            "opinion_mining_present": sentiment is not None and len(sentiment.sentences) > 0
+            and hasattr(sentiment.sentences[0], 'mined_opinions')
+        }
+    }
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_retry_after(wait_exponential(multiplier=0.5, max=4)),
+       retry=retry_if_not_exception_type((RateLimitExceeded, CircuitOpenError, asyncio.CancelledError)),
+       reraise=True, before_sleep=count_retry("text_analytics"))
+async def text_analytics_call(action: str, method, documents: List[Any], **kwargs) -> list:
+    start = time.perf_counter()
+    async with text_analytics_limiter.slot(), circuit_breakers["text_analytics"].guard():
+        with track_stage(f"text_analytics.{action}"):
+            result = await method(documents=documents, **kwargs)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    text_analytics_stats.record(action, len(documents), elapsed_ms)
+    logger.debug(f"Text Analytics {action}: {len(documents)} documentos en {elapsed_ms:.1f} ms")
+    return result
+
+
+async def text_analytics_action(action: str, method, documents: List[Any], semaphore: asyncio.Semaphore,
+                                limit: Optional[int] = None, **kwargs) -> list:
+    """Ejecuta una acción empaquetando los documentos según el límite por llamada"""
+    limit = limit or TEXT_ANALYTICS_DOCUMENT_LIMITS[action]
+    chunks = [documents[i:i + limit] for i in range(0, len(documents), limit)]
+
+    async def run_chunk(chunk: List[Any]):
+        async with semaphore:
+            return await text_analytics_call(action, method, chunk, **kwargs)
+
+    results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+    # Un fallo de llamada afecta solo a los documentos de ese bloque
+    flat = []
+    for chunk, res in zip(chunks, results):
+        if isinstance(res, Exception):
+            logger.error(f"Error en Text Analytics ({action}): {str(res)}")
+            flat.extend([res] * len(chunk))
+        else:
+            flat.extend(res)
+    return flat
+
+
+async def optional_action(stage: str, awaitable, count: int) -> list:
+    """Acción prescindible: si agota su plazo o falla se omite y el resultado queda degradado"""
+    results = await run_stage(stage, awaitable, optional=True)
+    failed = lambda res: isinstance(res, Exception) or getattr(res, "is_error", False)
+    if results is None or any(failed(res) for res in results):
+        mark_degraded(stage)
+        return [None if failed(res) else res for res in (results or [None] * count)]
+    return results
+
+
+async def _run_analyze_actions(client, documents: List[dict]) -> list:
+    """Entidades (salvo con PII_MODE=local), sentimiento y frases clave; sin entidades su hueco queda a None"""
+    from azure.ai.textanalytics import AnalyzeSentimentAction, ExtractKeyPhrasesAction, RecognizeEntitiesAction
+
+    actions = [AnalyzeSentimentAction(show_opinion_mining=True), ExtractKeyPhrasesAction()]
+    if PII_REMOTE_ENABLED:
+        actions.insert(0, RecognizeEntitiesAction())
+    poller = await client.begin_analyze_actions(documents, actions=actions)
+    return [
+        doc_results if PII_REMOTE_ENABLED else [None, *doc_results]
+        async for doc_results in await poller.result()
+    ]
+
+
+async def action_results(operation: asyncio.Future, index: int) -> list:
+    """Resultados por documento de una acción de la operación compartida; shield evita que el plazo de una
+    acción opcional cancele la operación para las demás"""
+    return [res if isinstance(res, Exception) else res[index] for res in await asyncio.shield(operation)]
+
+
+async def analyze_text_features_batch(client, texts: List[str],
+                                      languages: Optional[List[Optional[str]]] = None) -> List[Union[dict, Exception]]:
+    """Analiza varios textos con el mínimo de llamadas; devuelve un resultado o excepción por texto"""
+    languages = languages or [None] * len(texts)
+    semaphore = asyncio.Semaphore(TEXT_ANALYTICS_CONCURRENCY)
+    text_analytics_stats.record_legacy_equivalent(len(texts))
+
+    documents = [
+        {"id": str(i), "text": text, **({"language": language} if language else {})}
+        for i, (text, language) in enumerate(zip(texts, languages))
+    ]
+
+    # Solo se detecta el idioma de los documentos sin pista del cliente
+    undetected = [doc for doc, language in zip(documents, languages) if not language]
+
+    async def detect() -> list:
+        if not undetected:
+            return []
+        return await text_analytics_action(
+            "language", client.detect_language,
+            [{"id": doc["id"], "text": doc["text"]} for doc in undetected], semaphore
+        )
+
+    if TEXT_ANALYTICS_MODE == "actions":
+        # Una sola operación multi-acción; cada acción se consume por separado, así que sentimiento y frases
+        # clave siguen siendo opcionales como en single_pass
+        operation = asyncio.ensure_future(text_analytics_action(
+            "analyze_actions", lambda documents: _run_analyze_actions(client, documents), documents, semaphore
+        ))
+        entities_call = lambda: action_results(operation, 0)
+        sentiment_call = action_results(operation, 1)
+        phrases_call = action_results(operation, 2)
+    else:
+        operation = None
+        entities_call = lambda: text_analytics_action("entities", client.recognize_entities, documents, semaphore)
+        sentiment_call = text_analytics_action(
+            "sentiment", client.analyze_sentiment, documents, semaphore, show_opinion_mining=True
+        )
+        phrases_call = text_analytics_action("key_phrases", client.extract_key_phrases, documents, semaphore)
+
+    async def recognize_entities() -> list:
+        # Con PII_MODE=local la PII estructurada se detecta en local y se omite la llamada de entidades
+        if not PII_REMOTE_ENABLED:
+            return [None] * len(documents)
+        return await entities_call()
+
+    try:
+        entities, sentiment, phrases, detected = await asyncio.gather(
+            recognize_entities(),
+            optional_action("opinion_mining", sentiment_call, len(documents)),
+            optional_action("key_phrases", phrases_call, len(documents)),
+            detect()
+        )
+    finally:
+        # Si todas sus acciones agotaron el plazo la operación compartida ya no la espera nadie
+        if operation is not None and not operation.done():
+            operation.cancel()
+
+    detected_by_id = {doc["id"]: res for doc, res in zip(undetected, detected)}
+    results = []
+    for doc, language, *doc_results in zip(documents, languages, entities, sentiment, phrases):
+        try:
+            results.append(text_features_from_results(
+                *doc_results,
+                language_name(language) if language else detected_by_id[doc["id"]],
+                doc["text"]
+            ))
+        except Exception as e:
+            results.append(e)
+    return results
@@ -0,0 +1,109 @@
+"""Agregación diaria del histórico: bucle original, agregados con diccionarios y motor columnar NumPy.
+
+Uso: python -m benchmarks.bench_aggregation [--sizes 10000,100000,1000000] [--legacy-max 100000]
+"""
+import argparse
+import json
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from backend.aggregation import ColumnarAggregator
+from backend.rollups import build_rollups
+from benchmarks.bench_historical import project, synthetic_document
+
+PAGE_SIZE = 1000
+POOL_SIZE = 20000
+
+
+def legacy_safe_aggregate(data: List[dict], fields: List[str]) -> List[dict]:
+    grouped = defaultdict(lambda: {f: [] for f in fields})
+    for item in data:
+        date = item.get("date", "")
+        for field in fields:
+            value = item.get(field, 0.0)
+            if isinstance(value, (int, float)):
+                grouped[date][field].append(float(value))
+    return [
+        {"date": date, **{f: round(sum(v) / len(v), 2) if v else 0.0 for f, v in fields_data.items()}}
+        for date, fields_data in grouped.items()
+    ]
+
+
+def legacy_aggregate(all_data: List[dict]) -> Dict[str, list]:
+    """Agregación de get_historical_data antes del motor columnar (un dict por documento y familia)"""
+    date_set, base_data, sentiment_data, safety_data = set(), [], [], []
+    issue_counts = defaultdict(int)
+    for doc in all_data:
+        date = doc["timestamp"][:10]
+        date_set.add(date)
+        analysis = doc.get("analysis", {})
+        metadata = doc.get("metadata", {})
+        safety = metadata.get("safety", {}).get("categories", {})
+        sentiment = metadata.get("text_analytics", {}).get("sentiment", {}).get("scores", {})
+        base_data.append({"date": date, "safety": analysis.get("safety_score", 0.0),
+                          "fairness": analysis.get("fairness_score", 0.0),
+                          "inclusivity": analysis.get("inclusivity_score", 0.0)})
+        sentiment_data.append({"date": date, **{k: sentiment.get(k, 0.0) for k in ("positive", "neutral", "negative")}})
+        safety_data.append({"date": date, "hate": safety.get("Hate", 0.0), "selfHarm": safety.get("SelfHarm", 0.0),
+                            "sexual": safety.get("Sexual", 0.0), "violence": safety.get("Violence", 0.0)})
+        for issue in analysis.get("issues", []):
+            issue_counts[(issue.get("type", "unknown"), issue.get("severity", "medium"))] += 1
+    return {
+        "volume": [{"date": d, "count": sum(1 for x in base_data if x["date"] == d)} for d in sorted(date_set)],
+        "scores": legacy_safe_aggregate(base_data, ["safety", "fairness", "inclusivity"]),
+        "sentiment": legacy_safe_aggregate(sentiment_data, ["positive", "neutral", "negative"]),
+        "safety": legacy_safe_aggregate(safety_data, ["hate", "selfHarm", "sexual", "violence"])
+    }
+
+
+def pages(pool: List[dict], size: int) -> Iterator[List[dict]]:
+    for start in range(0, size, PAGE_SIZE):
+        offset = start % len(pool)
+        yield pool[offset:offset + min(PAGE_SIZE, size - start)]
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--legacy-max", type=int, default=100000,
+                        help="El bucle original es O(fechas x documentos); por encima de este tamaño se omite")
+    args = parser.parse_args()
+
+    random.seed(5)
+    now = datetime.utcnow()
+    # Reserva de documentos proyectados reutilizada por páginas para no materializar millones de dicts
+    pool = [project(synthetic_document(now - timedelta(seconds=random.randint(0, 365 * 86400))))
+            for _ in range(POOL_SIZE)]
+
+    report = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        def run_dicts():
+            rollups = {}
+            for page in pages(pool, size):
+                build_rollups(page, rollups)
+
+        def run_columnar():
+            aggregator = ColumnarAggregator()
+            for page in pages(pool, size):
+                aggregator.add(page)
+            aggregator.rollups()
+
+        result = {"documents": size, "dict_rollups_ms": timed(run_dicts), "columnar_ms": timed(run_columnar)}
+        if size <= args.legacy_max:
+            docs = [doc for page in pages(pool, size) for doc in page]
+            result["legacy_ms"] = timed(lambda: legacy_aggregate(docs))
+        report.append(result)
+    print(json.dumps({"page_size": PAGE_SIZE, "results": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Memoria pico, documentos transferidos y RU de /dashboard/historical antes y después del filtrado en Cosmos.
+
+Uso:
+    python -m benchmarks.bench_historical --synthetic 50000   # contenedor simulado en memoria
+    python -m benchmarks.bench_historical --live              # contenedor Analytics real (RU reales)
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import backend.dashboard_routes as dashboard
+from backend.rollups import build_rollups
+
+PERIODS = ["week", "month", "year"]
+
+
+def synthetic_document(timestamp: datetime) -> Dict[str, Any]:
+    """Documento de auditoría con el tamaño típico de producción (variantes y metadatos completos)"""
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": timestamp.isoformat(),
+        "prompt_hash": uuid.uuid4().hex * 2,
+        "analysis": {
+            "improved_prompt": "Redacta un informe detallado " * 20,
+            "safety_score": random.random(),
+            "fairness_score": random.random(),
+            "inclusivity_score": random.random(),
+            "improvement_explanation": "Se añadió contexto y formato " * 10,
+            "issues": [{"type": random.choice(["bias", "clarity", "ambiguity"]), "severity": "medium",
+                        "description": "x" * 80, "mitigation": "y" * 80}],
+            "ambiguity_analysis": {"ambiguous_terms": ["informe", "detallado"] * 5, "missing_context": ["audiencia"] * 5}
+        },
+        "metadata": {
+            "safety": {"categories": {"Hate": 0, "SelfHarm": 0, "Sexual": 0, "Violence": random.choice([0, 2])}},
+            "text_analytics": {
+                "pii": [{"text": "Juan", "category": "Person"}],
+                "sentiment": {"label": "neutral", "scores": {"positive": 0.1, "neutral": 0.8, "negative": 0.1}},
+                "key_phrases": [random.choice(["informe", "ventas", "marketing", "código"]), "resumen", "equipo"],
+                "language": "Spanish",
+                "grammar_quality": {"opinion_mining_present": True}
+            },
+            "compliance": ["GDPR", "ISO27001", "NIST"]
+        },
+        "variants": [{"variant_prompt": "Variante " * 40, "focus": "clarity", "explanation": "z" * 120}] * 3
+    }
+
+
+def project(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Equivalente en memoria de HISTORICAL_PROJECTION_QUERY"""
+    text_analytics = doc["metadata"]["text_analytics"]
+    return {
+        "timestamp": doc["timestamp"],
+        "analysis": {k: doc["analysis"][k] for k in ("safety_score", "fairness_score", "inclusivity_score", "issues")},
+        "metadata": {
+            "text_analytics": {"sentiment": text_analytics["sentiment"], "key_phrases": text_analytics["key_phrases"]},
+            "safety": doc["metadata"]["safety"]
+        }
+    }
+
+
+class SyntheticContainer:
+    """Contenedor simulado: paginación con max_item_count y serialización JSON como en el SDK"""
+
+    def __init__(self, count: int):
+        now = datetime.utcnow()
+        self.rows = [
+            json.dumps(synthetic_document(now - timedelta(seconds=random.randint(0, 365 * 86400))))
+            for _ in range(count)
+        ]
+
+    def query_items(self, query: str, parameters: Optional[list] = None, max_item_count: int = 1000,
+                    response_hook=None, **kwargs):
+        start = parameters[0]["value"] if parameters else None
+        projected = "AS analysis" in query
+
+        class Pager:
+            continuation_token = None
+
+            async def _pages(pager):
+                page = []
+                for row in self.rows:
+                    doc = json.loads(row)
+                    if start and doc["timestamp"] < start:
+                        continue
+                    page.append(project(doc) if projected else doc)
+                    if len(page) == max_item_count:
+                        yield page
+                        page = []
+                if page:
+                    yield page
+
+            def by_page(pager, continuation_token=None):
+                class PageIterator:
+                    continuation_token = None
+
+                    def __aiter__(iterator):
+                        async def pages():
+                            async for page in pager._pages():
+                                async def items(page=page):
+                                    for item in page:
+                                        yield item
+                                yield items()
+                        return pages()
+                return PageIterator()
+
+            def __aiter__(pager):
+                async def flat():
+                    async for page in pager._pages():
+                        for item in page:
+                            yield item
+                return flat()
+
+        return Pager()
+
+
+async def measure(label: str, coro_factory) -> Dict[str, Any]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    stats: Dict[str, Any] = {}
+    await coro_factory(stats)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "variant": label,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+        "documents": stats.get("documents"),
+        "pages": stats.get("pages"),
+        "request_charge": round(stats["request_charge"], 2) if "request_charge" in stats else None
+    }
+
+
+async def run(container, live: bool) -> List[Dict[str, Any]]:
+    report = []
+    for period in PERIODS:
+        days = dashboard.PERIOD_DAYS[period]
+
+        async def before(stats):
+            def on_response(headers, _):
+                stats["request_charge"] = stats.get("request_charge", 0.0) + float(headers.get("x-ms-request-charge", 0))
+            docs = [item async for item in container.query_items(
+                query="SELECT * FROM c", parameters=[], response_hook=on_response if live else None
+            )]
+            stats["documents"] = len(docs)
+            build_rollups(docs)
+
+        async def after(stats):
+            await dashboard.aggregate_raw_history(days, stats)
+
+        report.append({"period": period, "results": [await measure("before", before), await measure("after", after)]})
+    return report
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    if args.live:
+        from backend.clients import azure_clients
+
+        await azure_clients.start()
+        try:
+            report = await run(dashboard.get_analytics_container(), live=True)
+        finally:
+            await azure_clients.close()
+    else:
+        random.seed(11)
+        container = SyntheticContainer(args.synthetic)
+        dashboard.get_analytics_container = lambda: container
+        report = await run(container, live=False)
+    print(json.dumps({"source": "live" if args.live else f"synthetic:{args.synthetic}", "periods": report}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=20000, help="Documentos simulados")
+    parser.add_argument("--live", action="store_true", help="Usa el contenedor Analytics configurado")
+    asyncio.run(main_async(parser.parse_args()))
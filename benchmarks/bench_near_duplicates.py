@@ -0,0 +1,104 @@
+"""Latencia de búsqueda del índice de casi duplicados con N prompts indexados.
+
+Llena el índice con prompts sintéticos generados a partir de plantillas (nombres, fechas e IDs distintos)
+y mide la búsqueda de variantes nuevas de plantillas indexadas (aciertos) y de prompts sin relación (fallos).
+
+Uso: python -m benchmarks.bench_near_duplicates [--entries N] [--lookups N] [--threshold T]
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from backend.near_duplicates import NearDuplicateIndex, minhash_signature
+
+TEMPLATES = [
+    "Escribe un correo formal a {name} confirmando la reunión del {date} sobre el pedido {id} y pide que traiga el informe de {topic} del trimestre",
+    "Resume el contrato {id} firmado con {name} el {date} destacando las cláusulas de {topic} y los plazos de entrega",
+    "Prepara una presentación para {name} sobre los resultados de {topic} del {date} con tres conclusiones y el ticket {id}",
+    "Redacta una respuesta amable a {name} sobre la incidencia {id} abierta el {date} relacionada con {topic} y ofrece una solución",
+    "Genera un informe ejecutivo de {topic} para {name} con los datos del {date} y la referencia {id} en tono profesional"
+]
+NAMES = ["Juan Pérez", "María López", "Ana García", "Luis Martín", "Carmen Ruiz", "Pedro Sánchez", "Lucía Gómez"]
+TOPICS = ["ventas", "marketing", "logística", "recursos humanos", "seguridad", "finanzas", "calidad", "soporte"]
+VOCABULARY = (
+    "analiza explica resume traduce compara describe enumera redacta revisa propone datos cliente proyecto "
+    "equipo mercado producto servicio estrategia riesgo coste plazo objetivo métrica usuario modelo sistema "
+    "proceso documento tabla gráfico código prueba error versión política norma contrato factura pedido"
+).split()
+
+
+def template_prompt(rng: random.Random, template: str) -> str:
+    return template.format(
+        name=rng.choice(NAMES),
+        date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+        id=rng.randint(10000, 99999),
+        topic=rng.choice(TOPICS)
+    )
+
+
+def random_prompt(rng: random.Random) -> str:
+    return " ".join(rng.choices(VOCABULARY, k=rng.randint(12, 40)))
+
+
+def percentiles(samples_us):
+    values = np.array(samples_us)
+    return {f"p{p}": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--template-share", type=float, default=0.2,
+                        help="Fracción de entradas indexadas que siguen una plantilla conocida")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    index = NearDuplicateIndex(capacity=args.entries, threshold=args.threshold, ttl=3600)
+
+    # Las entradas aleatorias se insertan con firma sintética para no medir el coste de generar texto
+    start = time.perf_counter()
+    numpy_rng = np.random.default_rng(7)
+    for i in range(args.entries):
+        if rng.random() < args.template_share:
+            index.add(template_prompt(rng, rng.choice(TEMPLATES)), {"id": i})
+        else:
+            index.add_signature(numpy_rng.integers(0, 2 ** 16, 64, dtype=np.uint16), {"id": i})
+    build_s = time.perf_counter() - start
+
+    cases = {
+        "template_variant": [template_prompt(rng, rng.choice(TEMPLATES)) for _ in range(args.lookups)],
+        "unrelated": [random_prompt(rng) for _ in range(args.lookups)]
+    }
+    report = {}
+    for name, prompts in cases.items():
+        timings, signature_timings, hits = [], [], 0
+        for prompt in prompts:
+            start = time.perf_counter()
+            hit = index.lookup(prompt)
+            timings.append((time.perf_counter() - start) * 1e6)
+            hits += hit is not None
+            start = time.perf_counter()
+            minhash_signature(prompt)
+            signature_timings.append((time.perf_counter() - start) * 1e6)
+        report[name] = {
+            "lookup_us": percentiles(timings),
+            "signature_us": percentiles(signature_timings),
+            "hit_rate": round(hits / len(prompts), 4)
+        }
+
+    print(json.dumps({
+        "entries": args.entries,
+        "threshold": args.threshold,
+        "build_s": round(build_s, 1),
+        "memory_mb": index.snapshot()["memory_mb"],
+        "cases": report
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
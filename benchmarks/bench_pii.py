@@ -0,0 +1,109 @@
+"""Redacción de PII: bucle de str.replace por entidad frente a una pasada por offsets.
+
+Genera prompts de ~2000 caracteres con muchas entidades (incluidas entidades solapadas, como
+"Ana" dentro de "Ana García") y mide la redacción anterior, la nueva y el detector local.
+
+Uso: python -m benchmarks.bench_pii [--prompts N] [--entities N] [--length N]
+"""
+import argparse
+import json
+import random
+import time
+
+from backend.pii import pii_detector, redact_spans
+
+FILLER = (
+    "Necesito que revises el expediente y prepares un resumen claro para el equipo directivo con los "
+    "riesgos principales, los plazos comprometidos y las siguientes acciones recomendadas. "
+)
+PEOPLE = ["Ana García", "Luis Martín", "Carmen Ruiz", "Pedro Sánchez", "Lucía Gómez", "Jorge Navarro"]
+STRUCTURED = [
+    ("Email", lambda rng: f"usuario{rng.randint(1, 999)}@empresa.es"),
+    ("PhoneNumber", lambda rng: f"+34 6{rng.randint(10, 99)} {rng.randint(100, 999)} {rng.randint(100, 999)}"),
+    ("CreditCardNumber", lambda rng: "4111 1111 1111 1111"),
+    ("IBAN", lambda rng: "ES91 2100 0418 4502 0005 1332"),
+    ("IPAddress", lambda rng: f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"),
+    ("NationalID", lambda rng: "12345678Z")
+]
+
+
+def legacy_redact(text: str, pii_list) -> str:
+    """Implementación anterior de redact_pii"""
+    redacted = text
+    for entity in pii_list:
+        redacted = redacted.replace(entity["text"], f"[{entity['category']}]")
+    return redacted
+
+
+def synthetic_prompt(rng: random.Random, length: int, entity_count: int):
+    """Prompt y entidades con offsets, como las devolvería Text Analytics más el detector local"""
+    pieces, entities, position = [], [], 0
+    # Unos 16 caracteres por entidad; el resto del texto se reparte entre los huecos
+    per_gap = max((length - 16 * entity_count) // (entity_count + 1), 3)
+    for _ in range(entity_count):
+        start = rng.randint(0, max(len(FILLER) - per_gap, 0))
+        gap = f" {FILLER[start:start + per_gap - 2].strip()} "
+        pieces.append(gap)
+        position += len(gap)
+        if rng.random() < 0.5:
+            category, value = "Person", rng.choice(PEOPLE)
+        else:
+            category, make = rng.choice(STRUCTURED)
+            value = make(rng)
+        if category == "Person":
+            # Entidad solapada: el nombre de pila suelto antes que el nombre completo
+            first = value.split()[0]
+            entities.append({"text": first, "category": "Person", "offset": position, "length": len(first)})
+        entities.append({"text": value, "category": category, "offset": position, "length": len(value)})
+        pieces.append(value)
+        position += len(value)
+    return "".join(pieces), entities
+
+
+def leaked_fragments(redacted: str, entities) -> int:
+    """Fragmentos de PII que siguen visibles tras la redacción"""
+    return sum(1 for entity in entities for word in entity["text"].split() if len(word) > 3 and word in redacted)
+
+
+def timed(func, cases, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for args in cases:
+            func(*args)
+    return (time.perf_counter() - start) * 1e6 / (iterations * len(cases))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--prompts", type=int, default=50)
+    parser.add_argument("--entities", type=int, default=60)
+    parser.add_argument("--length", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    cases = [synthetic_prompt(rng, args.length, args.entities) for _ in range(args.prompts)]
+    # Resultados antiguos sin offsets: la redacción nueva los localiza en una sola pasada
+    plain = (FILLER * (args.length // len(FILLER) + 1))[:args.length]
+    textual = [(text, [{"text": e["text"], "category": e["category"]} for e in entities]) for text, entities in cases]
+
+    report = {
+        "avg_prompt_length": round(sum(len(text) for text, _ in cases) / len(cases)),
+        "avg_entities": round(sum(len(entities) for _, entities in cases) / len(cases), 1),
+        "legacy_replace_us": round(timed(legacy_redact, cases, args.iterations), 2),
+        "offset_redaction_us": round(timed(redact_spans, cases, args.iterations), 2),
+        "text_only_redaction_us": round(timed(redact_spans, textual, args.iterations), 2),
+        "local_detector_us": round(timed(pii_detector.detect, [(text,) for text, _ in cases], args.iterations), 2),
+        # Caso habitual: sin dígitos ni @, los patrones numéricos y de correo no recorren el texto
+        "local_detector_plain_us": round(timed(pii_detector.detect, [(plain,)], args.iterations * 10), 2),
+        "leaked_fragments": {
+            "legacy_replace": sum(leaked_fragments(legacy_redact(text, e), e) for text, e in cases),
+            "offset_redaction": sum(leaked_fragments(redact_spans(text, e), e) for text, e in cases)
+        }
+    }
+    report["speedup"] = round(report["legacy_replace_us"] / report["offset_redaction_us"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
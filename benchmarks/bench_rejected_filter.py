@@ -0,0 +1,71 @@
+"""Filtro de Bloom de prompts rechazados: memoria, tasa real de falsos positivos y latencia de consulta.
+
+Llena el filtro con N hashes SHA-256 de prompts sintéticos y consulta prompts que no están (para medir la
+tasa de falsos positivos frente a la objetivo) y prompts que sí están.
+
+Uso: python -m benchmarks.bench_rejected_filter [--entries N] [--lookups N] [--fp-rate P]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from backend.rejected_filter import BloomFilter, prompt_hash
+
+
+def percentiles(samples_us):
+    values = np.array(samples_us)
+    return {f"p{p}": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+def timed_lookups(bloom: BloomFilter, digests):
+    timings, hits = [], 0
+    for digest in digests:
+        start = time.perf_counter()
+        hits += digest in bloom
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--fp-rate", type=float, default=0.001)
+    args = parser.parse_args()
+
+    bloom = BloomFilter(args.entries, args.fp_rate)
+    start = time.perf_counter()
+    for i in range(args.entries):
+        bloom.add(prompt_hash(f"prompt rechazado número {i}"))
+    build_s = time.perf_counter() - start
+
+    absent = [prompt_hash(f"prompt nuevo número {i}") for i in range(args.lookups)]
+    present = [prompt_hash(f"prompt rechazado número {i}") for i in range(0, args.entries, max(args.entries // 10000, 1))]
+    absent_timings, false_positives = timed_lookups(bloom, absent)
+    present_timings, true_positives = timed_lookups(bloom, present)
+
+    start = time.perf_counter()
+    for i in range(10000):
+        prompt_hash(f"prompt nuevo número {i}")
+    hash_us = (time.perf_counter() - start) * 1e6 / 10000
+
+    print(json.dumps({
+        "entries": args.entries,
+        "distinct_entries": bloom.count,
+        "build_s": round(build_s, 1),
+        "memory_mb": round(len(bloom.bits) / 2 ** 20, 2),
+        "bits_per_entry": round(bloom.num_bits / args.entries, 1),
+        "num_hashes": bloom.num_hashes,
+        "target_fp_rate": args.fp_rate,
+        "estimated_fp_rate": round(bloom.estimated_fp_rate(), 6),
+        "observed_fp_rate": round(false_positives / len(absent), 6),
+        "recall": round(true_positives / len(present), 4),
+        "sha256_us": round(hash_us, 2),
+        "lookup_us": {"absent": percentiles(absent_timings), "present": percentiles(present_timings)}
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Arranque en frío sin red: coste de importación, tiempo hasta el primer /health correcto y RSS tras el arranque.
+
+Lanza la aplicación con uvicorn en un subproceso por cada modo de AZURE_CLIENTS_WARMUP, con secretos falsos
+en variables de entorno (SECRETS_OFFLINE=true) y el almacén local (STORAGE_BACKEND=sqlite). Los clientes de
+Azure se crean contra endpoints falsos: ninguna llamada sale de la máquina hasta la primera petición real.
+
+Uso: python -m benchmarks.bench_startup [--runs N] [--modes eager,background,lazy] [--top N]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.clients import REQUIRED_SECRETS
+from backend.config import env_name
+
+# Módulos pesados que solo deberían cargarse al crear su cliente o en su primer uso
+SDK_MODULES = [
+    "openai", "azure.identity", "azure.keyvault.secrets", "azure.ai.contentsafety", "azure.ai.textanalytics",
+    "azure.cosmos", "azure.cosmos.aio", "aiohttp", "httpx", "aiocache", "numpy"
+]
+
+
+def offline_env(workdir: str, warmup: Optional[str] = None) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        **{env_name(name): f"https://{name.lower()}.invalid/" for name in REQUIRED_SECRETS if "ENDPOINT" in name},
+        **{env_name(name): "ZmFrZS1rZXk=" for name in REQUIRED_SECRETS if "ENDPOINT" not in name},
+        "SECRETS_OFFLINE": "true",
+        "SECRETS_REFRESH_INTERVAL": "0",
+        "STORAGE_BACKEND": "sqlite",
+        "ANALYTICS_STORE_PATH": str(Path(workdir) / "analytics.db"),
+        "AUDIT_SPILL_PATH": str(Path(workdir) / "audit_spill.jsonl")
+    }
+    if warmup:
+        env["AZURE_CLIENTS_WARMUP"] = warmup
+    return env
+
+
+def import_profile(env: Dict[str, str], top: int) -> Dict[str, Any]:
+    """Salida de python -X importtime: total de backend.main, módulos raíz más caros y SDK cargados"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        env=env, capture_output=True, text=True, check=True
+    )
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    roots = sorted(((name, us) for name, us in cumulative.items() if "." not in name), key=lambda item: -item[1])
+    return {
+        "backend_main_ms": round(cumulative["backend.main"] / 1000, 1),
+        "top_modules_ms": {name: round(us / 1000, 1) for name, us in roots[:top]},
+        "sdk_loaded_at_import": [module for module in SDK_MODULES if module in cumulative]
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """VmRSS de /proc (solo Linux)"""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def boot_once(env: Dict[str, str], timeout: float) -> Dict[str, Any]:
+    """Lanza uvicorn y sondea /health hasta el primer 200"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn terminó con código {process.returncode}")
+            request_start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as response:
+                    if response.status == 200:
+                        healthy_ms = (time.perf_counter() - start) * 1000
+                        first_health_ms = (time.perf_counter() - request_start) * 1000
+                        # Deja terminar el calentamiento en segundo plano antes de medir memoria
+                        time.sleep(1)
+                        return {
+                            "healthy_ms": healthy_ms,
+                            "first_health_request_ms": first_health_ms,
+                            "rss_mb": rss_mb(process.pid)
+                        }
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"/health no respondió 200 en {timeout} s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = round(float(np.median(values)), 1) if values else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", default="eager,background,lazy")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = {"imports": import_profile(offline_env(workdir), args.top), "boot": {}}
+        for mode in args.modes.split(","):
+            env = offline_env(workdir, mode)
+            report["boot"][mode] = summarize([boot_once(env, args.timeout) for _ in range(args.runs)])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""Sustitutos en proceso de los servicios de Azure para benchmarks y pruebas de carga sin red.
+
+Cada servicio tiene un perfil de latencia log-normal (mediana y p95), una tasa de errores y una tasa de 429.
+"""
+import asyncio
+import copy
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import openai
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosHttpResponseError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError
+)
+
+
+@dataclass
+class LatencyProfile:
+    """Latencia log-normal definida por mediana y p95, más tasas de error y de limitación (429)"""
+    median_ms: float = 50.0
+    p95_ms: float = 150.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    calls: int = field(default=0, compare=False)
+    errors: int = field(default=0, compare=False)
+    throttles: int = field(default=0, compare=False)
+
+    def sample_ms(self) -> float:
+        sigma = max(math.log(max(self.p95_ms, self.median_ms) / self.median_ms) / 1.645, 1e-6)
+        return random.lognormvariate(math.log(self.median_ms), sigma)
+
+    async def call(self, error: Callable[[], Exception], throttled: Callable[[], Exception]) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.sample_ms() / 1000)
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self.throttles += 1
+            raise throttled()
+        if roll < self.throttle_rate + self.error_rate:
+            self.errors += 1
+            raise error()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "errors": self.errors, "throttles": self.throttles}
+
+
+DEFAULT_PROFILES = {
+    "content_safety": {"median_ms": 60, "p95_ms": 180},
+    "text_analytics": {"median_ms": 80, "p95_ms": 250},
+    "openai": {"median_ms": 900, "p95_ms": 2500},
+    "cosmos": {"median_ms": 8, "p95_ms": 30}
+}
+
+
+def azure_error() -> Exception:
+    return ServiceRequestError("Fallo simulado del servicio")
+
+
+def azure_throttled() -> Exception:
+    error = HttpResponseError(message="Too Many Requests (simulado)")
+    error.status_code = 429
+    return error
+
+
+# ---------- Content Safety ----------
+class FakeContentSafetyClient:
+    BLOCKED_TERMS = {"bomba": "Violence", "bomb": "Violence", "odio": "Hate"}
+
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+
+    async def analyze_text(self, options):
+        await self.profile.call(azure_error, azure_throttled)
+        text = options.text.lower()
+        severities = {"Hate": 0, "SelfHarm": 0, "Sexual": 0, "Violence": 0}
+        for term, category in self.BLOCKED_TERMS.items():
+            if term in text:
+                severities[category] = 4
+        return SimpleNamespace(categories_analysis=[
+            SimpleNamespace(category=category, severity=severity) for category, severity in severities.items()
+        ])
+
+    async def close(self):
+        pass
+
+
+# ---------- Text Analytics ----------
+class FakeTextAnalyticsClient:
+    PII_PATTERN = re.compile(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b|\b[\w.]+@[\w.]+\b")
+
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+
+    async def _call(self):
+        await self.profile.call(azure_error, azure_throttled)
+
+    async def recognize_entities(self, documents, **kwargs):
+        await self._call()
+        return [SimpleNamespace(is_error=False, entities=[
+            SimpleNamespace(text=match.group(0), category="Email" if "@" in match.group(0) else "Person",
+                            offset=match.start(), length=len(match.group(0)))
+            for match in self.PII_PATTERN.finditer(doc["text"])
+        ]) for doc in documents]
+
+    async def analyze_sentiment(self, documents, show_opinion_mining: bool = False, **kwargs):
+        await self._call()
+        return [SimpleNamespace(
+            is_error=False,
+            sentiment="neutral",
+            confidence_scores=SimpleNamespace(positive=0.1, neutral=0.8, negative=0.1),
+            sentences=[SimpleNamespace(mined_opinions=[])] if show_opinion_mining else []
+        ) for _ in documents]
+
+    async def extract_key_phrases(self, documents, **kwargs):
+        await self._call()
+        return [SimpleNamespace(is_error=False, key_phrases=[
+            word for word in re.findall(r"\w{6,}", doc["text"].lower())[:5]
+        ]) for doc in documents]
+
+    async def detect_language(self, documents, **kwargs):
+        await self._call()
+        return [SimpleNamespace(is_error=False, primary_language=SimpleNamespace(name="Spanish", iso6391_name="es"))
+                for _ in documents]
+
+    async def close(self):
+        pass
+
+
+# ---------- Azure OpenAI ----------
+def openai_throttled() -> Exception:
+    request = httpx.Request("POST", "https://fake.openai.azure.com/chat/completions")
+    return openai.RateLimitError(
+        "Rate limit (simulado)", response=httpx.Response(429, request=request, headers={"retry-after": "1"}), body=None
+    )
+
+
+def openai_error() -> Exception:
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://fake.openai.azure.com/chat/completions"))
+
+
+class FakeChatStream:
+    def __init__(self, content: str, chunk_delay: float):
+        self.pieces = [content[i:i + 12] for i in range(0, len(content), 12)]
+        self.chunk_delay = chunk_delay
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for piece in self.pieces:
+            await asyncio.sleep(self.chunk_delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncOpenAI:
+    """chat.completions.create con respuestas JSON según el system prompt del pipeline"""
+
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+        self.chat = SimpleNamespace(completions=self)
+
+    @staticmethod
+    def _content(system_prompt: str, user_content: str) -> dict:
+        from backend import main
+
+        scores = {"safety_score": 0.9, "fairness_score": 0.85, "inclusivity_score": 0.8}
+        improved = {
+            "improved_prompt": f"Versión mejorada y específica: {user_content[:200]}",
+            **scores,
+            "issues": [{"type": "clarity", "description": "Falta formato de salida", "severity": "low",
+                        "mitigation": "Indica el formato esperado"}],
+            "improvement_explanation": "Se añadió contexto y formato"
+        }
+        variants = [{"variant_text": f"Variante {i}: {user_content[:120]}", "quality_score": 0.8,
+                     "clarity_score": 0.8, "specificity_score": 0.7, "explanation": "Más concreta"} for i in range(3)]
+        ambiguity = {"ambiguity_score": 0.3, "clarity_score": 0.8, "completeness_score": 0.75,
+                     "ambiguous_terms": [], "missing_context": []}
+
+        if system_prompt.startswith(main.FUSED_ANALYSIS_SYSTEM_PROMPT):
+            return {**improved, "ambiguity": ambiguity, "variants": variants}
+        if system_prompt == main.IMPROVED_PROMPT_SYSTEM_PROMPT:
+            return improved
+        if system_prompt.startswith(main.VARIANTS_SYSTEM_PROMPT):
+            return {"variants": variants}
+        return ambiguity
+
+    async def create(self, model: str, messages: List[dict], stream: bool = False, **kwargs):
+        await self.profile.call(openai_error, openai_throttled)
+        content = json.dumps(self._content(messages[0]["content"], messages[-1]["content"]), ensure_ascii=False)
+        if stream:
+            return FakeChatStream(content, chunk_delay=0.002)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=sum(len(m["content"]) for m in messages) // 4,
+                                  completion_tokens=len(content) // 4)
+        )
+
+    async def close(self):
+        pass
+
+
+# ---------- Cosmos DB ----------
+def cosmos_error() -> Exception:
+    return CosmosHttpResponseError(status_code=503, message="Servicio no disponible (simulado)")
+
+
+def cosmos_throttled() -> Exception:
+    return CosmosHttpResponseError(status_code=429, message="Request rate is large (simulado)")
+
+
+def _path_value(document: dict, path: str) -> Any:
+    value = document
+    for part in path.split(".")[1:]:
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+class FakeQuery:
+    """Subconjunto del SQL de Cosmos usado por la aplicación: filtros >=, >, =, IS NOT NULL, TOP,
+    agregados VALUE COUNT/AVG/SUM(ARRAY_LENGTH) y proyección de rutas simples"""
+
+    CONDITION = re.compile(r"(c(?:\.\w+)+)\s*(>=|>|=|IS NOT NULL)\s*(@\w+|'[^']*'|\d+)?", re.IGNORECASE)
+
+    def __init__(self, query: str, parameters: Optional[list]):
+        self.query = " ".join(query.split())
+        self.parameters = {p["name"]: p["value"] for p in parameters or []}
+
+    def _resolve(self, token: Optional[str]) -> Any:
+        if token is None:
+            return None
+        if token.startswith("@"):
+            return self.parameters[token]
+        if token.startswith("'"):
+            return token.strip("'")
+        return int(token)
+
+    def _matches(self, document: dict, where: str) -> bool:
+        for path, operator, token in self.CONDITION.findall(where):
+            value, expected = _path_value(document, path), self._resolve(token or None)
+            operator = operator.upper()
+            if operator == "IS NOT NULL":
+                if value is None:
+                    return False
+            elif value is None:
+                return False
+            elif operator == ">=" and not value >= expected:
+                return False
+            elif operator == ">" and not value > expected:
+                return False
+            elif operator == "=" and value != expected:
+                return False
+        return True
+
+    def run(self, documents: List[dict]) -> List[Any]:
+        select, _, rest = self.query.partition(" FROM c")
+        where = rest.split(" WHERE ", 1)[1] if " WHERE " in rest else ""
+        rows = [doc for doc in documents if self._matches(doc, where)]
+
+        if match := re.search(r"TOP (@\w+|\d+)", select):
+            rows = rows[:self._resolve(match.group(1))]
+        if "VALUE COUNT(1)" in select:
+            return [len(rows)]
+        if match := re.search(r"VALUE AVG\((c[\w.]+)\)", select):
+            values = [v for v in (_path_value(doc, match.group(1)) for doc in rows) if isinstance(v, (int, float))]
+            return [sum(values) / len(values)] if values else []
+        if match := re.search(r"VALUE SUM\(ARRAY_LENGTH\((c[\w.]+)\)\)", select):
+            return [sum(len(_path_value(doc, match.group(1)) or []) for doc in rows)]
+        if match := re.fullmatch(r"SELECT (c\.[\w.]+(?:, c\.[\w.]+)*)", select):
+            paths = [p.strip() for p in match.group(1).split(",")]
+            return [{p.rsplit(".", 1)[1]: _path_value(doc, p) for p in paths if _path_value(doc, p) is not None}
+                    for doc in rows]
+        # SELECT * o proyecciones con objetos: se devuelve el documento completo (superconjunto)
+        return [copy.deepcopy(doc) for doc in rows]
+
+
+class FakeItemPaged:
+    def __init__(self, container: "FakeContainer", query: FakeQuery, page_size: int, response_hook):
+        self.container = container
+        self.query = query
+        self.page_size = page_size
+        self.response_hook = response_hook
+        self.continuation_token = None
+
+    async def _pages(self):
+        await self.container.profile.call(cosmos_error, cosmos_throttled)
+        rows = self.query.run(list(self.container.items.values()))
+        for start in range(0, max(len(rows), 1), self.page_size):
+            page = rows[start:start + self.page_size]
+            self.continuation_token = str(start + self.page_size) if start + self.page_size < len(rows) else None
+            if self.response_hook:
+                self.response_hook({"x-ms-request-charge": str(2.5 + 0.05 * len(page))}, page)
+            yield page
+
+    def by_page(self, continuation_token: Optional[str] = None):
+        pager = self
+
+        class PageIterator:
+            @property
+            def continuation_token(self):
+                return pager.continuation_token
+
+            def __aiter__(self):
+                return self._iterate()
+
+            async def _iterate(self):
+                async for page in pager._pages():
+                    yield _aiter(page)
+
+        return PageIterator()
+
+    def __aiter__(self):
+        return self._items()
+
+    async def _items(self):
+        async for page in self._pages():
+            for item in page:
+                yield item
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class FakeContainer:
+    def __init__(self, name: str, profile: LatencyProfile):
+        self.id = name
+        self.profile = profile
+        self.items: Dict[str, dict] = {}
+
+    async def _call(self):
+        await self.profile.call(cosmos_error, cosmos_throttled)
+
+    def _stored(self, body: dict) -> dict:
+        stored = copy.deepcopy(body)
+        stored["_etag"] = uuid.uuid4().hex
+        stored.setdefault("_ts", int(time.time()))
+        self.items[stored["id"]] = stored
+        return copy.deepcopy(stored)
+
+    async def upsert_item(self, body: dict, **kwargs):
+        await self._call()
+        return self._stored(body)
+
+    async def create_item(self, body: dict, **kwargs):
+        await self._call()
+        if body["id"] in self.items:
+            raise CosmosResourceExistsError(status_code=409, message="Conflict")
+        return self._stored(body)
+
+    async def replace_item(self, item, body: dict, etag: Optional[str] = None, match_condition=None, **kwargs):
+        await self._call()
+        item_id = item if isinstance(item, str) else item["id"]
+        if item_id not in self.items:
+            raise CosmosResourceNotFoundError(status_code=404, message="Not found")
+        if etag is not None and self.items[item_id]["_etag"] != etag:
+            raise CosmosAccessConditionFailedError(status_code=412, message="Precondition failed")
+        return self._stored(body)
+
+    async def read_item(self, item, partition_key=None, **kwargs):
+        await self._call()
+        item_id = item if isinstance(item, str) else item["id"]
+        if item_id not in self.items:
+            raise CosmosResourceNotFoundError(status_code=404, message="Not found")
+        return copy.deepcopy(self.items[item_id])
+
+    async def delete_item(self, item, partition_key=None, **kwargs):
+        await self._call()
+        item_id = item if isinstance(item, str) else item["id"]
+        if self.items.pop(item_id, None) is None:
+            raise CosmosResourceNotFoundError(status_code=404, message="Not found")
+
+    def query_items(self, query: str, parameters: Optional[list] = None, max_item_count: int = 100,
+                    response_hook=None, **kwargs):
+        return FakeItemPaged(self, FakeQuery(query, parameters), max_item_count or 100, response_hook)
+
+
+class FakeDatabase:
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+        self.containers: Dict[str, FakeContainer] = {}
+
+    def get_container_client(self, name: str) -> FakeContainer:
+        if name not in self.containers:
+            self.containers[name] = FakeContainer(name, self.profile)
+        return self.containers[name]
+
+    async def create_container_if_not_exists(self, id: str, partition_key=None, **kwargs) -> FakeContainer:
+        return self.get_container_client(id)
+
+    async def read(self):
+        await self.profile.call(cosmos_error, cosmos_throttled)
+        return {"id": "PromptAnalysis"}
+
+
+class FakeCosmosClient:
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+        self.databases: Dict[str, FakeDatabase] = {}
+
+    def get_database_client(self, name: str) -> FakeDatabase:
+        if name not in self.databases:
+            self.databases[name] = FakeDatabase(self.profile)
+        return self.databases[name]
+
+    async def __aenter__(self):
+        return self
+
+    async def close(self):
+        pass
+
+
+# ---------- Instalación ----------
+@dataclass
+class FakeServices:
+    profiles: Dict[str, LatencyProfile]
+    content_safety: FakeContentSafetyClient
+    text_analytics: FakeTextAnalyticsClient
+    openai: FakeAsyncOpenAI
+    cosmos: FakeCosmosClient
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: profile.snapshot() for name, profile in self.profiles.items()}
+
+
+def build_profiles(overrides: Optional[Dict[str, dict]] = None, error_rate: Optional[float] = None,
+                   throttle_rate: Optional[float] = None) -> Dict[str, LatencyProfile]:
+    profiles = {}
+    for name, defaults in DEFAULT_PROFILES.items():
+        settings = {**defaults, **(overrides or {}).get(name, {})}
+        if error_rate is not None:
+            settings.setdefault("error_rate", error_rate)
+        if throttle_rate is not None:
+            settings.setdefault("throttle_rate", throttle_rate)
+        profiles[name] = LatencyProfile(**settings)
+    return profiles
+
+
+def install_fakes(profiles: Optional[Dict[str, LatencyProfile]] = None) -> FakeServices:
+    """Sustituye los clientes de azure_clients por los simulados (sin Key Vault ni red)"""
+    from backend.clients import azure_clients
+
+    profiles = profiles or build_profiles()
+    services = FakeServices(
+        profiles=profiles,
+        content_safety=FakeContentSafetyClient(profiles["content_safety"]),
+        text_analytics=FakeTextAnalyticsClient(profiles["text_analytics"]),
+        openai=FakeAsyncOpenAI(profiles["openai"]),
+        cosmos=FakeCosmosClient(profiles["cosmos"])
+    )
+    azure_clients.install(
+        content_safety=services.content_safety,
+        text_analytics=services.text_analytics,
+        openai=services.openai,
+        cosmos=services.cosmos
+    )
+    azure_clients.secrets.setdefault("AZURE-OPENAI-DEPLOYMENT-NAME", "fake-deployment")
+    return services
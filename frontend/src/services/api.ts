@@ -10,6 +10,7 @@ import type {
   CategoryMetric,
   RejectedPrompt,
   FeedbackRequest,
+  AnalysisStreamHandlers,
 } from "../types"
 
 const API_URL = "/api"
@@ -95,6 +96,85 @@ export const analyzePrompt = async (
   }
 };
 
+// Variante en streaming: entrega resultados parciales por Server-Sent Events.
+// Abortar la señal cancela la petición y las llamadas pendientes en el servidor.
+export const analyzePromptStream = async (
+  prompt: string,
+  handlers: AnalysisStreamHandlers,
+  options?: {
+    generate_variants?: boolean
+    context?: string
+    target_model?: string
+    optimization_focus?: string[]
+    signal?: AbortSignal
+  },
+): Promise<AnalysisResponse> => {
+  const requestPayload: PromptRequest = {
+    prompt,
+    generate_variants: options?.generate_variants || false,
+    context: options?.context,
+    target_model: options?.target_model,
+    optimization_focus: options?.optimization_focus
+  };
+
+  const response = await fetch(`${API_URL}/analyze-prompt/stream`, {
+    method: "POST",
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+      'X-Request-ID': uuidv4()
+    },
+    body: JSON.stringify(requestPayload),
+    signal: options?.signal
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP Error ${response.status}: ${response.statusText}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let result: AnalysisResponse | null = null;
+
+  const dispatch = (event: string, data: any) => {
+    switch (event) {
+      case "safety": handlers.onSafety?.(data); break
+      case "text_analytics": handlers.onTextAnalytics?.(data); break
+      case "ambiguity": handlers.onAmbiguity?.(data); break
+      case "improved_prompt": handlers.onImprovedPromptDelta?.(data.delta); break
+      case "improved_prompt_reset": handlers.onImprovedPromptReset?.(); break
+      case "variants": handlers.onVariants?.(data); break
+      case "result": result = data; break
+      case "error": throw new Error(`Error del servidor: ${data.error}`)
+    }
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let separator: number;
+    while ((separator = buffer.indexOf("\n\n")) >= 0) {
+      const block = buffer.slice(0, separator);
+      buffer = buffer.slice(separator + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (data) dispatch(event, JSON.parse(data));
+    }
+  }
+
+  if (!result) {
+    throw new Error("La conexión terminó sin resultado final");
+  }
+  return result;
+};
+
 export const getAuditTrail = async (analysisId: string): Promise<AuditTrail> => {
   const response = await axios.get<AuditTrail>(`${API_URL}/audit/${analysisId}`)
   return response.data
@@ -187,5 +187,18 @@ export interface PromptRequest {
   context?: string
   target_model?: string
   optimization_focus?: string[]
+  language?: string
+  speculative?: boolean
+  analysis_mode?: "split" | "fused"
 }
 
+
+// Eventos del análisis en streaming (/analyze-prompt/stream)
+export interface AnalysisStreamHandlers {
+  onSafety?: (data: { categories: Record<string, number>; rejected: boolean; error: string | null }) => void
+  onTextAnalytics?: (data: { sentiment: string; key_phrases: string[]; language: string; pii_detected: boolean }) => void
+  onAmbiguity?: (data: Record<string, unknown>) => void
+  onImprovedPromptDelta?: (delta: string) => void
+  onImprovedPromptReset?: () => void
+  onVariants?: (variants: PromptVariant[]) => void
+}
@@ -0,0 +1,30 @@
+"""Entorno sin red para las pruebas: almacén local, secretos falsos y servicios de Azure simulados"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="prompt_guardian_tests_")
+os.environ.update({
+    "STORAGE_BACKEND": "sqlite",
+    "ANALYTICS_STORE_PATH": os.path.join(_workdir, "analytics.db"),
+    "AUDIT_SPILL_PATH": os.path.join(_workdir, "audit_spill.jsonl"),
+    "SECRETS_OFFLINE": "true",
+    "SECRETS_REFRESH_INTERVAL": "0"
+})
+
+import pytest  # noqa: E402
+
+from backend.circuit_breakers import circuit_breakers  # noqa: E402
+
+
+@pytest.fixture
+def fakes():
+    """Instala los servicios simulados; recibe perfiles de latencia opcionales por servicio"""
+    from benchmarks.fakes import build_profiles, install_fakes
+
+    def install(**overrides):
+        return install_fakes(build_profiles(overrides))
+
+    for breaker in circuit_breakers.values():
+        breaker.state, breaker.failures = "closed", 0
+    return install
+
@@ -0,0 +1,14 @@
+import asyncio
+
+import httpx
+
+
+def run_with_client(scenario):
+    """Ejecuta scenario(client) contra la aplicación en proceso, sin lifespan"""
+    from backend.main import app
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
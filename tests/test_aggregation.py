@@ -0,0 +1,55 @@
+import pytest
+
+from backend.aggregation import ColumnarAggregator
+from backend.rollups import build_rollups
+
+
+def analytics_doc(day: int, index: int) -> dict:
+    return {
+        "id": f"{day}-{index}",
+        "timestamp": f"2024-05-{day:02d}T10:{index % 60:02d}:00",
+        "analysis": {
+            "safety_score": 0.1 * (index % 10),
+            "fairness_score": 0.5,
+            "inclusivity_score": index % 3,
+            "issues": [{"type": "bias", "severity": "high"}] * (index % 3)
+        },
+        "metadata": {
+            "safety": {"categories": {"Hate": index % 4, "Violence": 2}},
+            "text_analytics": {
+                "sentiment": {"scores": {"positive": 0.25, "neutral": 0.5, "negative": 0.25}},
+                "key_phrases": [f"tema {index % 2}"] if index % 5 else []
+            }
+        }
+    }
+
+
+def assert_same_rollups(columnar, expected):
+    assert columnar.keys() == expected.keys()
+    for date, rollup in expected.items():
+        assert columnar[date]["count"] == rollup["count"]
+        assert columnar[date]["issues_total"] == rollup["issues_total"]
+        assert columnar[date]["issues"] == rollup["issues"]
+        assert columnar[date]["categories"] == rollup["categories"]
+        for section in ("scores", "sentiment", "content_safety"):
+            assert columnar[date][section] == pytest.approx(rollup[section])
+
+
+def test_matches_build_rollups():
+    docs = [analytics_doc(day, index) for day in (1, 2, 3) for index in range(25)]
+    assert_same_rollups(ColumnarAggregator().add(docs).rollups(), build_rollups(docs))
+
+
+def test_accumulates_page_by_page():
+    docs = [analytics_doc(day, index) for day in (1, 2) for index in range(30)]
+    aggregator = ColumnarAggregator()
+    for start in range(0, len(docs), 7):
+        aggregator.add(docs[start:start + 7])
+    assert_same_rollups(aggregator.rollups(), build_rollups(docs))
+
+
+def test_skips_documents_without_timestamp():
+    docs = [analytics_doc(1, 1), {"id": "sin-fecha", "analysis": {}}]
+    aggregator = ColumnarAggregator().add(docs).add([])
+    assert aggregator.rollups()["2024-05-01"]["count"] == 1
+    assert ColumnarAggregator().add(docs[1:]).rollups() == {}
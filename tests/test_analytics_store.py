@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from backend.analytics_store import AnalyticsStore, LocalContainer, translate_query
+
+
+@pytest.mark.parametrize("query, sql, mode", [
+    (
+        "SELECT VALUE COUNT(1) FROM c WHERE c._ts > @threshold",
+        "SELECT COUNT(1) FROM documents WHERE container = :_container AND (json_extract(body, '$._ts') > :threshold)",
+        "value"
+    ),
+    (
+        "SELECT VALUE SUM(ARRAY_LENGTH(c.analysis.issues)) FROM c",
+        "SELECT SUM(json_array_length(json_extract(body, '$.analysis.issues'))) FROM documents "
+        "WHERE container = :_container",
+        "value"
+    ),
+    (
+        "SELECT TOP @limit * FROM c WHERE c.status = 'rejected'",
+        "SELECT body FROM documents WHERE container = :_container AND (json_extract(body, '$.status') = 'rejected') "
+        "LIMIT :limit",
+        "document"
+    ),
+    (
+        "SELECT c.id, c.metadata.text_analytics.key_phrases FROM c ORDER BY c.timestamp",
+        "SELECT json_object('id', json_extract(body, '$.id'), 'key_phrases', "
+        "json_extract(body, '$.metadata.text_analytics.key_phrases')) FROM documents WHERE container = :_container "
+        "ORDER BY json_extract(body, '$.timestamp')",
+        "object"
+    ),
+    (
+        'SELECT c.timestamp, {"score": c.analysis.safety_score} AS analysis FROM c',
+        "SELECT body FROM documents WHERE container = :_container",
+        "document"
+    )
+])
+def test_translate_query(query, sql, mode):
+    assert translate_query(query) == (sql, mode)
+
+
+def test_translate_query_normalizes_whitespace_and_rejects_other_sources():
+    assert translate_query("SELECT *\n  FROM c\n WHERE c.date >= @startDate")[0].endswith(
+        "AND (json_extract(body, '$.date') >= :startDate)"
+    )
+    with pytest.raises(ValueError):
+        translate_query("SELECT * FROM documents")
+
+
+def test_translated_queries_run_against_the_local_container():
+    store = AnalyticsStore(":memory:")
+    container = LocalContainer(store, "Pruebas", None)
+    other = LocalContainer(store, "Otro", None)
+    documents = [
+        {"id": "a", "timestamp": "2025-01-02T10:00:00", "status": "rejected", "analysis": {"issues": [{}, {}]},
+         "metadata": {"text_analytics": {"key_phrases": ["ventas"]}}},
+        {"id": "b", "timestamp": "2025-01-01T10:00:00", "status": "accepted", "analysis": {"issues": [{}]},
+         "metadata": {"text_analytics": {"key_phrases": []}}},
+        {"id": "c", "timestamp": "2025-01-03T10:00:00", "status": "rejected", "analysis": {"issues": []},
+         "metadata": {"text_analytics": {}}}
+    ]
+
+    async def query(target, text, parameters=None):
+        return [item async for item in target.query_items(query=text, parameters=parameters)]
+
+    async def scenario():
+        for document in documents:
+            await container.upsert_item(document)
+        await other.upsert_item({"id": "z", "status": "rejected"})
+        return {
+            "count": await query(container, "SELECT VALUE COUNT(1) FROM c WHERE c.status = 'rejected'"),
+            "issues": await query(container, "SELECT VALUE SUM(ARRAY_LENGTH(c.analysis.issues)) FROM c"),
+            "top": await query(container, "SELECT TOP @limit * FROM c WHERE c.status = 'rejected' ORDER BY c.timestamp",
+                               [{"name": "@limit", "value": 1}]),
+            "projection": await query(
+                container, "SELECT c.id, c.metadata.text_analytics.key_phrases FROM c WHERE c.timestamp >= @startDate "
+                           "ORDER BY c.timestamp", [{"name": "@startDate", "value": "2025-01-02"}]
+            )
+        }
+
+    results = asyncio.run(scenario())
+    store.close()
+    assert results["count"] == [2]
+    assert results["issues"] == [3]
+    assert [item["id"] for item in results["top"]] == ["a"]
+    # Las rutas ausentes no aparecen en la proyección, como en Cosmos
+    assert results["projection"] == [{"id": "a", "key_phrases": ["ventas"]}, {"id": "c"}]
@@ -0,0 +1,59 @@
+import asyncio
+
+from backend.coalescing import analysis_flights
+from tests.helpers import run_with_client
+
+PROMPT = "Resume las conclusiones de la auditoría interna de compras del último semestre"
+
+
+def test_cache_hits_have_their_own_audit_record(fakes):
+    fakes()
+
+    async def scenario(client):
+        first = (await client.post("/analyze-prompt", json={"prompt": PROMPT})).json()
+        second = (await client.post("/analyze-prompt", json={"prompt": PROMPT})).json()
+        batch = (await client.post("/analyze-prompts", json=[{"prompt": PROMPT}])).json()
+        audits = [await client.get(f"/audit/{r['analysis_id']}") for r in (first, second, *batch)]
+        return first, second, batch, audits
+
+    first, second, batch, audits = run_with_client(scenario)
+    assert len({first["analysis_id"], second["analysis_id"], batch[0]["analysis_id"]}) == 3
+    assert [audit.status_code for audit in audits] == [200, 200, 200]
+    assert audits[1].json()["analysis_id"] == second["analysis_id"]
+    assert audits[2].json()["analysis_id"] == batch[0]["analysis_id"]
+    assert len({audit.json()["prompt_hash"] for audit in audits}) == 1
+
+
+def test_coalesced_requests_have_their_own_audit_record(fakes):
+    fakes(openai={"median_ms": 300, "p95_ms": 350})
+    coalesced_before = analysis_flights.stats["coalesced"]
+    prompt = "Enumera los riesgos del plan de migración de la base de datos de clientes"
+
+    async def scenario(client):
+        responses = await asyncio.gather(*(client.post("/analyze-prompt", json={"prompt": prompt}) for _ in range(3)))
+        ids = [response.json()["analysis_id"] for response in responses]
+        audits = [await client.get(f"/audit/{analysis_id}") for analysis_id in ids]
+        return ids, audits
+
+    ids, audits = run_with_client(scenario)
+    assert analysis_flights.stats["coalesced"] - coalesced_before == 2
+    assert len(set(ids)) == 3
+    assert [audit.status_code for audit in audits] == [200, 200, 200]
+    assert [audit.json()["analysis_id"] for audit in audits] == ids
+
+
+def test_requests_with_different_deadlines_do_not_share_an_analysis(fakes):
+    fakes(openai={"median_ms": 1200, "p95_ms": 1300})
+    coalesced_before = analysis_flights.stats["coalesced"]
+    prompt = "Propón un calendario de formación en seguridad para el equipo de soporte"
+
+    async def scenario(client):
+        short = client.post("/analyze-prompt", json={"prompt": prompt, "deadline_ms": 500})
+        long = client.post("/analyze-prompt", json={"prompt": prompt, "deadline_ms": 30000})
+        return await asyncio.gather(short, long)
+
+    short, long = run_with_client(scenario)
+    assert analysis_flights.stats["coalesced"] == coalesced_before
+    assert short.status_code == 504
+    assert long.status_code == 200
+    assert long.json()["degraded"] == []
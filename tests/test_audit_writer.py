@@ -0,0 +1,32 @@
+import asyncio
+import json
+import time
+
+import backend.audit_writer as audit_writer_module
+from backend.audit_writer import AuditWriter
+
+
+class HangingContainer:
+    async def upsert_item(self, document):
+        await asyncio.sleep(3600)
+
+
+def test_stop_spills_what_cannot_be_written_within_the_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit_writer_module.cosmos_connections, "container", lambda key: HangingContainer())
+    writer = AuditWriter(batch_size=2, flush_interval=0.01, spill_path=tmp_path / "spill.jsonl")
+
+    async def scenario():
+        writer.start()
+        for i in range(5):
+            await writer.write("analytics", {"id": f"doc-{i}"})
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        await writer.stop(timeout=0.2)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(scenario())
+    assert elapsed < 2
+    assert not writer.running
+    assert writer.pending == {}
+    spilled = [json.loads(line) for line in (tmp_path / "spill.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert sorted(record["document"]["id"] for record in spilled) == [f"doc-{i}" for i in range(5)]
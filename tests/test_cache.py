@@ -0,0 +1,84 @@
+import asyncio
+
+from backend.cache import AnalysisCache, StaleWhileRevalidateCache
+
+
+class DictSharedTier:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ttl):
+        self.values[key] = value
+
+
+def test_zero_maxsize_disables_the_local_tier():
+    shared = DictSharedTier()
+    cache = AnalysisCache(maxsize=0, ttl=60, shared=shared)
+    cache.ensure_fingerprint("config")
+
+    async def scenario():
+        await cache.set("clave", {"valor": 1})
+        return await cache.get("clave"), await cache.get("otra")
+
+    assert asyncio.run(scenario()) == ({"valor": 1}, None)
+    cache.invalidate()
+    assert cache.snapshot()["size"] == 0
+    assert cache.stats["shared_hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_local_tier_serves_repeated_lookups():
+    cache = AnalysisCache(maxsize=4, ttl=60)
+    cache.ensure_fingerprint("config")
+
+    async def scenario():
+        await cache.set("clave", {"valor": 1})
+        return await cache.get("clave")
+
+    assert asyncio.run(scenario()) == {"valor": 1}
+    assert cache.stats["local_hits"] == 1
+
+
+def test_stale_while_revalidate_serves_the_old_value_during_one_refresh():
+    cache = StaleWhileRevalidateCache(ttl=0.2, max_stale=5)
+    loads = []
+
+    async def loader():
+        loads.append(len(loads))
+        await asyncio.sleep(0.05)
+        return len(loads)
+
+    async def scenario():
+        # Peticiones concurrentes sin valor comparten un único cálculo
+        first = await asyncio.gather(*(cache.get("metricas", loader) for _ in range(3)))
+        fresh = await cache.get("metricas", loader)
+        await asyncio.sleep(0.25)
+        stale = await asyncio.gather(*(cache.get("metricas", loader) for _ in range(3)))
+        await asyncio.sleep(0.1)
+        refreshed = await cache.get("metricas", loader)
+        return first, fresh, stale, refreshed
+
+    first, fresh, stale, refreshed = asyncio.run(scenario())
+    assert [value for value, _ in first] == [1, 1, 1]
+    assert fresh[0] == 1
+    assert [value for value, _ in stale] == [1, 1, 1] and all(age > 0.2 for _, age in stale)
+    assert refreshed[0] == 2
+    assert len(loads) == 2
+    assert cache.stats["misses"] == 3 and cache.stats["stale_hits"] == 3
+
+
+def test_stale_while_revalidate_recomputes_after_max_stale():
+    cache = StaleWhileRevalidateCache(ttl=0.01, max_stale=0.01)
+    values = iter([1, 2])
+
+    async def loader():
+        return next(values)
+
+    async def scenario():
+        await cache.get("clave", loader)
+        await asyncio.sleep(0.05)
+        return await cache.get("clave", loader)
+
+    assert asyncio.run(scenario()) == (2, 0.0)
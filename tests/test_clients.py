@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from backend.clients import CLIENT_SECRETS, AzureClients
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_close_closes_clients_retired_by_a_rotation():
+    clients = AzureClients()
+    retired = FakeClient()
+    clients.install(openai=retired)
+
+    async def scenario():
+        await clients.rotate(set(CLIENT_SECRETS["_openai"]))
+        pending = len(clients._closing)
+        await clients.close()
+        return pending
+
+    assert asyncio.run(scenario()) == 1
+    assert retired.closed
+    assert not clients._closing
+
+
+def test_install_rejects_unknown_clients():
+    with pytest.raises(ValueError):
+        AzureClients().install(speech=FakeClient())
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from backend.clients import AzureClients
+from backend.config import SecureConfig
+
+
+def test_load_fails_when_a_secret_has_no_value(monkeypatch):
+    monkeypatch.setenv("PRUEBA_PRESENTE", "valor")
+    monkeypatch.delenv("PRUEBA_AUSENTE", raising=False)
+    config = SecureConfig()
+    with pytest.raises(RuntimeError, match="PRUEBA-AUSENTE"):
+        asyncio.run(config.load(["PRUEBA-PRESENTE", "PRUEBA-AUSENTE"]))
+    assert config.values == {"PRUEBA-PRESENTE": "valor"}
+    assert config.stats["vault_fetches"] == 0
+
+
+def test_get_secret_cached_never_calls_key_vault(monkeypatch):
+    monkeypatch.delenv("PRUEBA_AUSENTE", raising=False)
+    config = SecureConfig()
+    with pytest.raises(KeyError):
+        config.get_secret_cached("PRUEBA-AUSENTE")
+    assert config.stats["vault_fetches"] == 0 and config._async_client is None
+
+
+
+def test_refresh_notifies_rotations_and_replaces_clients(monkeypatch):
+    monkeypatch.setenv("CONTENT_SAFETY_KEY", "clave-1")
+    monkeypatch.setenv("TEXT_ANALYTICS_KEY", "clave-ta")
+    config = SecureConfig()
+    clients = AzureClients()
+    closed = []
+
+    class Client:
+        async def close(self):
+            closed.append(self)
+
+    old_safety, text_analytics = Client(), Client()
+    clients.install(content_safety=old_safety, text_analytics=text_analytics)
+
+    async def scenario():
+        await config.load(["CONTENT-SAFETY-KEY", "TEXT-ANALYTICS-KEY"])
+        config.on_rotation(clients.rotate)
+        monkeypatch.setenv("CONTENT_SAFETY_KEY", "clave-2")
+        changed = await config.refresh()
+        # El cliente rotado se cierra tras el periodo de gracia (o al apagar); el otro sigue en uso
+        pending_close = list(closed)
+        await clients.close()
+        return changed, pending_close
+
+    changed, pending_close = asyncio.run(scenario())
+    assert changed == {"CONTENT-SAFETY-KEY"}
+    assert config.values["CONTENT-SAFETY-KEY"] == "clave-2"
+    assert pending_close == []
+    assert closed == [old_safety, text_analytics]
@@ -0,0 +1,23 @@
+from backend.circuit_breakers import circuit_breakers
+from backend.deadlines import REQUEST_DEADLINE_MIN_MS
+from tests.helpers import run_with_client
+
+
+def test_short_client_deadlines_never_open_breakers(fakes):
+    fakes(openai={"median_ms": 2000, "p95_ms": 2100})
+
+    async def scenario(client):
+        statuses = []
+        for i in range(2 * circuit_breakers["openai"].failure_threshold):
+            response = await client.post("/analyze-prompt", json={
+                "prompt": f"Resume el informe de ventas del trimestre {i} para el comité",
+                "deadline_ms": REQUEST_DEADLINE_MIN_MS
+            })
+            statuses.append(response.status_code)
+        return statuses
+
+    statuses = run_with_client(scenario)
+    assert set(statuses) == {504}
+    for name, breaker in circuit_breakers.items():
+        assert breaker.state == "closed", name
+        assert breaker.failures == 0, name
@@ -0,0 +1,30 @@
+import backend.main as main
+from backend.cache import analysis_cache
+from tests.helpers import run_with_client
+
+
+def test_batch_with_failed_ambiguity_is_degraded_and_not_cached(fakes, monkeypatch):
+    fakes()
+    complete_json = main.complete_json
+
+    async def failing_ambiguity(system_prompt, *args, **kwargs):
+        if system_prompt == main.AMBIGUITY_SYSTEM_PROMPT:
+            raise RuntimeError("ambigüedad no disponible")
+        return await complete_json(system_prompt, *args, **kwargs)
+
+    monkeypatch.setattr(main, "complete_json", failing_ambiguity)
+    cached_before = len(analysis_cache.local)
+
+    async def scenario(client):
+        response = await client.post("/analyze-prompts", json=[
+            {"prompt": "Redacta un correo de bienvenida para los nuevos empleados de logística"},
+            {"prompt": "Explica la política de vacaciones del departamento de finanzas"}
+        ])
+        return response.status_code, response.json()
+
+    status, results = run_with_client(scenario)
+    assert status == 200
+    for result in results:
+        assert result["error"] is None
+        assert result["degraded"] == ["ambiguity"]
+    assert len(analysis_cache.local) == cached_before
@@ -0,0 +1,21 @@
+from tests.helpers import run_with_client
+
+PROMPT = "Redacta un resumen ejecutivo del informe trimestral de ventas para el comité"
+
+
+def test_fused_and_split_results_are_cached_separately(fakes):
+    services = fakes()
+    openai_calls = []
+
+    async def scenario(client):
+        responses = []
+        for mode in ("split", "fused", "fused", "split"):
+            responses.append(await client.post("/analyze-prompt", json={"prompt": PROMPT, "analysis_mode": mode}))
+            openai_calls.append(services.profiles["openai"].calls)
+        return responses
+
+    responses = run_with_client(scenario)
+    assert [response.status_code for response in responses] == [200, 200, 200, 200]
+    # Una completion fusionada frente a ambigüedad + prompt mejorado en el modo dividido
+    assert openai_calls[1] - openai_calls[0] == 1
+    assert openai_calls[3] == openai_calls[2] == openai_calls[1]
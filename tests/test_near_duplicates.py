@@ -0,0 +1,22 @@
+from backend.main import PromptRequest, PromptVariant, near_duplicate_payload
+
+
+def test_near_duplicate_payload_scrubs_every_occurrence_of_the_source_pii():
+    prompt = "Escribe a ana.garcia@example.com sobre el pedido 4411"
+    # Una entidad contenida en otra no debe romper la sustitución de la mayor
+    pii = [{"text": "ana", "category": "Person", "offset": 10, "length": 3, "source": "azure"},
+           {"text": "ana.garcia@example.com", "category": "Email", "offset": 10, "length": 22, "source": "local"}]
+    variant = PromptVariant(
+        variant_text="Escribe a ana.garcia@example.com (copia a ana.garcia@example.com) sobre el pedido",
+        quality_score=0.8, clarity_score=0.8, specificity_score=0.8, explanation="Menciona a ana.garcia@example.com"
+    )
+    payload = near_duplicate_payload(
+        PromptRequest(prompt=prompt), "id-1",
+        {"ambiguous_terms": ["pedido de ana.garcia@example.com"], "missing_context": [], "clarity_score": 0.7},
+        [variant], pii
+    )
+
+    assert payload["ambiguity"]["ambiguous_terms"] == ["pedido de [Email]"]
+    assert payload["ambiguity"]["clarity_score"] == 0.7
+    assert payload["variants"][0]["variant_text"] == "Escribe a [Email] (copia a [Email]) sobre el pedido"
+    assert payload["variants"][0]["explanation"] == "Menciona a [Email]"
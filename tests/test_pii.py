@@ -0,0 +1,111 @@
+import pytest
+
+from backend.pii import (
+    PiiDetector,
+    _valid_iban,
+    _valid_spanish_id,
+    luhn_valid,
+    merge_pii,
+    pii_entity,
+    redact_spans
+)
+
+
+@pytest.mark.parametrize("digits, valid", [
+    ("4111111111111111", True),
+    ("5500005555555559", True),
+    ("79927398713", True),
+    ("4111111111111112", False),
+    ("79927398710", False)
+])
+def test_luhn_valid(digits, valid):
+    assert luhn_valid(digits) is valid
+
+
+@pytest.mark.parametrize("iban, valid", [
+    ("ES9121000418450200051332", True),
+    ("ES91 2100 0418 4502 0005 1332", True),
+    ("GB82WEST12345698765432", True),
+    ("es9121000418450200051332", True),
+    ("ES9121000418450200051333", False),
+    ("ES91210004", False)
+])
+def test_valid_iban(iban, valid):
+    assert _valid_iban(iban) is valid
+
+
+@pytest.mark.parametrize("document, valid", [
+    ("12345678Z", True),
+    ("12345678-z", True),
+    ("X1234567L", True),
+    ("Y-1234567X", True),
+    ("12345678A", False),
+    ("X1234567A", False)
+])
+def test_valid_spanish_id(document, valid):
+    assert _valid_spanish_id(document) is valid
+
+
+def test_detector_finds_structured_pii_and_rejects_bad_check_digits():
+    text = ("Escribe a ana@example.com, tarjeta 4111 1111 1111 1111, IBAN ES91 2100 0418 4502 0005 1332 "
+            "y DNI 12345678Z; la tarjeta 4111 1111 1111 1112 y el DNI 12345678A no son válidos")
+    detector = PiiDetector()
+    found = {(e["category"], e["text"]) for e in detector.detect(text)}
+    assert {("Email", "ana@example.com"), ("CreditCardNumber", "4111 1111 1111 1111"),
+            ("IBAN", "ES91 2100 0418 4502 0005 1332"), ("NationalID", "12345678Z")} <= found
+    assert not any("1112" in value or value == "12345678A" for _, value in found)
+    assert detector.stats["rejected_candidates"] >= 2
+
+
+def test_detector_skips_patterns_without_their_trigger():
+    detector = PiiDetector()
+    assert detector.detect("Resume el informe sin datos personales") == []
+
+
+def test_redact_spans_uses_offsets_and_resolves_overlaps():
+    text = "Contacta con Ana García en ana.garcia@example.com"
+    entities = [
+        pii_entity("Ana García", "Person", 13, "azure"),
+        pii_entity("ana.garcia@example.com", "Email", 27, "local"),
+        pii_entity("ana", "Person", 27, "azure")
+    ]
+    assert redact_spans(text, entities) == "Contacta con [Person] en [Email]"
+
+
+def test_redact_spans_locates_entities_without_valid_offsets():
+    text = "Llama al 600123456 o al 600123456 mañana"
+    entities = [{"text": "600123456", "category": "PhoneNumber", "offset": 0, "length": 9}]
+    assert redact_spans(text, entities) == "Llama al [PhoneNumber] o al [PhoneNumber] mañana"
+    assert redact_spans(text, []) == text
+
+
+def test_merge_pii_prefers_the_longer_span():
+    text = "Mi correo es ana@example.com"
+    local = [pii_entity("ana@example.com", "Email", 13, "local")]
+    remote = [{"text": "ana", "category": "Person"}]
+    assert [e["category"] for e in merge_pii(text, local, remote)] == ["Email"]
+
+
+@pytest.mark.parametrize("text", [
+    "Compara las ventas de 2021 2022 2023 por región",
+    "La factura 123456789 sigue pendiente",
+    "El total fue 1.234.567.890 euros",
+    "Actualiza a la version 1.2.3.4 antes del lunes",
+    "Prueba con v1.2.3.4 y con Versión: 10.0.0.1"
+])
+def test_detector_ignores_numbers_that_are_not_pii(text):
+    assert PiiDetector().detect(text) == []
+
+
+@pytest.mark.parametrize("text, phone", [
+    ("Llama al +34 600 123 456 mañana", "+34 600 123 456"),
+    ("Oficina (91) 123 45 67", "(91) 123 45 67"),
+    ("Móvil 600-123-456", "600-123-456")
+])
+def test_detector_finds_structured_phone_numbers(text, phone):
+    assert [(e["category"], e["text"]) for e in PiiDetector().detect(text)] == [("PhoneNumber", phone)]
+
+
+def test_detector_finds_ip_addresses_outside_version_strings():
+    found = PiiDetector().detect("El servidor 192.168.1.10 responde; la IP 10.0.0.1 no")
+    assert [e["text"] for e in found if e["category"] == "IPAddress"] == ["192.168.1.10", "10.0.0.1"]
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.rate_limits import AdaptiveConcurrencyLimiter, OpenAIRateLimiter, RateLimitExceeded
+from tests.helpers import run_with_client
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after_ms: str):
+        super().__init__("429")
+        self.status_code = 429
+        self.response = SimpleNamespace(headers={"retry-after-ms": retry_after_ms})
+
+
+def test_released_slot_goes_to_the_first_waiter():
+    limiter = AdaptiveConcurrencyLimiter("prueba", max_limit=1)
+    order = []
+
+    async def call(name, hold):
+        async with limiter.slot():
+            order.append(name)
+            await hold
+
+    async def scenario():
+        release = asyncio.get_running_loop().create_future()
+        first = asyncio.create_task(call("primero", release))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(call("en cola", asyncio.sleep(0)))
+        await asyncio.sleep(0)
+        # Quien llega justo al liberarse el hueco no se adelanta al que ya esperaba
+        release.set_result(None)
+        await first
+        await call("recién llegado", asyncio.sleep(0))
+        await queued
+
+    asyncio.run(scenario())
+    assert order == ["primero", "en cola", "recién llegado"]
+    assert limiter.in_flight == 0
+
+
+def test_throttle_with_retry_after_pauses_the_dependency():
+    limiter = AdaptiveConcurrencyLimiter("prueba", max_limit=4)
+
+    async def scenario():
+        with pytest.raises(Throttled):
+            async with limiter.slot():
+                raise Throttled("300")
+        started = time.perf_counter()
+        async with limiter.slot():
+            pass
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) >= 0.25
+    assert limiter.stats["throttled"] == 1 and int(limiter.limit) == 2
+
+
+def test_token_waiters_are_served_in_arrival_order():
+    limiter = OpenAIRateLimiter(tpm=600, rpm=0, max_wait=5)
+    limiter.tokens.tokens = 0.0
+    served = []
+
+    async def acquire(name, tokens):
+        await limiter.acquire(tokens)
+        served.append((name, limiter.tokens.tokens))
+
+    async def scenario():
+        large = asyncio.create_task(acquire("grande", 5))
+        await asyncio.sleep(0)
+        # Con 10 tokens por segundo la pequeña cabría antes, pero llegó después
+        await asyncio.gather(large, acquire("pequeña", 1))
+
+    asyncio.run(scenario())
+    assert [name for name, _ in served] == ["grande", "pequeña"]
+    assert min(balance for _, balance in served) > -0.01
+
+
+def test_openai_retry_after_is_returned_to_the_client(fakes, monkeypatch):
+    fakes()
+    limiter = OpenAIRateLimiter(max_wait=0.5)
+    monkeypatch.setattr("backend.main.openai_limiter", limiter)
+
+    async def scenario(client):
+        limiter.on_throttle(8)
+        return await client.post("/analyze-prompt", json={
+            "prompt": "Escribe un correo de bienvenida para los nuevos clientes del servicio premium"
+        })
+
+    response = run_with_client(scenario)
+    assert response.status_code == 503
+    assert 7 <= int(response.headers["retry-after"]) <= 8
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(limiter.acquire(10))
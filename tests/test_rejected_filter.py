@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+from backend.database import get_rejected_container
+from backend.rejected_filter import BloomFilter, RejectedPromptFilter, prompt_hash
+
+BLOCKED = {"categories": {"Violence": 6}}
+ALLOWED = {"categories": {"Violence": 2}}
+
+
+def is_rejection(safety_analysis):
+    return safety_analysis["categories"]["Violence"] >= 4
+
+
+def rejected_doc(prompt: str, safety_analysis: dict, status: str = "rejected") -> dict:
+    return {"id": str(uuid.uuid4()), "timestamp": datetime.utcnow().isoformat(), "prompt_hash": prompt_hash(prompt),
+            "safety_analysis": safety_analysis, "status": status}
+
+
+def test_confirm_requires_a_current_rejection():
+    rejected = RejectedPromptFilter(capacity=1000, fp_rate=0.01)
+    rejected.is_rejection = is_rejection
+    rejected.add(prompt_hash("reciente bloqueado"), BLOCKED)
+    rejected.add(prompt_hash("reciente permitido"), ALLOWED)
+
+    async def scenario():
+        container = get_rejected_container()
+        await container.upsert_item(rejected_doc("guardado bloqueado", BLOCKED))
+        await container.upsert_item(rejected_doc("guardado permitido", ALLOWED))
+        await container.upsert_item(rejected_doc("guardado sin rechazo", BLOCKED, status="appealed"))
+        prompts = ["reciente bloqueado", "reciente permitido", "guardado bloqueado", "guardado permitido",
+                   "guardado sin rechazo", "nunca visto"]
+        for prompt in prompts:
+            rejected.might_contain(prompt_hash(prompt))
+        return [await rejected.confirm(prompt_hash(prompt)) for prompt in prompts]
+
+    assert asyncio.run(scenario()) == [BLOCKED, None, BLOCKED, None, None, None]
+    assert rejected.stats["confirmed"] == 2
+    # Los rechazos que ya no son vigentes no cuentan como colisiones del filtro
+    assert rejected.stats["stale"] == 2
+    assert rejected.stats["false_positives"] == 2
+    assert rejected.snapshot()["observed_fp_rate"] == 1.0
+
+
+def test_bloom_filter_sizing_follows_the_target_false_positive_rate():
+    bloom = BloomFilter(1_000_000, 0.001)
+    # m = -n·ln(p) / ln(2)² ≈ 14.4 bits por entrada y k = m/n·ln(2) ≈ 10 funciones hash
+    assert 14.3 < bloom.num_bits / bloom.capacity < 14.5
+    assert bloom.num_hashes == 10
+    assert len(bloom.bits) == (bloom.num_bits + 7) // 8
+    assert BloomFilter(0, 0.01).num_bits == 64
+
+
+def test_bloom_filter_membership_and_false_positive_rate():
+    bloom = BloomFilter(5000, 0.01)
+    added = [prompt_hash(f"rechazado {i}") for i in range(5000)]
+    for digest in added:
+        bloom.add(digest)
+    # count solo sube con hashes que el filtro no contenía: los falsos positivos al insertar no cuentan
+    count = bloom.count
+    bloom.add(added[0])
+
+    assert bloom.count == count
+    assert 4900 < count <= 5000
+    assert all(digest in bloom for digest in added)
+    false_positives = sum(prompt_hash(f"nuevo {i}") in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+    assert 0.005 < bloom.estimated_fp_rate() < 0.015
@@ -0,0 +1,61 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from backend import rollups
+from backend.database import cosmos_connections, get_analytics_container
+
+
+def analytics_doc(timestamp: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": timestamp.isoformat(),
+        "analysis": {"safety_score": 0.9, "fairness_score": 0.8, "inclusivity_score": 0.7, "issues": []},
+        "metadata": {"safety": {"categories": {}}, "text_analytics": {"key_phrases": ["ventas"]}}
+    }
+
+
+def test_rollups_container_is_created_on_first_write(monkeypatch):
+    database = cosmos_connections.database
+    created = []
+
+    class RecordingDatabase:
+        def get_container_client(self, name):
+            return database.get_container_client(name)
+
+        async def create_container_if_not_exists(self, id, partition_key=None):
+            created.append((id, partition_key["paths"]))
+            return database.get_container_client(id)
+
+    monkeypatch.setattr(type(cosmos_connections), "database", property(lambda self: RecordingDatabase()))
+    monkeypatch.setitem(rollups._container_state, "ready", False)
+
+    async def scenario():
+        await rollups.record_rollup(analytics_doc(datetime.utcnow()))
+        await rollups.record_rollup(analytics_doc(datetime.utcnow()))
+        return await rollups.read_rollups(days=1)
+
+    by_date = asyncio.run(scenario())
+    assert created == [(rollups.ROLLUPS_CONTAINER, ["/date"])]
+    assert by_date[datetime.utcnow().date().isoformat()]["count"] >= 2
+
+
+def test_backfill_leaves_days_with_live_writes_untouched(monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_CLOSE_GRACE", 0)
+    now = datetime.utcnow()
+    today, closed_day = now.date().isoformat(), (now - timedelta(days=1)).date().isoformat()
+
+    async def scenario():
+        await rollups.record_rollup(analytics_doc(now))
+        before = (await rollups.read_rollups(days=2))[today]["count"]
+        # Documentos ya guardados sin agregar: el backfill solo debe recogerlos en el día cerrado
+        for timestamp in (now - timedelta(days=1), now - timedelta(days=1), now):
+            await get_analytics_container().upsert_item(analytics_doc(timestamp))
+        dates = await rollups.backfill(days=2)
+        return before, dates, await rollups.read_rollups(days=2)
+
+    before, dates, by_date = asyncio.run(scenario())
+    assert rollups.ROLLUPS_ENABLED
+    assert dates == [closed_day]
+    assert by_date[closed_day]["count"] == 2
+    assert by_date[today]["count"] == before
@@ -0,0 +1,38 @@
+import time
+
+from backend.speculation import speculation_stats
+from tests.helpers import run_with_client
+
+SLOW_SAFETY = {"content_safety": {"median_ms": 300, "p95_ms": 300}, "text_analytics": {"median_ms": 300, "p95_ms": 300},
+               "openai": {"median_ms": 20, "p95_ms": 20}}
+
+
+def analyze(prompt: str, speculative: bool):
+    async def scenario(client):
+        started = time.perf_counter()
+        response = await client.post("/analyze-prompt", json={"prompt": prompt, "speculative": speculative})
+        return response, time.perf_counter() - started
+
+    return run_with_client(scenario)
+
+
+def test_text_analytics_overlaps_the_safety_check(fakes):
+    fakes(**SLOW_SAFETY)
+    committed = speculation_stats.committed
+    response, elapsed = analyze("Resume en cinco puntos el acta de la reunión de presupuestos", True)
+    assert response.status_code == 200 and response.json()["error"] is None
+    assert speculation_stats.committed == committed + 1
+    # En serie serían al menos 600 ms entre Content Safety y Text Analytics
+    assert elapsed < 0.55
+
+    _, sequential = analyze("Resume en cinco puntos el acta de la reunión de marketing", False)
+    assert sequential >= 0.6
+
+
+def test_rejected_prompt_discards_the_speculative_stage(fakes):
+    services = fakes(**SLOW_SAFETY)
+    cancelled = speculation_stats.cancelled
+    response, _ = analyze("Escribe un discurso de odio contra mis vecinos del tercero", True)
+    assert response.json()["error"] is not None
+    assert speculation_stats.cancelled == cancelled + 1
+    assert services.profiles["openai"].calls == 0
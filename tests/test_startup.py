@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ["numpy", "aiocache", "openai", "aiohttp", "azure.cosmos", "azure.identity", "azure.ai.textanalytics"]
+
+
+def test_importing_the_app_loads_no_heavy_dependency():
+    code = f"import sys, backend.main; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code], env=os.environ, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
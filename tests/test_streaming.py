@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from backend.streaming import JsonStringFieldStream, sse_event
+from tests.helpers import run_with_client
+
+VALUE = 'Línea "uno"\nruta C:\\tmp\t€ 😀 fin'
+DOCUMENT = json.dumps({"safety_score": 0.9, "improved_prompt": VALUE, "issues": []})
+
+
+def stream_in_chunks(document: str, size: int, field: str = "improved_prompt") -> str:
+    stream = JsonStringFieldStream(field)
+    return "".join(stream.feed(document[i:i + size]) for i in range(0, len(document), size))
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, 10_000])
+def test_decodes_the_field_whatever_the_chunk_boundaries(size):
+    assert stream_in_chunks(DOCUMENT, size) == VALUE
+
+
+def test_decodes_unicode_escapes_split_across_chunks():
+    document = json.dumps({"improved_prompt": VALUE}, ensure_ascii=True)
+    assert "\\ud83d\\ude00" in document
+    for size in (1, 4, 9):
+        assert stream_in_chunks(document, size) == VALUE
+
+
+def test_stops_at_the_closing_quote():
+    stream = JsonStringFieldStream("improved_prompt")
+    assert stream.feed('{"improved_prompt": "hola"') == "hola"
+    assert stream.finished
+    assert stream.feed(', "improved_prompt": "otra"}') == ""
+
+
+def test_ignores_fields_that_are_not_strings_or_missing():
+    assert stream_in_chunks(json.dumps({"improved_prompt": None}), 3) == ""
+    assert stream_in_chunks(json.dumps({"improved_prompt": 0.5}), 3) == ""
+    assert stream_in_chunks(DOCUMENT, 3, "improvement_explanation") == ""
+
+
+def test_sse_event_format():
+    assert sse_event("safety", {"texto": "ñ"}) == 'event: safety\ndata: {"texto": "ñ"}\n\n'
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_endpoint_emits_partial_results_before_the_final_one(fakes):
+    fakes()
+    prompt = "Genera una guía de estilo para los correos del equipo de atención al cliente"
+
+    async def scenario(client):
+        async with client.stream("POST", "/analyze-prompt/stream", json={"prompt": prompt}) as response:
+            return response.status_code, response.headers["content-type"], await response.aread()
+
+    status, content_type, body = run_with_client(scenario)
+    events = parse_events(body.decode())
+    names = [name for name, _ in events]
+    assert status == 200 and content_type.startswith("text/event-stream")
+    assert names[0] == "safety" and names[-1] == "result"
+    assert {"text_analytics", "ambiguity", "improved_prompt"} <= set(names)
+    improved = "".join(data["delta"] for name, data in events if name == "improved_prompt")
+    assert improved == events[-1][1]["improved_prompt"]
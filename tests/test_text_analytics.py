@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+from backend import text_analytics
+from backend.deadlines import degradation_scope
+
+
+class ActionsClient:
+    """Operación multi-acción en la que la acción de sentimiento falla para todos los documentos"""
+
+    async def begin_analyze_actions(self, documents, actions):
+        async def result():
+            for doc in documents:
+                yield [
+                    SimpleNamespace(is_error=False, entities=[]),
+                    SimpleNamespace(is_error=True, error="InternalServerError"),
+                    SimpleNamespace(is_error=False, key_phrases=[f"documento {doc['id']}"])
+                ][-len(actions):]
+
+        async def poller_result():
+            return result()
+
+        return SimpleNamespace(result=poller_result)
+
+
+def test_actions_mode_degrades_optional_actions_instead_of_failing(monkeypatch):
+    monkeypatch.setattr(text_analytics, "TEXT_ANALYTICS_MODE", "actions")
+
+    async def scenario():
+        with degradation_scope() as degraded:
+            results = await text_analytics.analyze_text_features_batch(
+                ActionsClient(), ["Primer texto de prueba", "Segundo texto de prueba"], ["es", "es"]
+            )
+        return results, degraded
+
+    results, degraded = asyncio.run(scenario())
+    assert degraded == ["opinion_mining"]
+    assert [r["key_phrases"] for r in results] == [["documento 0"], ["documento 1"]]
+    assert all(r["sentiment"] == {"label": "neutral", "scores": {}} for r in results)